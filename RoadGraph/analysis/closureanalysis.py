@@ -4,6 +4,7 @@ from shapely.geometry import Point
 import os
 from RoadGraph import StdRoadGraph
 from RoadGraph.util import create_file_path
+from RoadGraph.storage.gdfstorage import SHAPEFILE, get_storage, find_gdf, read_gdf
 from RoadGraph.constants.StdColNames import *
 from RoadGraph.constants.StdKeyWords import *
 from RoadGraph.analysis import vulnerabilityanalyser as va
@@ -20,7 +21,7 @@ JUNCTION = 'Junctions'
 
 
 def generate_road_closures(road_graph: StdRoadGraph, junctions_data: gpd.GeoDataFrame,
-                           closure_data: pd.DataFrame, out_path: str = None) -> dict:
+                           closure_data: pd.DataFrame, out_path: str = None, storage=SHAPEFILE) -> dict:
     """
     Generates a dictionary of edges and nodes to be closed based on each closure.
 
@@ -28,6 +29,8 @@ def generate_road_closures(road_graph: StdRoadGraph, junctions_data: gpd.GeoData
     :param junctions_data: Geo-Data Frame of points representing known junctions
     :param closure_data: Dataframe of closure data, generally indicating the road in which the closure is proposed
     to occur, and a description of the closure
+    :param out_path: Optional path in which to save the closures
+    :param storage: Storage backend of the saved edges and nodes of each closure (see GdfStorage)
     :return: A dictionary with the following:
         {<Closure number>:
                             {'road_id' : <road id of road to be closed>,
@@ -48,7 +51,7 @@ def generate_road_closures(road_graph: StdRoadGraph, junctions_data: gpd.GeoData
 
     if out_path:
         _convert_closures_to_csv(closure_dict, out_path)
-        _convert_closures_to_shp(road_graph, closure_dict, out_path)
+        _convert_closures_to_shp(road_graph, closure_dict, out_path, storage)
 
     return closure_dict
 
@@ -73,7 +76,7 @@ def journey_time_impact_closure_shp_path(road_graph: StdRoadGraph, key_sites: gp
     # Deduce node pairs corresponding to the proposed closure of the edges.
     all_node_pairs = []
     for shp_path in shp_full_paths_in:
-        edges_gdf = gpd.read_file(f'{shp_path}/edges.shp')
+        edges_gdf = read_gdf(find_gdf(shp_path, 'edges'), columns=[STD_INDEX, STD_ROAD_TYPE])
         node_pairs = _extract_node_pairs_from_edges_shp(road_graph.edges, edges_gdf)
         all_node_pairs.extend(node_pairs)
 
@@ -154,7 +157,7 @@ def merge_road_closure_shp_into_single_shp(closure_shp_path: str):
 
     merged_gdf = gpd.GeoDataFrame()
     for shp_path in shp_full_paths_in:
-        edges_gdf = gpd.read_file(f"{shp_path}/edges.shp")
+        edges_gdf = read_gdf(find_gdf(shp_path, 'edges'))
         merged_gdf = gpd.GeoDataFrame(pd.concat([merged_gdf, edges_gdf]))
     merged_gdf.crs = {'init': 'epsg:27700'}
     merged_gdf.to_file(f"{closure_shp_path}/full_closures.shp")
@@ -210,13 +213,15 @@ def _convert_closures_to_csv(closure_dict: dict, out_path: str):
     df.to_csv(f"{out_path}/closure_data.csv")
 
 
-def _convert_closures_to_shp(roadGraph: StdRoadGraph, closure_dict: dict, out_path: str):
+def _convert_closures_to_shp(roadGraph: StdRoadGraph, closure_dict: dict, out_path: str, storage=SHAPEFILE):
     """
     Saves proposed closure of edges and nodes to a series of shapefiles.
     :param roadGraph: Road graph representative of the UK road network
     :param closure_dict: Data structure containing proposed road closures
     :param out_path: Path in which to save the shapefiles to.
+    :param storage: Storage backend of the saved files, shapefiles by default
     """
+    storage = get_storage(storage)
     for closure in closure_dict:
         node_pairs = closure_dict[closure]['node_pairs']
         edge_ind = closure_dict[closure]['edge_indices']
@@ -228,8 +233,8 @@ def _convert_closures_to_shp(roadGraph: StdRoadGraph, closure_dict: dict, out_pa
             sel_edges_gdf = roadGraph.edges.loc[roadGraph.edges[STD_INDEX].isin(edge_ind)]
             sel_nodes_gdf = roadGraph.nodes.loc[roadGraph.nodes[STD_NODE_ID].isin(node_set)]
 
-            sel_edges_gdf.to_file(f'{path}/edges.shp')
-            sel_nodes_gdf.to_file(f'{path}/nodes.shp')
+            storage.write(sel_edges_gdf, storage.file_path(path, 'edges'))
+            storage.write(sel_nodes_gdf, storage.file_path(path, 'nodes'))
 
 
 def _assign_proposed_graph_closures(G: netx.DiGraph, road_ids: list, closure_descriptions: list, real_junctions: list,
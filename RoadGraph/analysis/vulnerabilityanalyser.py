@@ -1,6 +1,8 @@
 from shapely.geometry import Point, Polygon
 from RoadGraph.util import extract_list_of_coords_from_geom_object, create_file_path
 from RoadGraph import StdRoadGraph
+from RoadGraph.stdroadgraph import CRP
+from RoadGraph.routing import ParallelRouter, ShortestPathTree, RoutePath, DynamicShortestPathTree
 from RoadGraph.constants.StdColNames import *
 from RoadGraph.constants.StdKeyWords import *
 import geopandas as gpd
@@ -24,14 +26,29 @@ class VulnerabilityAnalyser:
     """
     Class provides vulnerability analysis functionality for a road graph.
 
+    Shortest paths are found using the customizable route planning overlay ('crp') by default, which only needs the
+    cells containing closed roads to be re-customized whenever road closures are set or removed. Any other algorithm
+    accepted by StdRoadGraph.shortest_path_between_nodes can be specified instead. Analyses across all key sites
+    can be spread over a number of worker processes through processes.
+
+    The analyses repeatedly route from the same nearest nodes under the same closures, and so benefit from the road
+    graph's shortest path tree cache. The road graph is left as it is by default: either enable its cache beforehand
+    through StdRoadGraph.enable_tree_cache, or pass tree_cache_bytes to have it enabled within that memory budget (if
+    it is not already).
     """
-    def __init__(self, road_graph: StdRoadGraph, is_time_weighted=True, base_speed_limit_kph=STD_SPEED_BUILT_UP):
+    def __init__(self, road_graph: StdRoadGraph, is_time_weighted=True, base_speed_limit_kph=STD_SPEED_BUILT_UP,
+                 algorithm: str = CRP, processes: int = 1, tree_cache_bytes: int = None):
         self.kph_to_mps_factor = 1000.0 / 3600.0
         self.base_speed_limit = base_speed_limit_kph * self.kph_to_mps_factor
         self.is_time_weighted = is_time_weighted
         self.graph = road_graph
+        self.algorithm = algorithm
+        self.processes = processes
         self.NULL_VAL = 5.0
 
+        if tree_cache_bytes and road_graph.tree_cache is None:
+            road_graph.enable_tree_cache(max_bytes=tree_cache_bytes)
+
     def srn_vulnerability_two_sites_grid(self, key_sites: gpd.GeoDataFrame, key_sites_col: str,
                                          source_site, target_site, dimension_km: float = 1.0,
                                          cutoff: int = 10, out_path: str = None) -> dict:
@@ -68,7 +85,8 @@ class VulnerabilityAnalyser:
         default_t_coord = self.graph.nodes.loc[self.graph.nodes[STD_NODE_ID] == default_t_node, STD_GEOMETRY].values[0]
 
         shortest_path_nodes, shortest_time_base, base_edges_gdf, base_nodes_gdf = \
-            self.graph.shortest_path_between_nodes(default_s_node, default_t_node, get_gdfs=True)
+            self.graph.shortest_path_between_nodes(default_s_node, default_t_node, get_gdfs=True,
+                                                   algorithm=self.algorithm)
 
         # Insert additional time to reach sites from/to nearest nodes.
         time_from_source = self._estimate_weight(source_coord, default_s_coord)
@@ -86,12 +104,18 @@ class VulnerabilityAnalyser:
         res_dict['grid'] = grid
         curr_edges_gdf = base_edges_gdf
         curr_nodes_gdf = base_nodes_gdf
+        # GeoDataFrames of the most critical path are only built once per anchor, rather than on every improvement
+        curr_route = None
+        # Shortest path tree of the default source node, repaired for the closures of each candidate
+        dynamic_tree = None
         count = 0
 
         while True:
             # Keep track if the nearest nodes have changed
             cur_s_node = default_s_node
             cur_t_node = default_t_node
+            if dynamic_tree is None or dynamic_tree.tree.source_node != default_s_node:
+                dynamic_tree = self.graph.dynamic_shortest_path_tree(default_s_node)
             que = []
             # Add sets of indices
 
@@ -117,7 +141,7 @@ class VulnerabilityAnalyser:
                 self.deactivate_edges_between_nodes(nodes)
                 time = np.inf
                 while time == np.inf:
-                    path, time = self.graph.shortest_path_between_nodes(que_s_node, que_t_node)
+                    path, time = self._closure_shortest_path(dynamic_tree, que_s_node, que_t_node)
                     if time == np.inf:
                         inf_node = self._find_inf_node(path)
                         inf_point = \
@@ -144,7 +168,7 @@ class VulnerabilityAnalyser:
                 if res <= res_list[-1]:
                     res_list[-1] = res
                     anchor = grids
-                    curr_edges_gdf, curr_nodes_gdf = self.graph.convert_path_to_gdfs(path)
+                    curr_route = RoutePath(self.graph, path, time)
                     cur_s_node = que_s_node
                     cur_t_node = que_t_node
 
@@ -152,6 +176,8 @@ class VulnerabilityAnalyser:
                 sel_grids += [node_to_grid[node] for node in sel_nodes if node_to_grid[node] not in sel_grids]
 
             sel_grids = list(set(sel_grids))
+            if curr_route is not None:
+                curr_edges_gdf, curr_nodes_gdf = curr_route.edges_gdf, curr_route.nodes_gdf
             res_dict[tuple(anchor)] = [res_list[-1], curr_edges_gdf, curr_nodes_gdf]
             if count >= cutoff:
                 break
@@ -212,7 +238,8 @@ class VulnerabilityAnalyser:
         default_t_coord = self.graph.nodes.loc[self.graph.nodes[STD_NODE_ID] == default_t_node, STD_GEOMETRY].values[0]
 
         shortest_path_nodes, shortest_time_base, base_edges_gdf, base_nodes_gdf = \
-            self.graph.shortest_path_between_nodes(default_s_node, default_t_node, get_gdfs=True)
+            self.graph.shortest_path_between_nodes(default_s_node, default_t_node, get_gdfs=True,
+                                                   algorithm=self.algorithm)
 
         # Insert additional time to reach sites from/to nearest nodes.
         time_from_source = self._estimate_weight(source_coord, default_s_coord)
@@ -227,12 +254,18 @@ class VulnerabilityAnalyser:
         res_dict['no_nodes'] = [1., base_edges_gdf, base_nodes_gdf]
         curr_edges_gdf = base_edges_gdf
         curr_nodes_gdf = base_nodes_gdf
+        # GeoDataFrames of the most critical path are only built once per anchor, rather than on every improvement
+        curr_route = None
+        # Shortest path tree of the default source node, repaired for the closures of each candidate
+        dynamic_tree = None
         count = 0
 
         while True:
             # Keep track if the nearest nodes have changed
             cur_s_node = default_s_node
             cur_t_node = default_t_node
+            if dynamic_tree is None or dynamic_tree.tree.source_node != default_s_node:
+                dynamic_tree = self.graph.dynamic_shortest_path_tree(default_s_node)
             que = []
             # Add sets of indices
             for node in sel_nodes:
@@ -255,7 +288,7 @@ class VulnerabilityAnalyser:
                 self.deactivate_edges_between_nodes(nodes, only_srn=True)
                 time = np.inf
                 while time == np.inf:
-                    path, time = self.graph.shortest_path_between_nodes(que_s_node, que_t_node)
+                    path, time = self._closure_shortest_path(dynamic_tree, que_s_node, que_t_node)
                     if time == np.inf:
                         inf_node = self._find_inf_node(path)
                         inf_point = \
@@ -280,12 +313,14 @@ class VulnerabilityAnalyser:
                 if res <= res_list[-1]:
                     res_list[-1] = res
                     anchor = nodes
-                    curr_edges_gdf, curr_nodes_gdf = self.graph.convert_path_to_gdfs(path)
+                    curr_route = RoutePath(self.graph, path, time)
                     cur_s_node = que_s_node
                     cur_t_node = que_t_node
 
                 self._filter_nodes_to_srn_nodes(sel_nodes, path)
 
+            if curr_route is not None:
+                curr_edges_gdf, curr_nodes_gdf = curr_route.edges_gdf, curr_route.nodes_gdf
             res_dict[tuple(anchor)] = [res_list[-1], curr_edges_gdf, curr_nodes_gdf]
             if count >= cutoff:
                 break
@@ -455,6 +490,7 @@ class VulnerabilityAnalyser:
         site_names = key_sites[key_site_col].tolist()
         resilience_matrix = np.zeros((len(site_names), len(site_names)), dtype=float)
         resilience_dict = self._initialise_res_dict()
+        delayed_trees = self._delayed_shortest_path_trees(key_sites, key_site_col, spb_matrix, closure_nodes)
 
         for row in range(len(resilience_matrix)):
             print(f"row {row}")
@@ -475,7 +511,13 @@ class VulnerabilityAnalyser:
 
                     # Repeat journey time calculations until we recieve a shortest time that is not infinite
                     while shortest_time == np.inf:
-                        shortest_path, shortest_time = self.graph.shortest_path_between_nodes(source_node, target_node)
+                        if (source_node, target_node) in delayed_trees:
+                            shortest_path = delayed_trees[(source_node, target_node)].path_to(target_node)
+                            shortest_time = delayed_trees[(source_node, target_node)].distance_to(target_node)
+                        else:
+                            shortest_path, shortest_time = \
+                                self.graph.shortest_path_between_nodes(source_node, target_node,
+                                                                       algorithm=self.algorithm)
                         if shortest_time == np.inf:
                             # Choose new nearest node for one of the sites such that the shortest time is not longer
                             # infiinite
@@ -521,6 +563,49 @@ class VulnerabilityAnalyser:
 
         return resilience_matrix, resilience_dict
 
+    def _delayed_shortest_path_trees(self, key_sites: gpd.GeoDataFrame, key_site_col: str, spb_matrix: list,
+                                     closure_nodes: list) -> dict:
+        """
+        Precomputes, under the current road closures, the shortest path trees from each site's nearest node that
+        cover the nearest nodes of every site whose original shortest path passes through the closures.
+        :param key_sites: Geo Dataframe of key sites
+        :param key_site_col: Column name of key sites
+        :param spb_matrix: Matrix of the original shortest paths between every pair of sites
+        :param closure_nodes: List of nodes affected by the closures
+        :return: Dictionary of shortest path trees keyed by (source node, target node), only returned if processes is
+        greater than 1
+        """
+        if self.processes is None or self.processes <= 1:
+            return {}
+
+        site_nodes = [key_sites.loc[key_sites[key_site_col] == site_name][NEAREST_NODE].values[0]
+                      for site_name in key_sites[key_site_col].tolist()]
+        closure_nodes = set(closure_nodes)
+        targets = {}
+        for row, source_node in enumerate(site_nodes):
+            for col, target_node in enumerate(site_nodes):
+                if col != row and any(item in closure_nodes for item in spb_matrix[row][col]):
+                    targets.setdefault(source_node, []).append(target_node)
+
+        if not targets:
+            return {}
+
+        csr = self.graph.csr
+        sources = list(targets)
+        with ParallelRouter(csr, self.processes) as router:
+            results = router.one_to_many([csr.node_index[node] for node in sources],
+                                         [[csr.node_index[node] for node in targets[source]] for source in sources],
+                                         self.graph.closures)
+
+        trees = {}
+        for source_node, (target_dist, path_pred) in zip(sources, results):
+            target_indices = [csr.node_index[node] for node in targets[source_node]]
+            tree = ShortestPathTree(csr, csr.node_index[source_node], dict(zip(target_indices, target_dist)),
+                                    path_pred)
+            for target_node in targets[source_node]:
+                trees[(source_node, target_node)] = tree
+        return trees
+
     def _update_res_dict(self, col: int, perc_inc: float, resilience: float, resilience_dict: dict, row: int,
                          shortest_path: list, shortest_time: float, source_depot: str, spb_matrix: list,
                          stb_matrix: np.ndarray, target_depot: str):
@@ -550,6 +635,25 @@ class VulnerabilityAnalyser:
                            }
         return resilience_dict
 
+    def _closure_shortest_path(self, dynamic_tree: DynamicShortestPathTree, source_node: str,
+                               target_node: str) -> (list, float):
+        """
+        Finds the shortest path under the current road closures, by repairing the tree of the default source node
+        where possible. Journeys blocked by the closures are left to shortest_path_between_nodes, which is relied
+        upon to return the path through the closed road.
+        :param dynamic_tree: Repairable shortest path tree of the default source node
+        :param source_node: Name of source node
+        :param target_node: Name of target node
+        :return: shortest path (list) and shortest time (float)
+        """
+        if source_node == dynamic_tree.tree.source_node:
+            tree = dynamic_tree.repair(self.graph.closures.flags)
+            time = tree.distance_to(target_node)
+            if time != np.inf:
+                return tree.path_to(target_node), time
+
+        return self.graph.shortest_path_between_nodes(source_node, target_node, algorithm=self.algorithm)
+
     def _find_inf_node(self, current_shortest_path: list) -> str:
         """
         Finds the node with the edge in the shortest path with inf weight
@@ -560,7 +664,7 @@ class VulnerabilityAnalyser:
             from_node = current_shortest_path[i]
             to_node = current_shortest_path[i + 1]
 
-            if self.graph.net[from_node][to_node][STD_Nx_WEIGHT] == np.inf:
+            if self.graph.is_road_closed(from_node, to_node):
                 return from_node
 
     def _reset_nearest_nodes(self, key_sites: gpd.GeoDataFrame, key_col_name: str, nearest_nodes: dict,
@@ -603,29 +707,31 @@ class VulnerabilityAnalyser:
         path for every pair of sites, and a set of all nodes that form all of the shortest paths examined.
         """
         site_names = key_sites[key_sites_col_name].tolist()
+        site_nodes = [key_sites.loc[key_sites[key_sites_col_name] == site_name][NEAREST_NODE].values[0]
+                      for site_name in site_names]
+        site_node_weights = []
+        for site_name, site_node in zip(site_names, site_nodes):
+            site_coord = key_sites.loc[key_sites[key_sites_col_name] == site_name, STD_GEOMETRY].values[0]
+            node_coord = self.graph.nodes.loc[self.graph.nodes[STD_NODE_ID] == site_node, STD_GEOMETRY].values[0]
+            site_node_weights.append(self._estimate_weight(site_coord, node_coord))
+
+        # One search per source site, covering the nearest nodes of every other site
+        time_matrix, trees = self.graph.travel_time_matrix(site_nodes, site_nodes, return_paths=True,
+                                                           processes=self.processes)
+
         shortest_time_matrix = np.zeros((len(site_names), len(site_names)), dtype=float)
         nodes_in_shortest_paths = []
         paths_matrix = []
 
         for row in range(len(shortest_time_matrix)):
             list_of_paths = []
-            source_node = key_sites.loc[key_sites[key_sites_col_name] == site_names[row]][NEAREST_NODE].values[0]
-            source_site_coord = key_sites.loc[key_sites[key_sites_col_name] == site_names[row], STD_GEOMETRY].values[0]
-            source_node_coord = \
-                self.graph.nodes.loc[self.graph.nodes[STD_NODE_ID] == source_node, STD_GEOMETRY].values[0]
-            weight_to_source_node = self._estimate_weight(source_site_coord, source_node_coord)
+            weight_to_source_node = site_node_weights[row]
 
             for col in range(len(shortest_time_matrix)):
                 if col != row:
-                    target_node = \
-                        key_sites.loc[key_sites[key_sites_col_name] == site_names[col]][NEAREST_NODE].values[0]
-                    target_site_coord = \
-                        key_sites.loc[key_sites[key_sites_col_name] == site_names[col], STD_GEOMETRY].values[0]
-                    target_node_coord = \
-                        self.graph.nodes.loc[self.graph.nodes[STD_NODE_ID] == target_node, STD_GEOMETRY].values[0]
-                    weight_from_target_node = self._estimate_weight(target_node_coord, target_site_coord)
-
-                    shortest_path, shortest_time = self.graph.shortest_path_between_nodes(source_node, target_node)
+                    weight_from_target_node = site_node_weights[col]
+                    shortest_path = trees[row].path_to(site_nodes[col])
+                    shortest_time = time_matrix[row][col]
                     shortest_time_matrix[row][col] = shortest_time + weight_to_source_node + weight_from_target_node
                     nodes_in_shortest_paths.extend(shortest_path)
                     list_of_paths.append(shortest_path)
@@ -735,34 +841,29 @@ class VulnerabilityAnalyser:
         :param nodes: Nodes Geo Data Frame.
         :return: Dictionary of 100 closest nodes to each site (furthest to closest).
         """
-        node_points = nodes.loc[:, STD_GEOMETRY]
-        key_sites['nearest_nodes'] = key_sites[STD_GEOMETRY].apply(lambda x: self._sort_nearest_node(x, node_points))
-        key_sites_new_index = key_sites.set_index(key_col_name)
-        nearest_nodes_df = key_sites_new_index[['nearest_nodes']]
-
-        key_sites.drop(['nearest_nodes'], axis=1, inplace=True)
+        nearest_nodes = self._k_nearest_nodes(key_sites[STD_GEOMETRY], nodes, 100)
+        return {site: {'nearest_nodes': node_ids[::-1].tolist()}
+                for site, node_ids in zip(key_sites[key_col_name], nearest_nodes)}
 
-        return nearest_nodes_df.T.to_dict()
-
-    def _sort_nearest_node(self, point: Point, nodes: gpd.GeoSeries) -> list:
+    def _k_nearest_nodes(self, points: gpd.GeoSeries, nodes: gpd.GeoDataFrame, k: int) -> np.ndarray:
         """
-        Calculates and returns the closest 100 nodes to point
-        :param point: target point
-        :param nodes: Series of candidate nodes
-        :return: List of 100 closest nodes to point (from furthest to closest).
+        Finds the k nearest nodes to each point, reusing the spatial index of the road graph if nodes are the road
+        graph's own nodes
+        :param points: Series of Shapely.Point
+        :param nodes: Geo Data Frame of candidate nodes
+        :param k: Number of nearest nodes
+        :return: Array of node ids of shape (number of points, k), ordered from closest to furthest
         """
-        sorted_points = sorted([(point.distance(node), index) for node, index in zip(nodes, nodes.index)], reverse=True)
-        sorted_index = [sorted_point[1] for sorted_point in sorted_points]
-        return self.graph.nodes.loc[sorted_index[-100:], STD_NODE_ID].tolist()
+        coords = np.column_stack([points.x.values, points.y.values])
+        k = min(k, len(nodes))
+        if nodes is self.graph.nodes:
+            nearest_nodes = self.graph.nearest_nodes(coords, k)
+        else:
+            tree = cKDTree(np.column_stack([nodes[STD_GEOMETRY].x.values, nodes[STD_GEOMETRY].y.values]))
+            _, positions = tree.query(coords, k=k)
+            nearest_nodes = nodes[STD_NODE_ID].values[positions]
 
-    def _nearest_node(self, point: Point, nodes: gpd.GeoSeries) -> str:
-        """
-        Returns the nearest node to point
-        :param point: point as Shapely.Point
-        :return: Node Id of nearest node
-        """
-        closest_point = min([(point.distance(node), index) for node, index in zip(nodes, nodes.index)])
-        return self.graph.nodes.loc[closest_point[1], STD_NODE_ID]
+        return nearest_nodes.reshape(len(coords), k)
 
     def assign_key_sites_to_nearest_nodes(self, key_sites: gpd.GeoDataFrame, nodes: gpd.GeoDataFrame) \
             -> gpd.GeoDataFrame:
@@ -772,9 +873,7 @@ class VulnerabilityAnalyser:
         :param key_sites: GeoDataFrame of the key sites.
         :return: Updated key sites containing the nearest node per key site.
         """
-        node_points = nodes.loc[:, STD_GEOMETRY]
-
-        key_sites[NEAREST_NODE] = key_sites[STD_GEOMETRY].apply(lambda x: self._nearest_node(x, node_points))
+        key_sites[NEAREST_NODE] = self._k_nearest_nodes(key_sites[STD_GEOMETRY], nodes, 1)[:, 0]
 
         for index, key_site in key_sites.iterrows():
             nearest_node_id = key_site[NEAREST_NODE]
@@ -1,3 +1,4 @@
+import hashlib
 from queue import Queue
 from shapely.geometry import LineString, Polygon
 from RoadGraph.util import extract_coord_at_index
@@ -32,6 +33,17 @@ class OSToStdGdfConverter(StdGdfConverter):
         self.speed_criteria = speed_criteria
         self._built_up_gdf = built_up_gdf
         super().__init__(srn_list=srn_list)
+        self.source_column_names = [OS_CLASS, OS_ROAD_NO, OS_ROAD_TYPE, OS_LENGTH, OS_IS_TRUNK, OS_GEOMETRY]
+
+    def parameters(self) -> dict:
+        parameters = super().parameters()
+        parameters['speed_criteria'] = self.speed_criteria
+        if self.speed_criteria == 'Complex' and self._built_up_gdf is not None:
+            built_up = hashlib.sha256()
+            for geometry in self._built_up_gdf[STD_GEOMETRY].to_wkb():
+                built_up.update(geometry)
+            parameters['built_up'] = built_up.hexdigest()
+        return parameters
 
     def _build_std_gdf(self, orig_gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
         """
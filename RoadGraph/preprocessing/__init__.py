@@ -2,4 +2,5 @@ from RoadGraph.preprocessing.std_gdf_converter import StdGdfConverter
 from RoadGraph.preprocessing.OS_to_std_gdf_converter import OSToStdGdfConverter
 from RoadGraph.preprocessing.std_nodes_edges_gdf_builder import StdNodesEdgesGdfBuilder
 from RoadGraph.preprocessing.std_nodes_edges_gdf_connector import StdNodesEdgesGdfConnector
+from RoadGraph.preprocessing.build_manifest import BuildManifest
 from RoadGraph.preprocessing.std_road_graph_builder import StdRoadGraphBuilder
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+
+BUILD_MANIFEST_FILE = 'build_manifest.json'
+BUILD_MANIFEST_VERSION = 1
+# Files making up a single shapefile, all of which are hashed as its content
+SHAPEFILE_PARTS = ('.shp', '.shx', '.dbf', '.prj', '.cpg')
+HASH_CHUNK_SIZE = 1024 ** 2
+
+
+class BuildManifest:
+    """
+    Record of the artifacts produced by each stage of StdRoadGraphBuilder.build_road_graph, saved as
+    build_manifest.json within the output directory.
+
+    Every artifact (a converted tile, the nodes and edges of a tile, the connected network or the graph) is recorded
+    under a key along with its fingerprint: a hash of the digests of its inputs and of the parameters used to produce
+    it. An artifact is current if its fingerprint is unchanged and all of its outputs still exist, in which case the
+    stage producing it can be skipped.
+
+    The digest of an input that is itself the output of a recorded artifact is that artifact's fingerprint, so that
+    a change to any tile propagates to every downstream artifact without hashing the intermediate files. Other
+    inputs are hashed by content, the hashes being reused for as long as the size and modification time of the
+    files are unchanged.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: Output directory of the build, holding the manifest. Loads the existing manifest if any.
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, BUILD_MANIFEST_FILE)
+        self.entries = {}
+        self.files = {}
+
+        if os.path.isfile(self.path):
+            with open(self.path) as source:
+                manifest = json.load(source)
+            if manifest.get('version') == BUILD_MANIFEST_VERSION:
+                self.entries = manifest.get('entries', {})
+                self.files = manifest.get('files', {})
+
+    def _relative(self, path: str) -> str:
+        return os.path.relpath(path, self.directory)
+
+    def file_hash(self, path: str) -> str:
+        """
+        :param path: Path of an input file. All parts of a shapefile are hashed along with its .shp file.
+        :return: SHA-256 digest of the content of the file
+        """
+        stem, extension = os.path.splitext(path)
+        parts = [stem + part for part in SHAPEFILE_PARTS] if extension == '.shp' else [path]
+        parts = [part for part in parts if os.path.isfile(part)]
+        if not parts:
+            raise FileNotFoundError(f"{path} does not exist")
+
+        stats = [os.stat(part) for part in parts]
+        signature = [[os.path.basename(part), stat.st_size, stat.st_mtime_ns] for part, stat in zip(parts, stats)]
+        key = self._relative(path)
+        record = self.files.get(key)
+        if record is not None and record['signature'] == signature:
+            return record['sha256']
+
+        sha = hashlib.sha256()
+        for part in parts:
+            sha.update(os.path.basename(part).encode())
+            with open(part, 'rb') as source:
+                for chunk in iter(lambda: source.read(HASH_CHUNK_SIZE), b''):
+                    sha.update(chunk)
+        digest = sha.hexdigest()
+        self.files[key] = {'signature': signature, 'sha256': digest}
+        return digest
+
+    def input_digest(self, path: str) -> str:
+        """
+        :param path: Path of an input of a stage
+        :return: Fingerprint of the recorded artifact producing path if it is current, otherwise the hash of the
+        content of path
+        """
+        relative = self._relative(path)
+        for entry in self.entries.values():
+            if relative in entry['outputs'] and self._outputs_exist(entry):
+                return entry['fingerprint']
+        return self.file_hash(path)
+
+    @staticmethod
+    def fingerprint(digests: list, parameters: dict) -> str:
+        """
+        :param digests: Digests of the inputs of an artifact, in order
+        :param parameters: JSON serialisable parameters used to produce the artifact
+        :return: Fingerprint of the artifact
+        """
+        content = json.dumps({'inputs': digests, 'parameters': parameters}, sort_keys=True, default=str)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+    def _outputs_exist(self, entry: dict) -> bool:
+        return all(os.path.exists(os.path.join(self.directory, output)) for output in entry['outputs'])
+
+    def is_current(self, key: str, fingerprint: str) -> bool:
+        """
+        :param key: Key of the artifact
+        :param fingerprint: Fingerprint of the artifact as it would now be produced
+        :return: True if the recorded artifact has the same fingerprint and all of its outputs exist
+        """
+        entry = self.entries.get(key)
+        return entry is not None and entry['fingerprint'] == fingerprint and self._outputs_exist(entry)
+
+    def record(self, key: str, fingerprint: str, outputs: list):
+        """
+        Records an artifact once it has been produced, and saves the manifest
+        :param key: Key of the artifact
+        :param fingerprint: Fingerprint of the artifact
+        :param outputs: Paths of the files or directories making up the artifact
+        """
+        self.entries[key] = {'fingerprint': fingerprint, 'outputs': [self._relative(output) for output in outputs]}
+        self.save()
+
+    def save(self):
+        manifest = {'version': BUILD_MANIFEST_VERSION, 'entries': self.entries, 'files': self.files}
+        with open(self.path, 'w') as target:
+            json.dump(manifest, target, indent=2)
@@ -15,6 +15,16 @@ class StdGdfConverter(ABC):
         self.srn_list = srn_list
         self.std_column_names = [STD_ROAD_NO, STD_ROAD_TYPE, STD_FORMOFWAY, STD_SPEED, STD_LENGTH, STD_IS_SRN,
                                  STD_IS_DIREC, STD_GEOMETRY]
+        # Columns of the original geodataframe used by the conversion, None if all columns are to be read
+        self.source_column_names = None
+
+    def parameters(self) -> dict:
+        """
+        :return: Parameters affecting the conversion, used to tell whether previously converted dataframes are
+        current (see BuildManifest)
+        """
+        srn_list = sorted(str(road) for road in self.srn_list) if self.srn_list is not None else None
+        return {'converter': type(self).__name__, 'srn_list': srn_list}
 
     def convert_to_std_gdf(self, orig_gdf: gpd.GeoDataFrame, out_path: str = None) -> gpd.GeoDataFrame:
         """
@@ -16,6 +16,13 @@ LAST_COORD = "LAST_COORD"
 
 class StdNodesEdgesGdfBuilder:
 
+    def parameters(self, node_tag: str = "") -> dict:
+        """
+        :param node_tag: Node prefix of the nodes and edges geodataframes
+        :return: Parameters affecting the nodes and edges geodataframes built, see BuildManifest
+        """
+        return {'builder': type(self).__name__, 'node_tag': node_tag}
+
     def build_nodes_and_edges_gdf_from_path(self, in_path: str, out_path: str = None,
                                             node_tag: str = "") -> (gpd.GeoDataFrame, gpd.GeoDataFrame):
         """
@@ -1,15 +1,28 @@
+import logging
+import numpy as np
 import geopandas as gpd
 import pandas as pd
-from RoadGraph.util import euclidean_distance, extract_coord_at_index
+from scipy.spatial import cKDTree
 from RoadGraph.constants.StdColNames import *
 from RoadGraph.constants.StdKeyWords import *
 
+# Decimal places to which coordinates are rounded when matching the ends of edges with nodes
+COORD_DECIMALS = 6
+
+logger = logging.getLogger(__name__)
+
 
 class StdNodesEdgesGdfConnector:
 
     def __init__(self, threshold=0):
         self.THRESHOLD = threshold
 
+    def parameters(self) -> dict:
+        """
+        :return: Parameters affecting the connected nodes and edges geodataframes, see BuildManifest
+        """
+        return {'connector': type(self).__name__, 'threshold': self.THRESHOLD}
+
     def connect_two_nodeEdges_std_gdfs_from_paths(self, first_path: str, second_path: str, out_path: str = None) \
             -> (gpd.GeoDataFrame, gpd.GeoDataFrame):
         """
@@ -39,6 +52,10 @@ class StdNodesEdgesGdfConnector:
         edges.
         :return: Merged/connected nodes and edges dataframe based on dataframes from first path and second sources
         """
+        buffer = max(self.border_buffer(nodes_a), self.border_buffer(nodes_b))
+        if not self.is_adjacent(self.bounds(edges_a, nodes_a), self.bounds(edges_b, nodes_b), buffer):
+            return self.append_two_nodeEdges_std_gdfs(edges_a, nodes_a, edges_b, nodes_b, out_path)
+
         base_e = edges_a.copy()
         base_n = nodes_a.copy()
         aux_e = edges_b.copy()
@@ -52,6 +69,10 @@ class StdNodesEdgesGdfConnector:
         base_e, base_n, aux_n = self._connect_by_nodes(aux_n, base_n, base_e, STD_N_ROUNDABOUT)
         base_e, base_n, aux_n = self._connect_by_nodes(aux_n, base_n, base_e, STD_N_TERMINAL)
 
+        # Merge junctions found at the same location in both networks, such as those at the corner of tiles that
+        # were already connected to other tiles before being merged
+        aux_e, aux_n = self._connect_junctions(base_n, aux_n, aux_e)
+
         # Establish connections between terminal nodes and potential edges from other map
         aux_e = self._connect_by_edge(base_n, aux_e)
         base_e = self._connect_by_edge(aux_n, base_e)
@@ -68,6 +89,61 @@ class StdNodesEdgesGdfConnector:
 
         return base_e, base_n
 
+    def append_two_nodeEdges_std_gdfs(self, edges_a: gpd.GeoDataFrame, nodes_a: gpd.GeoDataFrame,
+                                      edges_b: gpd.GeoDataFrame, nodes_b: gpd.GeoDataFrame,
+                                      out_path: str = None) -> (gpd.GeoDataFrame, gpd.GeoDataFrame):
+        """
+        Appends the nodes and edges dataframes of the second source to those of the first without connecting them,
+        reindexing the edges of the second source as connect_two_nodeEdges_std_gdfs does.
+        :return: Appended nodes and edges dataframe
+        """
+        aux_e = self._reindex_to_base_edges(edges_a, edges_b.copy())
+        base_e = pd.concat([edges_a, aux_e])
+        base_n = pd.concat([nodes_a, nodes_b])
+
+        base_n.reset_index(drop=True, inplace=True)
+
+        if out_path is not None:
+            base_e.to_file(out_path + "/edges.shp")
+            base_n.to_file(out_path + "/nodes.shp")
+
+        return base_e, base_n
+
+    @staticmethod
+    def bounds(edges: gpd.GeoDataFrame, nodes: gpd.GeoDataFrame) -> np.ndarray:
+        """
+        :return: Bounding box (minx, miny, maxx, maxy) of the edges and nodes of a road network
+        """
+        edges_bounds = edges.total_bounds
+        nodes_bounds = nodes.total_bounds
+        return np.concatenate([np.fmin(edges_bounds[:2], nodes_bounds[:2]),
+                               np.fmax(edges_bounds[2:], nodes_bounds[2:])])
+
+    def border_buffer(self, nodes: gpd.GeoDataFrame) -> float:
+        """
+        :param nodes: Nodes dataframe of a road network
+        :return: Largest distance at which a node of the road network may be connected to another road network,
+        being the threshold plus the largest roundabout extent
+        """
+        extents = pd.to_numeric(nodes[STD_N_ROUNDABOUT_EXTENT], errors='coerce') if len(nodes) > 0 else []
+        extent = np.nanmax(extents) if len(extents) > 0 and not np.isnan(extents).all() else 0.0
+        return self.THRESHOLD + float(extent)
+
+    @staticmethod
+    def is_adjacent(bounds_a: np.ndarray, bounds_b: np.ndarray, buffer: float) -> bool:
+        """
+        Two road networks can only have nodes or edges to connect if their bounding boxes, expanded by the border
+        buffer, intersect.
+        :param bounds_a: Bounding box of the first road network, see bounds
+        :param bounds_b: Bounding box of the second road network
+        :param buffer: Border buffer, see border_buffer
+        :return: True if the road networks may be connected
+        """
+        if np.isnan(bounds_a).any() or np.isnan(bounds_b).any():
+            return False
+        return bounds_a[0] - buffer <= bounds_b[2] and bounds_b[0] - buffer <= bounds_a[2] and \
+            bounds_a[1] - buffer <= bounds_b[3] and bounds_b[1] - buffer <= bounds_a[3]
+
     def _connect_by_nodes(self, base_n: gpd.GeoDataFrame, aux_n: gpd.GeoDataFrame, aux_e: gpd.GeoDataFrame,
                           node_type: str) -> (gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame):
         """
@@ -81,78 +157,129 @@ class StdNodesEdgesGdfConnector:
         :param node_type: The type of node to be iterated through in base_n
         :return: Updated aux_e, aux_n, and base_n tuple.
         """
-        IS_CONNECTED = "is_connected"
-        N_COORD = "coord"
-        base_n[N_COORD] = base_n[STD_GEOMETRY].apply(lambda x: extract_coord_at_index(x, 0))
-        aux_n[N_COORD] = aux_n[STD_GEOMETRY].apply(lambda x: extract_coord_at_index(x, 0))
         sel_nodes = base_n.loc[base_n[STD_N_TYPE] == node_type]
+        if len(sel_nodes) == 0 or len(aux_n) == 0:
+            return aux_e, aux_n, base_n
 
-        for index, node in sel_nodes.iterrows():
-            sel_coord = node[N_COORD]
-            sel_buffer = node[STD_N_ROUNDABOUT_EXTENT]
+        # Aux nodes within the threshold plus the roundabout extent of each selected node. An aux node close to
+        # several selected nodes is connected to the first of them only
+        buffers = self.THRESHOLD + pd.to_numeric(sel_nodes[STD_N_ROUNDABOUT_EXTENT], errors='coerce').fillna(0.0)
+        tree = cKDTree(self._node_coordinates(aux_n))
+        neighbours = tree.query_ball_point(self._node_coordinates(sel_nodes), buffers.to_numpy())
 
-            aux_n[IS_CONNECTED] = aux_n[N_COORD].apply(lambda x: self._is_connected(sel_coord, x, sel_buffer))
+        aux_ids = aux_n[STD_NODE_ID].to_numpy()
+        replacements = {}
+        connected_index = []
+        for index, node_id, candidates in zip(sel_nodes.index, sel_nodes[STD_NODE_ID], neighbours):
+            nodes_replacing = [aux_ids[i] for i in candidates if aux_ids[i] not in replacements]
+            if len(nodes_replacing) > 0:
+                connected_index.append(index)
+                replacements.update(dict.fromkeys(nodes_replacing, node_id))
 
-            nodes_replacing = aux_n.loc[aux_n[IS_CONNECTED] == True, STD_NODE_ID]
+        if len(replacements) == 0:
+            return aux_e, aux_n, base_n
 
-            if len(nodes_replacing) > 0 and node.Type == STD_N_TERMINAL:
-                base_n.at[index, STD_N_TYPE] = STD_N_JUNCTION
+        if node_type == STD_N_TERMINAL:
+            base_n.loc[connected_index, STD_N_TYPE] = STD_N_JUNCTION
 
-            aux_e.loc[aux_e[STD_FROM_NODE].isin(nodes_replacing), STD_FROM_NODE] = node.node_id
-            aux_e.loc[aux_e[STD_TO_NODE].isin(nodes_replacing), STD_TO_NODE] = node.node_id
+        aux_e, aux_n = self._replace_nodes(aux_e, aux_n, replacements)
 
-            aux_n.drop(index=aux_n.index[aux_n[STD_NODE_ID].isin(nodes_replacing)], inplace=True)
-
-            aux_n.drop(IS_CONNECTED, axis=1, inplace=True)
+        return aux_e, aux_n, base_n
 
-        aux_n.drop(N_COORD, axis=1, inplace=True)
-        base_n.drop(N_COORD, axis=1, inplace=True)
+    def _connect_junctions(self, base_n: gpd.GeoDataFrame, aux_n: gpd.GeoDataFrame, aux_e: gpd.GeoDataFrame) \
+            -> (gpd.GeoDataFrame, gpd.GeoDataFrame):
+        """
+        Merges junctions of the aux dataframe into junctions of the base dataframe found at the same coordinates,
+        rounded to COORD_DECIMALS. Unlike _connect_by_nodes, the threshold does not apply, such that junctions
+        which are merely close to each other are kept apart.
+        :param base_n: Dataframe of nodes kept
+        :param aux_n: Dataframe of nodes merged into base_n
+        :param aux_e: Corresponding dataframe of edges connected to aux_n
+        :return: Updated aux_e and aux_n tuple.
+        """
+        base_junctions = base_n.loc[base_n[STD_N_TYPE] == STD_N_JUNCTION]
+        aux_junctions = aux_n.loc[aux_n[STD_N_TYPE] == STD_N_JUNCTION]
+        if len(base_junctions) == 0 or len(aux_junctions) == 0:
+            return aux_e, aux_n
+
+        base_keys = pd.DataFrame(np.round(self._node_coordinates(base_junctions), COORD_DECIMALS),
+                                 columns=['x', 'y'])
+        base_keys[STD_NODE_ID] = base_junctions[STD_NODE_ID].to_numpy()
+        base_keys.drop_duplicates(['x', 'y'], inplace=True)
+        aux_keys = pd.DataFrame(np.round(self._node_coordinates(aux_junctions), COORD_DECIMALS), columns=['x', 'y'])
+        aux_keys['aux_id'] = aux_junctions[STD_NODE_ID].to_numpy()
+
+        matches = aux_keys.merge(base_keys, on=['x', 'y'])
+        if len(matches) == 0:
+            return aux_e, aux_n
+
+        return self._replace_nodes(aux_e, aux_n, dict(zip(matches['aux_id'], matches[STD_NODE_ID])))
+
+    @staticmethod
+    def _replace_nodes(aux_e: gpd.GeoDataFrame, aux_n: gpd.GeoDataFrame, replacements: dict) \
+            -> (gpd.GeoDataFrame, gpd.GeoDataFrame):
+        """
+        :param aux_e: Dataframe of edges
+        :param aux_n: Dataframe of nodes of aux_e
+        :param replacements: Node id of another network replacing each connected node id of aux_n
+        :return: aux_e with its nodes replaced, and aux_n without the replaced nodes
+        """
+        for column in (STD_FROM_NODE, STD_TO_NODE):
+            aux_e[column] = aux_e[column].map(replacements).fillna(aux_e[column])
+        aux_n = aux_n.loc[~aux_n[STD_NODE_ID].isin(replacements)]
 
-        return aux_e, aux_n, base_n
+        return aux_e, aux_n
 
     def _connect_by_edge(self, base_n: gpd.GeoDataFrame, aux_e: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
         """
-        Connects any remaining terminal nodes with free edges belonging to the second pair or tiles.
+        Connects any remaining terminal nodes with free edges belonging to the second pair or tiles. Free ends of
+        the edges are joined with the terminal nodes on their coordinates, rounded to COORD_DECIMALS. Edges with empty
+        or missing geometries have no ends and are left unconnected.
         :param base_n: Dataframe of nodes of first pair
         :param aux_e: Dataframe of edges of second pair
         :return: Updated geoDataframe with edges potentially connected to nodes of the opposing set.
         """
-        N_COORD = "coord"
-        FIRST_COORD = "FIRST_COORD"
-        LAST_COORD = "LAST_COORD"
-        # Filter nodes by terminal nodes
-        base_n[N_COORD] = base_n[STD_GEOMETRY].apply(lambda x: extract_coord_at_index(x, 0))
+        N_INDEX = "node_index"
+        E_INDEX = "edge_index"
         sel_nodes = base_n.loc[base_n[STD_N_TYPE] == STD_N_TERMINAL]
-
-        # Extract first and last coordinates from edges
-        aux_e[FIRST_COORD] = aux_e[STD_GEOMETRY].apply(lambda x: extract_coord_at_index(x, 0))
-        aux_e[LAST_COORD] = aux_e[STD_GEOMETRY].apply(lambda x: extract_coord_at_index(x, -1))
-
-        for _, node in sel_nodes.iterrows():
-            node_id = node[STD_NODE_ID]
-            n_coord = node[N_COORD]
-
-            is_connected = aux_e[FIRST_COORD].apply(lambda x: x == n_coord)
-            connected_index = aux_e.index[(is_connected == True) & (aux_e[STD_FROM_NODE] == 'None')]
-            if len(connected_index) > 0:
-                print(node_id)
-                base_n.loc[base_n[STD_NODE_ID] == node_id, STD_N_TYPE] = STD_N_JUNCTION
-                aux_e.loc[connected_index, STD_FROM_NODE] = node_id
-                aux_e.loc[connected_index, STD_PREV_IND] = pd.NA
-
-            is_connected = aux_e[LAST_COORD].apply(lambda x: x == n_coord)
-            connected_index = aux_e.index[(is_connected == True) & (aux_e[STD_TO_NODE] == 'None')]
-            if len(connected_index) > 0:
-                print(node_id)
-                base_n.loc[base_n[STD_NODE_ID] == node_id, STD_N_TYPE] = STD_N_JUNCTION
-                aux_e.loc[connected_index, STD_TO_NODE] = node_id
-                aux_e.loc[connected_index, STD_NEXT_IND] = pd.NA
-
-        base_n.drop([N_COORD], axis=1, inplace=True)
-        aux_e.drop([FIRST_COORD, LAST_COORD], axis=1, inplace=True)
+        if len(sel_nodes) == 0 or len(aux_e) == 0:
+            return aux_e
+
+        # Where several terminal nodes share the same coordinates, the edges are connected to the first of them
+        node_keys = pd.DataFrame(np.round(self._node_coordinates(sel_nodes), COORD_DECIMALS), columns=['x', 'y'])
+        node_keys[STD_NODE_ID] = sel_nodes[STD_NODE_ID].to_numpy()
+        node_keys[N_INDEX] = sel_nodes.index
+        node_keys.drop_duplicates(['x', 'y'], inplace=True)
+
+        coords = gpd.GeoSeries(aux_e[STD_GEOMETRY]).get_coordinates().round(COORD_DECIMALS)
+        ends = ((coords[~coords.index.duplicated(keep='first')], STD_FROM_NODE, STD_PREV_IND),
+                (coords[~coords.index.duplicated(keep='last')], STD_TO_NODE, STD_NEXT_IND))
+
+        connected = []
+        for end_coords, node_col, ind_col in ends:
+            # Empty geometries have no coordinates, so only free ends with coordinates are looked up
+            free = end_coords.loc[end_coords.index.intersection(aux_e.index[aux_e[node_col] == 'None'])]
+            matches = free.rename_axis(E_INDEX).reset_index().merge(node_keys, on=['x', 'y'])
+            aux_e.loc[matches[E_INDEX], node_col] = matches[STD_NODE_ID].to_numpy()
+            aux_e.loc[matches[E_INDEX], ind_col] = pd.NA
+            connected.append(matches[N_INDEX])
+
+        connected = pd.concat(connected)
+        if len(connected) > 0:
+            base_n.loc[connected.unique(), STD_N_TYPE] = STD_N_JUNCTION
+            logger.info("Connected %d edge ends to %d terminal nodes", len(connected), connected.nunique())
 
         return aux_e
 
+    @staticmethod
+    def _node_coordinates(nodes: gpd.GeoDataFrame) -> np.ndarray:
+        """
+        :param nodes: Dataframe of nodes
+        :return: Array of the x and y coordinates of the nodes
+        """
+        geometry = gpd.GeoSeries(nodes[STD_GEOMETRY])
+        return np.column_stack([geometry.x.to_numpy(), geometry.y.to_numpy()])
+
     def _reindex_to_base_edges(self, base_e: gpd.GeoDataFrame, aux_e: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
         """
         Updates indices of the aux_e dataframe based on the indices of the base_e dataframe.
@@ -175,32 +302,18 @@ class StdNodesEdgesGdfConnector:
         :param aux_e: Dataframe of edges
         :return: Updated aux_e
         """
-        old_ind = aux_e[STD_INDEX].tolist()
+        # New position of each old index, the first one being used where an index is repeated
+        old_ind = aux_e[STD_INDEX].to_numpy(dtype=np.int64)
+        positions = pd.Series(np.arange(len(old_ind)), index=old_ind)
+        positions = positions[~positions.index.duplicated()]
 
         aux_e.reset_index(drop=True, inplace=True)
         aux_e[STD_INDEX] = aux_e.index
-        aux_e[STD_PREV_IND] = aux_e.loc[pd.isna(aux_e[STD_PREV_IND]) == False, STD_PREV_IND]. \
-            apply(lambda x: old_ind.index(int(x)))
-        aux_e[STD_NEXT_IND] = aux_e.loc[pd.isna(aux_e[STD_NEXT_IND]) == False, STD_NEXT_IND]. \
-            apply(lambda x: old_ind.index(int(x)))
+        for column in (STD_PREV_IND, STD_NEXT_IND):
+            linked = aux_e.loc[pd.isna(aux_e[column]) == False, column].astype(np.int64)
+            new_ind = linked.map(positions)
+            if new_ind.isna().any():
+                missing = linked[new_ind.isna()].unique().tolist()
+                raise ValueError(f"{column} refers to road segments {missing} which are not in the edges")
+            aux_e[column] = new_ind
         return aux_e
-
-    def _is_connected(self, first_coords: tuple, sec_coords: tuple, buffer: float) -> bool:
-        """
-        Checks if both coordinates are 'connected' based on a pre-defined threshold and an additional buffer
-        (if needed)
-        :param first_coords: The first coordinate
-        :param sec_coords: The second coordinate
-        :param buffer: An additional buffer to be added on top of threshold
-        :return: Boolean, true if the calculated distance between the two coordinates are less than some threshold,
-        false otherwise.
-        """
-        if pd.isna(buffer):
-            buffer = 0.0
-        else:
-            buffer = float(buffer)
-
-        tolerance = buffer + self.THRESHOLD
-        distance = euclidean_distance(first_coords, sec_coords)
-
-        return distance <= tolerance
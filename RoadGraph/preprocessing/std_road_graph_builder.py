@@ -1,135 +1,338 @@
+import numpy as np
 import pandas as pd
 import geopandas as gpd
 import pickle
 import os
+import time
+from multiprocessing import Pool
 import networkx as nx
-from RoadGraph.preprocessing import OSToStdGdfConverter, StdNodesEdgesGdfBuilder, StdNodesEdgesGdfConnector
+from RoadGraph.preprocessing import OSToStdGdfConverter, StdNodesEdgesGdfBuilder, StdNodesEdgesGdfConnector, \
+    BuildManifest
 from RoadGraph.constants.StdColNames import *
 from RoadGraph.constants.StdKeyWords import *
 from RoadGraph.util import create_file_path
 from RoadGraph import StdRoadGraph
+from RoadGraph.storage import CompactGraph
+from RoadGraph.storage.gdfstorage import SHAPEFILE, get_storage
+
+# Road graph builder used by the tile tasks within each worker process
+_worker_builder = None
+
+
+def _init_tile_worker(road_graph_builder):
+    """
+    Pool initializer, keeps the builder (and thus its converter, builder and storage) within the worker process
+    rather than pickling it along with every task.
+    """
+    global _worker_builder
+    _worker_builder = road_graph_builder
+
+
+def _run_tile_task(road_graph_builder, i: int, task: tuple) -> (int, float, object):
+    method, args = task
+    start = time.time()
+    result = getattr(road_graph_builder, method)(*args)
+    return i, time.time() - start, result
+
+
+def _run_worker_tile_task(numbered_task: tuple) -> (int, float, object):
+    return _run_tile_task(_worker_builder, *numbered_task)
 
 
 class StdRoadGraphBuilder:
 
     def __init__(self, converter=OSToStdGdfConverter(), builder=StdNodesEdgesGdfBuilder(),
-                 connector=StdNodesEdgesGdfConnector()):
+                 connector=StdNodesEdgesGdfConnector(), storage=SHAPEFILE, source_storage=SHAPEFILE):
+        """
+        :param storage: Storage backend of the intermediate and final GeoDataFrames, either a GdfStorage object or
+        one of 'shp', 'parquet' or 'feather'
+        :param source_storage: Storage backend of the input GeoDataFrames found in in_path
+        """
         self.converter = converter
         self.builder = builder
         self.connector = connector
+        self.storage = get_storage(storage)
+        self.source_storage = get_storage(source_storage)
 
     def build_road_graph(self, in_path: str, target_path: str, is_conversion_required: bool = True,
-                         weight_type: str = "Time") -> StdRoadGraph:
+                         weight_type: str = "Time", build_contraction_hierarchy: bool = False,
+                         save_pickle: bool = True, use_cache: bool = True, processes: int = 1) -> StdRoadGraph:
         """
         Constructs an StdRoadGraph Object from the original geo spatial roads dataframe, saving the intermediate
         dataframe within specified paths via target_path
-        :param in_path: Path containing all roads dataframe shpfiles
-        :param target_path: Path to save the Networkx object (in .pickle) and other intermediate dataframes
+        :param in_path: Path containing all roads dataframe files, saved through source_storage
+        :param target_path: Path to save the graph (in the compact format, see CompactGraph) and other intermediate
+        dataframes
         :param is_conversion_required: Conversion of the original geo spatial dataframe into a standardised dataframe
         :param weight_type: type of weight to be used for the edges, either 'Time' or 'Length'
+        :param build_contraction_hierarchy: If set to true, also builds the contraction hierarchy index of the graph
+        and saves it next to the graph
+        :param save_pickle: If set to true, also saves the networkx object as roadGraph.pickle
+        :param use_cache: If set to true, tiles and stages whose outputs are current according to the build manifest
+        of a previous build (see BuildManifest) are skipped. Otherwise everything is rebuilt.
+        :param processes: Number of worker processes converting, building and connecting the tiles concurrently,
+        the tiles are processed serially if None or 1
         :return: An StdRoadGraph object representing the roads geoDataFrame.
         """
         curr_path = in_path
+        curr_storage = self.source_storage
         out_path = create_file_path(target_path + "/out")
+        manifest = BuildManifest(out_path)
 
         if is_conversion_required:
-            curr_path = self._convert_gdfs(curr_path, out_path)
+            curr_path = self._convert_gdfs(curr_path, out_path, manifest, use_cache, processes)
+            curr_storage = self.storage
 
-        curr_path = self._build_edges_nodes_gdfs(curr_path, out_path)
-        curr_path = self._connect_edges_and_nodes_gdfs(curr_path, out_path)
+        curr_path = self._build_edges_nodes_gdfs(curr_path, out_path, curr_storage, manifest, use_cache, processes)
+        curr_path = self._connect_edges_and_nodes_gdfs(curr_path, out_path, manifest, use_cache, processes)
 
-        edges_gdf = gpd.read_file(curr_path + "/edges.shp")
-        nodes_gdf = gpd.read_file(curr_path + "/nodes.shp")
+        edges_path = self.storage.file_path(curr_path, "edges")
+        nodes_path = self.storage.file_path(curr_path, "nodes")
+        edges_gdf = self.storage.read(edges_path)
+        nodes_gdf = self.storage.read(nodes_path)
 
-        net = self.create_graph(nodes_gdf, edges_gdf, weight_type)
         target_path = create_file_path(out_path + "/netx")
-        target_file = target_path + "/roadGraph.pickle"
+        compact_path = target_path + "/compactGraph"
+        pickle_path = target_path + "/roadGraph.pickle"
+        fingerprint = manifest.fingerprint([manifest.input_digest(edges_path), manifest.input_digest(nodes_path)],
+                                           {'weight_type': weight_type, 'save_pickle': save_pickle})
+
+        if use_cache and manifest.is_current('graph', fingerprint):
+            print("Graph is current, loading it")
+            if save_pickle:
+                with open(pickle_path, 'rb') as source:
+                    net = pickle.load(source)
+            else:
+                net = CompactGraph.load(compact_path, mmap_mode=None).to_networkx()
+        else:
+            net = self.create_graph(nodes_gdf, edges_gdf, weight_type)
+            CompactGraph.from_networkx(net, weight_type).save(compact_path)
 
-        with open(target_file, 'wb') as target:
-            pickle.dump(net, target)
+            if save_pickle:
+                with open(pickle_path, 'wb') as target:
+                    pickle.dump(net, target)
+            manifest.record('graph', fingerprint, [compact_path, pickle_path] if save_pickle else [compact_path])
 
-        return StdRoadGraph(net, nodes_gdf, edges_gdf)
+        road_graph = StdRoadGraph(net, nodes_gdf, edges_gdf)
+        if build_contraction_hierarchy:
+            road_graph.build_contraction_hierarchy(target_path + "/contractionHierarchy.npz", verbose=True)
 
-    def _convert_gdfs(self, in_path: str, out_path: str) -> str:
+        return road_graph
+
+    def _convert_gdfs(self, in_path: str, out_path: str, manifest: BuildManifest = None,
+                      use_cache: bool = False, processes: int = 1) -> str:
 
         """
-        Converts multiple shp geospatial roads dataframes into the standard GeoDataFrame used for this project.
+        Converts multiple geospatial roads dataframes into the standard GeoDataFrame used for this project.
         The results are saved in the out_path directory
-        :param in_path: File path containing all shp files that are to be converted
+        :param in_path: File path containing all files that are to be converted, saved through source_storage
         :param out_path: File path in which the converted standard dataframes are to be saved
+        :param manifest: Optional build manifest in which the converted dataframes are recorded
+        :param use_cache: If set to true, files whose converted dataframe is current within manifest are skipped
+        :param processes: Number of worker processes converting the files concurrently
         :return converted_path: the path in which the converted geodataframes are saved
         """
         converted_path = create_file_path(out_path + "/converted")
-        list_of_files = os.listdir(in_path)
-        shp_full_paths_in = [in_path + "/" + x for x in list_of_files if ".shp" in x]
-        shp_full_paths_out = [converted_path + "/" + x for x in list_of_files if ".shp" in x]
-
-        n = len(shp_full_paths_in)
-        for i in range(n):
-            print("iteration: " + str(i + 1) + " out of " + str(n + 1))
-            os_gdf = gpd.read_file(shp_full_paths_in[i])
-            self.converter.convert_to_std_gdf(os_gdf, shp_full_paths_out[i])
+        list_of_files = self.source_storage.list_files(in_path)
+        full_paths_in = [in_path + "/" + x for x in list_of_files]
+        full_paths_out = [self.storage.file_path(converted_path, os.path.splitext(x)[0]) for x in list_of_files]
+
+        tasks, records = [], []
+        for path_in, path_out in zip(full_paths_in, full_paths_out):
+            if manifest is not None:
+                key = "converted/" + os.path.basename(path_out)
+                fingerprint = manifest.fingerprint([manifest.input_digest(path_in)], self.converter.parameters())
+                if use_cache and manifest.is_current(key, fingerprint):
+                    print(f"{path_out} is current, skipping")
+                    continue
+                records.append((key, fingerprint, [path_out]))
+            tasks.append(('_convert_tile', (path_in, path_out)))
+
+        for i, seconds, _ in self._run_tile_tasks(tasks, processes):
+            print(f"Converted {tasks[i][1][0]} in {seconds:.2f}s")
+            if manifest is not None:
+                manifest.record(*records[i])
 
         return converted_path
 
-    def _build_edges_nodes_gdfs(self, in_path: str, out_path: str) -> str:
+    def _convert_tile(self, path_in: str, path_out: str):
+        """
+        Converts a single geospatial roads dataframe saved at path_in, saving the standard GeoDataFrame at path_out
+        """
+        os_gdf = self.source_storage.read(path_in, self.converter.source_column_names)
+        std_gdf = self.converter.convert_to_std_gdf(os_gdf)
+        self.storage.write(std_gdf, path_out)
+
+    def _build_edges_nodes_gdfs(self, in_path: str, out_path: str, in_storage=None, manifest: BuildManifest = None,
+                                use_cache: bool = False, processes: int = 1) -> str:
         """
         Builds the nodes and edges geoDataFrames for each roads geoDataFrame saved in in_path
         :param in_path: Path in which the roads geoDataFrame is saved
         :param out_path: Path in which the nodes and edges GeoDataFrames will be saved
+        :param in_storage: Storage backend of the roads geoDataFrames, defaults to the storage of this builder
+        :param manifest: Optional build manifest in which the nodes and edges GeoDataFrames are recorded
+        :param use_cache: If set to true, roads geoDataFrames whose nodes and edges are current within manifest are
+        skipped
+        :param processes: Number of worker processes building the nodes and edges geoDataFrames concurrently
         :return: Path in which all the nodes and edges geoDataFrames are saved
         """
         connected_path = create_file_path((out_path + "/connected"))
-        prefix = 'A'
-
-        list_of_files = os.listdir(in_path)
-        shp_full_paths_in = [in_path + "/" + x for x in list_of_files if ".shp" in x]
-        shp_full_paths_out = []
-        for file in list_of_files:
-            if ".shp" in file:
-                shp_full_paths_out.append(connected_path + "/" + prefix)
-                prefix = chr(ord(prefix) + 1)
-
-        n = len(shp_full_paths_in)
-
-        prefix = 'A'
-        for i in range(n):
-            print("iteration: " + str(i + 1) + " out of " + str(n + 1))
-            std_gdf = gpd.read_file(shp_full_paths_in[i])
-            create_file_path(shp_full_paths_out[i])
-            self.builder.build_nodes_and_edges_gdf(std_gdf, shp_full_paths_out[i], node_tag=prefix)
-            prefix = chr(ord(prefix) + 1)
+
+        in_storage = in_storage if in_storage is not None else self.storage
+        list_of_files = in_storage.list_files(in_path)
+        full_paths_in = [in_path + "/" + x for x in list_of_files]
+
+        # Node tags follow the sorted order of the files, and are assigned before any tile is built
+        prefixes = [chr(ord('A') + i) for i in range(len(list_of_files))]
+
+        tasks, records = [], []
+        for path_in, prefix in zip(full_paths_in, prefixes):
+            path_out = connected_path + "/" + prefix
+            edges_path = self.storage.file_path(path_out, "edges")
+            nodes_path = self.storage.file_path(path_out, "nodes")
+            if manifest is not None:
+                key = "connected/" + prefix
+                fingerprint = manifest.fingerprint([manifest.input_digest(path_in)],
+                                                   self.builder.parameters(node_tag=prefix))
+                if use_cache and manifest.is_current(key, fingerprint):
+                    print(f"{path_out} is current, skipping")
+                    continue
+                records.append((key, fingerprint, [edges_path, nodes_path]))
+            tasks.append(('_build_tile', (path_in, in_storage, path_out, prefix)))
+
+        for i, seconds, _ in self._run_tile_tasks(tasks, processes):
+            print(f"Built nodes and edges of {tasks[i][1][0]} (tag {tasks[i][1][3]}) in {seconds:.2f}s")
+            if manifest is not None:
+                manifest.record(*records[i])
 
         return connected_path
 
-    def _connect_edges_and_nodes_gdfs(self, in_path: str, out_path: str) -> str:
+    def _build_tile(self, path_in: str, in_storage, path_out: str, node_tag: str):
+        """
+        Builds the nodes and edges geoDataFrames of the roads geoDataFrame saved at path_in, saving them in path_out
+        """
+        std_gdf = in_storage.read(path_in, self.converter.std_column_names)
+        create_file_path(path_out)
+        edges_gdf, nodes_gdf = self.builder.build_nodes_and_edges_gdf(std_gdf, node_tag=node_tag)
+        self.storage.write(edges_gdf, self.storage.file_path(path_out, "edges"))
+        self.storage.write(nodes_gdf, self.storage.file_path(path_out, "nodes"))
+
+    def _run_tile_tasks(self, tasks: list, processes: int = 1):
+        """
+        Runs independent per tile tasks, either serially or concurrently within a pool of worker processes
+        :param tasks: List of (method name, arguments) tuples, each method being called on this builder
+        :param processes: Number of worker processes, tasks are run serially within this process if None or 1
+        :return: Generator of (task position, seconds taken, result) tuples, in the order the tasks complete
+        """
+        if processes is None or processes <= 1 or len(tasks) <= 1:
+            for i, task in enumerate(tasks):
+                yield _run_tile_task(self, i, task)
+            return
+
+        with Pool(min(processes, len(tasks)), initializer=_init_tile_worker, initargs=(self,)) as pool:
+            for result in pool.imap_unordered(_run_worker_tile_task, enumerate(tasks)):
+                yield result
+
+    def _connect_edges_and_nodes_gdfs(self, in_path: str, out_path: str, manifest: BuildManifest = None,
+                                      use_cache: bool = False, processes: int = 1) -> str:
         """
         Merges/connects the nodes and edges geoDataFrame into a single GeoDataFrame.
+
+        The tiles are merged as a tree rather than folded one by one into an ever growing GeoDataFrame: at each
+        level, every group of tiles is paired with a spatially adjacent group (see
+        StdNodesEdgesGdfConnector.is_adjacent) and each pair is connected, until a single group remains. The pairs
+        of a level are independent and may be connected concurrently.
         :param in_path: Path in which the all nodes and edges GeoDataFrames are saved
         :param out_path: Path to save the single combined GeoDataFrame
+        :param manifest: Optional build manifest in which the combined GeoDataFrame is recorded
+        :param use_cache: If set to true, the GeoDataFrames are not connected again if the combined GeoDataFrame is
+        current within manifest
+        :param processes: Number of worker processes connecting the pairs of each level concurrently
         :return: Path in which the single combined GeoDataFrame is saved
         """
-        list_of_files = os.listdir(in_path)
-        shp_full_paths_in = [in_path + "/" + x for x in list_of_files if not x.startswith(".")]
+        list_of_files = sorted(os.listdir(in_path))
+        shp_full_paths_in = [in_path + "/" + x for x in list_of_files
+                             if not x.startswith(".") and self.storage.exists(in_path + "/" + x, "edges")]
         final_path = create_file_path(out_path + "/final")
-
-        n = len(shp_full_paths_in)
-        gdf_edges = gpd.read_file(shp_full_paths_in[0] + "/edges.shp")
-        gdf_nodes = gpd.read_file(shp_full_paths_in[0] + "/nodes.shp")
-        print(f"{shp_full_paths_in[0]}")
-        for i in range(1, n):
-            print("iteration: " + str(i + 1) + " out of " + str(n + 1))
-            print(f"{shp_full_paths_in[i]}")
-            aux_edges = gpd.read_file(shp_full_paths_in[i] + "/edges.shp")
-            aux_nodes = gpd.read_file(shp_full_paths_in[i] + "/nodes.shp")
-            gdf_edges, gdf_nodes = self.connector.connect_two_nodeEdges_std_gdfs(gdf_edges, gdf_nodes,
-                                                                                 aux_edges, aux_nodes)
-
-        gdf_edges.to_file(final_path + "/edges.shp")
-        gdf_nodes.to_file(final_path + "/nodes.shp")
+        final_edges_path = self.storage.file_path(final_path, "edges")
+        final_nodes_path = self.storage.file_path(final_path, "nodes")
+
+        if manifest is not None:
+            digests = [manifest.input_digest(self.storage.file_path(path, name)) for path in shp_full_paths_in
+                       for name in ("edges", "nodes")]
+            fingerprint = manifest.fingerprint(digests, self.connector.parameters())
+            if use_cache and manifest.is_current("final", fingerprint):
+                print(f"{final_path} is current, skipping")
+                return final_path
+
+        groups = [(self.storage.read(self.storage.file_path(path, "edges")),
+                   self.storage.read(self.storage.file_path(path, "nodes"))) for path in shp_full_paths_in]
+        names = [os.path.basename(path) for path in shp_full_paths_in]
+
+        level = 1
+        while len(groups) > 1:
+            pairs, unpaired = self._pair_adjacent_groups(groups)
+            if not pairs:
+                # None of the remaining groups are adjacent, they are simply appended to one another
+                pairs, unpaired = [(0, i) for i in range(1, len(groups))], []
+                tasks = [('_append_groups', (groups,))]
+            else:
+                tasks = [('_merge_groups', (*groups[i], *groups[j])) for i, j in pairs]
+
+            merged = [None] * len(tasks)
+            for k, seconds, result in self._run_tile_tasks(tasks, processes):
+                merged[k] = result
+                if tasks[k][0] == '_merge_groups':
+                    i, j = pairs[k]
+                    print(f"Level {level}: connected {names[i]} and {names[j]} in {seconds:.2f}s")
+
+            if tasks[0][0] == '_append_groups':
+                groups, names = merged, ["+".join(names)]
+            else:
+                groups = merged + [groups[i] for i in unpaired]
+                names = [names[i] + "+" + names[j] for i, j in pairs] + [names[i] for i in unpaired]
+            level += 1
+
+        gdf_edges, gdf_nodes = groups[0]
+        self.storage.write(gdf_edges, final_edges_path)
+        self.storage.write(gdf_nodes, final_nodes_path)
+        if manifest is not None:
+            manifest.record("final", fingerprint, [final_edges_path, final_nodes_path])
 
         return final_path
 
+    def _pair_adjacent_groups(self, groups: list) -> (list, list):
+        """
+        Pairs every group of nodes and edges GeoDataFrames with the first following unpaired group adjacent to it
+        :param groups: List of (edges, nodes) GeoDataFrame tuples
+        :return: List of (first position, second position) pairs, and the positions of the unpaired groups
+        """
+        bounds = [self.connector.bounds(edges, nodes) for edges, nodes in groups]
+        buffer = max(self.connector.border_buffer(nodes) for _, nodes in groups)
+
+        pairs = []
+        paired = set()
+        for i in range(len(groups)):
+            if i in paired:
+                continue
+            for j in range(i + 1, len(groups)):
+                if j not in paired and self.connector.is_adjacent(bounds[i], bounds[j], buffer):
+                    pairs.append((i, j))
+                    paired.update((i, j))
+                    break
+
+        unpaired = [i for i in range(len(groups)) if i not in paired]
+        return pairs, unpaired
+
+    def _merge_groups(self, edges_a: gpd.GeoDataFrame, nodes_a: gpd.GeoDataFrame, edges_b: gpd.GeoDataFrame,
+                      nodes_b: gpd.GeoDataFrame) -> (gpd.GeoDataFrame, gpd.GeoDataFrame):
+        return self.connector.connect_two_nodeEdges_std_gdfs(edges_a, nodes_a, edges_b, nodes_b)
+
+    def _append_groups(self, groups: list) -> (gpd.GeoDataFrame, gpd.GeoDataFrame):
+        gdf_edges, gdf_nodes = groups[0]
+        for edges, nodes in groups[1:]:
+            gdf_edges, gdf_nodes = self.connector.append_two_nodeEdges_std_gdfs(gdf_edges, gdf_nodes, edges, nodes)
+        return gdf_edges, gdf_nodes
 
     def merge_road_segments(self, edges_gdf: gpd.GeoDataFrame, edge_index: int) -> (dict, int):
         """
@@ -139,38 +342,91 @@ class StdRoadGraphBuilder:
         :return: d: a dictionary the total length, indices and unique road IDs of the edge
                 final_node: final node that this road connects to
         """
-        d = {}
-        kph_to_mps_factor = 1000.0/3600.0
-        current_segment = edges_gdf.loc[edges_gdf[STD_INDEX] == edge_index]
-        current_segment = current_segment.iloc[0]
-        length = current_segment[STD_LENGTH]
-        time = length/(current_segment[STD_SPEED]*kph_to_mps_factor)
-        road_segment_index = [edge_index]
-        road_id = current_segment[STD_ROAD_NO] + "_" + current_segment[STD_ROAD_TYPE]
-
-        if current_segment[STD_IS_SRN] == 1:
-            is_srn = True
-        else:
-            is_srn = False
-
-        while not pd.isna(current_segment[STD_NEXT_IND]):
-            current_segment = edges_gdf.loc[edges_gdf[STD_INDEX] == int(current_segment[STD_NEXT_IND])]
-            current_segment = current_segment.iloc[0]
-            length += current_segment[STD_LENGTH]
-            time += current_segment[STD_LENGTH]/(current_segment[STD_SPEED]*kph_to_mps_factor)
-            road_segment_index.extend([current_segment[STD_INDEX]])
+        start = self._index_positions(edges_gdf)[1][edge_index]
+        chains = self._merge_road_chains(edges_gdf, np.array([start], dtype=np.int64))
+        return chains[0]
 
-            if current_segment[STD_IS_SRN] == 1:
-                is_srn = True
-
-        final_node = current_segment[STD_TO_NODE]
-        d[STD_Nx_ROAD_ID] = road_id
-        d[STD_Nx_LENGTH] = length
-        d[STD_Nx_TIME] = time
-        d[STD_Nx_ROAD_IND] = road_segment_index
-        d[STD_Nx_IS_SRN] = is_srn
-
-        return d, final_node
+    @staticmethod
+    def _index_positions(edges_gdf: gpd.GeoDataFrame) -> (np.ndarray, dict):
+        """
+        :return: Row position of the segment following each segment through NEXT_IND (-1 if none), and a dict of the
+        row position of every segment index (the first row if duplicated)
+        """
+        indices = edges_gdf[STD_INDEX].to_numpy()
+        positions = {}
+        for position, index in enumerate(indices.tolist()):
+            positions.setdefault(index, position)
+
+        next_ind = edges_gdf[STD_NEXT_IND]
+        has_next = next_ind.notna().to_numpy()
+        next_pos = np.full(len(edges_gdf), -1, dtype=np.int64)
+        next_values = next_ind[has_next].astype(float).astype(np.int64).tolist()
+        try:
+            next_pos[has_next] = [positions[value] for value in next_values]
+        except KeyError as error:
+            raise KeyError(f"NEXT_IND {error.args[0]} does not refer to any road segment") from None
+
+        return next_pos, positions
+
+    def _merge_road_chains(self, edges_gdf: gpd.GeoDataFrame, starts: np.ndarray) -> list:
+        """
+        Merges the chains of road segments linked through NEXT_IND from every start segment at once. All chains
+        are walked together, one segment per step, over integer arrays of row positions, such that the lengths and
+        times are summed in the same order as along each chain.
+        :param edges_gdf: Linked Road segments geodataframe
+        :param starts: Row positions of the start segments
+        :return: List of (attr dict, final node) tuples, one per start segment, as returned by merge_road_segments
+        """
+        kph_to_mps_factor = 1000.0/3600.0
+        next_pos, _ = self._index_positions(edges_gdf)
+        lengths = edges_gdf[STD_LENGTH].to_numpy(dtype=np.float64)
+        times = lengths/(edges_gdf[STD_SPEED].to_numpy(dtype=np.float64)*kph_to_mps_factor)
+        is_srn = (edges_gdf[STD_IS_SRN] == 1).to_numpy()
+        indices = edges_gdf[STD_INDEX].to_numpy()
+
+        n = len(starts)
+        current = starts.copy()
+        length = lengths[current].copy()
+        time = times[current].copy()
+        srn = is_srn[current].copy()
+        chain_ids = [np.arange(n)]
+        chain_positions = [current.copy()]
+
+        active = np.flatnonzero(next_pos[current] >= 0)
+        steps = 0
+        while len(active) > 0:
+            steps += 1
+            if steps > len(edges_gdf):
+                raise ValueError(f"Road segments {indices[current[active]].tolist()} are linked in a cycle "
+                                 f"through NEXT_IND")
+            current[active] = next_pos[current[active]]
+            length[active] += lengths[current[active]]
+            time[active] += times[current[active]]
+            srn[active] |= is_srn[current[active]]
+            chain_ids.append(active)
+            chain_positions.append(current[active])
+            active = active[next_pos[current[active]] >= 0]
+
+        # Segment indices of each chain in order, as the steps are appended in order and the sort is stable
+        chain_ids = np.concatenate(chain_ids)
+        order = np.argsort(chain_ids, kind='stable')
+        segments = indices[np.concatenate(chain_positions)[order]].tolist()
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(chain_ids, minlength=n), out=offsets[1:])
+        offsets = offsets.tolist()
+
+        starts_gdf = edges_gdf.iloc[starts]
+        road_ids = (starts_gdf[STD_ROAD_NO] + "_" + starts_gdf[STD_ROAD_TYPE]).tolist()
+        final_nodes = edges_gdf[STD_TO_NODE].to_numpy()[current].tolist()
+
+        chains = []
+        for i, (road_id, chain_length, chain_time, chain_srn) in enumerate(zip(road_ids, length.tolist(),
+                                                                                 time.tolist(), srn.tolist())):
+            attr = {STD_Nx_ROAD_ID: road_id, STD_Nx_LENGTH: chain_length, STD_Nx_TIME: chain_time,
+                    STD_Nx_ROAD_IND: segments[offsets[i]:offsets[i + 1]], STD_Nx_IS_SRN: chain_srn}
+            chains.append((attr, final_nodes[i]))
+
+        return chains
 
     def create_graph(self, nodes_gdf, edges_gdf, weight_type: str = 'Time'):
         """
@@ -183,27 +439,24 @@ class StdRoadGraphBuilder:
         print("Creating Graph")
 
         net = nx.DiGraph()
-        # for each slip road and roundabout node dataframe do:
-        for _, node in nodes_gdf.iterrows():
-            coords = node[STD_GEOMETRY]
-            net.add_node(node.node_id, coordinates=coords)
-
-        start_segments = edges_gdf.loc[(edges_gdf[STD_ROAD_TYPE] == STD_MAIN_CARRIAGEWAY) |
-                                       (edges_gdf[STD_ROAD_TYPE] == STD_SLIP_ROAD)]
-
-        start_segments = start_segments.loc[pd.isna(edges_gdf[STD_PREV_IND])]
-        n = 1
-
-        for index, start_segment in start_segments.iterrows():
-            print(index)
-            segment_index = start_segment[STD_INDEX]
-            from_node = start_segment[STD_FROM_NODE]
-            attr, to_node = self.merge_road_segments(edges_gdf, segment_index)
+        net.add_nodes_from((node_id, {'coordinates': coords}) for node_id, coords in
+                           zip(nodes_gdf[STD_NODE_ID].tolist(), nodes_gdf[STD_GEOMETRY].tolist()))
+
+        # Every main carriageway or slip road segment without a previous segment starts an edge
+        is_start = (edges_gdf[STD_ROAD_TYPE].isin([STD_MAIN_CARRIAGEWAY, STD_SLIP_ROAD]) &
+                    pd.isna(edges_gdf[STD_PREV_IND])).to_numpy()
+        starts = np.flatnonzero(is_start)
+        chains = self._merge_road_chains(edges_gdf, starts)
+        from_nodes = edges_gdf[STD_FROM_NODE].to_numpy()[starts].tolist()
+        is_two_way = (~edges_gdf[STD_IS_DIREC].astype(bool)).to_numpy()[starts].tolist()
+
+        edges = []
+        for from_node, (attr, to_node), two_way in zip(from_nodes, chains, is_two_way):
             weight = attr[STD_Nx_TIME] if weight_type == "Time" else attr[STD_Nx_LENGTH]
-
-            net.add_edge(from_node, to_node, attr=attr, weight=weight)
-            if not start_segment[STD_IS_DIREC]:
-                net.add_edge(to_node, from_node, attr=attr, weight=weight)
+            edges.append((from_node, to_node, {STD_Nx_ATTR: attr, STD_Nx_WEIGHT: weight}))
+            if two_way:
+                edges.append((to_node, from_node, {STD_Nx_ATTR: attr, STD_Nx_WEIGHT: weight}))
+        net.add_edges_from(edges)
 
         print("Finished Graph")
 
@@ -0,0 +1,12 @@
+from RoadGraph.routing.csrgraph import CsrGraph
+from RoadGraph.routing.closuremask import ClosureMask
+from RoadGraph.routing.contractionhierarchy import ContractionHierarchy
+from RoadGraph.routing.crpoverlay import CrpOverlay
+from RoadGraph.routing.shortestpathtree import ShortestPathTree
+from RoadGraph.routing.parallelrouter import ParallelRouter
+from RoadGraph.routing.routepath import RoutePath
+from RoadGraph.routing.kshortestpaths import KShortestPaths
+from RoadGraph.routing.plateaualternatives import PlateauAlternatives
+from RoadGraph.routing.treecache import ShortestPathTreeCache
+from RoadGraph.routing.dynamictree import DynamicShortestPathTree
+from RoadGraph.routing.landmarks import Landmarks
@@ -0,0 +1,76 @@
+import hashlib
+import numpy as np
+from RoadGraph.routing.csrgraph import CsrGraph
+
+
+class ClosureMask:
+    """
+    Set of closed roads over a compiled graph, stored as one flag per edge ID. Closed edges are treated as having an
+    infinite weight by the routing engines, whilst the weights of the underlying graph are left untouched, so that
+    any number of closure scenarios can be evaluated against the same graph (including concurrently).
+
+    The number of closed edges is kept up to date by close, reopen and clear, so the flags must not be modified
+    directly.
+    """
+
+    def __init__(self, csr: CsrGraph, closed: bytearray = None):
+        self.csr = csr
+        self.flags = bytearray(csr.n_edges) if closed is None else bytearray(closed)
+        self._n_closed = 0 if closed is None else int(np.count_nonzero(np.frombuffer(self.flags, dtype=np.uint8)))
+
+    def close(self, from_node: str, to_node: str):
+        """
+        Closes the edge from from_node to to_node
+        """
+        edge = self.csr.edge_id(from_node, to_node)
+        if not self.flags[edge]:
+            self.flags[edge] = 1
+            self._n_closed += 1
+
+    def reopen(self, from_node: str, to_node: str):
+        """
+        Reopens the edge from from_node to to_node
+        """
+        edge = self.csr.edge_id(from_node, to_node)
+        if self.flags[edge]:
+            self.flags[edge] = 0
+            self._n_closed -= 1
+
+    def is_closed(self, from_node: str, to_node: str) -> bool:
+        return bool(self.flags[self.csr.edge_id(from_node, to_node)])
+
+    def clear(self):
+        """
+        Reopens every edge
+        """
+        self.flags = bytearray(self.csr.n_edges)
+        self._n_closed = 0
+
+    def copy(self):
+        return ClosureMask(self.csr, self.flags)
+
+    def edge_ids(self) -> np.ndarray:
+        """
+        :return: Sorted array of the IDs of all closed edges
+        """
+        return np.flatnonzero(np.frombuffer(self.flags, dtype=np.uint8))
+
+    def closed_pairs(self) -> set:
+        """
+        :return: Set of (from node, to node) tuples of all closed edges
+        """
+        edge_ids = self.edge_ids()
+        tails = np.searchsorted(self.csr.indptr, edge_ids, side='right') - 1
+        return set(zip(self.csr.node_ids[tails].tolist(), self.csr.node_ids[self.csr.indices[edge_ids]].tolist()))
+
+    def key(self) -> str:
+        """
+        Fingerprint of the set of closed edges, equal for any two masks closing the same edges
+        """
+        return hashlib.blake2b(self.edge_ids().tobytes(), digest_size=16).hexdigest()
+
+    def __bool__(self) -> bool:
+        return self._n_closed > 0
+
+    def __len__(self) -> int:
+        return self._n_closed
@@ -0,0 +1,306 @@
+from heapq import heappush, heappop, heapify
+from itertools import count
+import numpy as np
+from RoadGraph.routing.csrgraph import CsrGraph, weights_checksum
+
+# Key names used within the saved .npz file
+CH_NODE_IDS = 'node_ids'
+CH_RANK = 'rank'
+CH_TAILS = 'tails'
+CH_HEADS = 'heads'
+CH_WEIGHTS = 'weights'
+CH_MIDDLES = 'middles'
+CH_CHECKSUM = 'checksum'
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy index of a compiled road graph. Nodes are contracted one at a time in order of importance,
+    adding shortcut edges wherever a shortest path would otherwise pass through a contracted node. Each shortcut
+    stores the node it bypasses (its middle node), so that it can be unpacked back into the original edges.
+    Point-to-point queries then only need to search upwards in the hierarchy from both ends.
+
+    The index is only valid for the edge weights it was built with (see checksum).
+    """
+
+    def __init__(self, node_ids: np.ndarray, rank: np.ndarray, tails: np.ndarray, heads: np.ndarray,
+                 weights: np.ndarray, middles: np.ndarray, checksum: str):
+        self.node_ids = node_ids
+        self.rank = rank
+        self.tails = tails
+        self.heads = heads
+        self.weights = weights
+        self.middles = middles
+        self.checksum = checksum
+
+        # Upward edges are searched forwards from the source, downward edges backwards from the target
+        is_up = rank[tails] < rank[heads]
+        self._up = self._adjacency(tails[is_up], heads[is_up], weights[is_up], len(node_ids))
+        self._down = self._adjacency(heads[~is_up], tails[~is_up], weights[~is_up], len(node_ids))
+        self._middle = {(u, v): m for u, v, m in zip(tails.tolist(), heads.tolist(), middles.tolist())}
+
+    @staticmethod
+    def _adjacency(from_nodes: np.ndarray, to_nodes: np.ndarray, weights: np.ndarray, n: int) -> list:
+        """
+        Builds an adjacency list of (neighbour, weight) tuples for every node
+        """
+        adjacency = [[] for _ in range(n)]
+        for u, v, w in zip(from_nodes.tolist(), to_nodes.tolist(), weights.tolist()):
+            adjacency[u].append((v, w))
+        return adjacency
+
+    @classmethod
+    def build(cls, csr: CsrGraph, witness_limit: int = 500, verbose: bool = False):
+        """
+        Builds the contraction hierarchy from the compiled graph.
+        :param csr: Compiled graph
+        :param witness_limit: Maximum number of nodes settled by each witness search. Lower values speed up the
+        preprocessing at the cost of adding redundant shortcuts.
+        :param verbose: If set to true, prints out the progress of the contraction
+        :return: ContractionHierarchy object
+        """
+        n = csr.n_nodes
+        out_edges = [dict() for _ in range(n)]
+        in_edges = [dict() for _ in range(n)]
+        middles = {}
+
+        sources = np.repeat(np.arange(n, dtype=np.int64), np.diff(csr.indptr))
+        for u, v, w in zip(sources.tolist(), csr.indices.tolist(), csr.weights.tolist()):
+            if u == v or w != w:
+                continue
+            if v not in out_edges[u] or w < out_edges[u][v]:
+                out_edges[u][v] = w
+                in_edges[v][u] = w
+                middles[(u, v)] = -1
+
+        contracted = [False] * n
+        deleted_neighbours = [0] * n
+        rank = np.zeros(n, dtype=np.int64)
+
+        def witness_distances(source: int, excluded: int, limit: float, targets: set) -> dict:
+            # Bounded Dijkstra over the uncontracted graph that avoids the node being contracted
+            dist = {source: 0.0}
+            fringe = [(0.0, source)]
+            settled = 0
+            remaining = len(targets)
+            while fringe and settled < witness_limit and remaining > 0:
+                d, v = heappop(fringe)
+                if d > dist[v]:
+                    continue
+                if d > limit:
+                    break
+                settled += 1
+                if v in targets:
+                    remaining -= 1
+                for u, w in out_edges[v].items():
+                    if u == excluded or contracted[u]:
+                        continue
+                    vu_dist = d + w
+                    if u not in dist or vu_dist < dist[u]:
+                        dist[u] = vu_dist
+                        heappush(fringe, (vu_dist, u))
+            return dist
+
+        def shortcuts_needed(v: int) -> list:
+            shortcuts = []
+            successors = [(w, cost) for w, cost in out_edges[v].items() if not contracted[w]]
+            if not successors:
+                return shortcuts
+            for u, in_cost in in_edges[v].items():
+                if contracted[u]:
+                    continue
+                targets = {w for w, _ in successors if w != u}
+                if not targets:
+                    continue
+                limit = in_cost + max(cost for w, cost in successors if w != u)
+                dist = witness_distances(u, v, limit, targets)
+                for w, out_cost in successors:
+                    if w == u:
+                        continue
+                    shortcut = in_cost + out_cost
+                    if dist.get(w, np.inf) > shortcut:
+                        shortcuts.append((u, w, shortcut))
+            return shortcuts
+
+        def priority(v: int) -> int:
+            degree = sum(1 for u in in_edges[v] if not contracted[u]) + \
+                sum(1 for w in out_edges[v] if not contracted[w])
+            return len(shortcuts_needed(v)) - degree + deleted_neighbours[v]
+
+        c = count()
+        queue = [(priority(v), next(c), v) for v in range(n)]
+        heapify(queue)
+        order = 0
+
+        while queue:
+            _, _, v = heappop(queue)
+            if contracted[v]:
+                continue
+
+            # Lazy update: re-insert the node if its priority has become worse than the next candidate
+            current = priority(v)
+            if queue and current > queue[0][0]:
+                heappush(queue, (current, next(c), v))
+                continue
+
+            for u, w, cost in shortcuts_needed(v):
+                if w not in out_edges[u] or cost < out_edges[u][w]:
+                    out_edges[u][w] = cost
+                    in_edges[w][u] = cost
+                    middles[(u, w)] = v
+
+            contracted[v] = True
+            rank[v] = order
+            order += 1
+
+            for u in list(in_edges[v]) + list(out_edges[v]):
+                deleted_neighbours[u] += 1
+
+            if verbose and order % 10000 == 0:
+                print(f"Contracted {order} out of {n} nodes")
+
+        tails, heads, weights, middle_nodes = [], [], [], []
+        for u in range(n):
+            for v, w in out_edges[u].items():
+                tails.append(u)
+                heads.append(v)
+                weights.append(w)
+                middle_nodes.append(middles[(u, v)])
+
+        return cls(csr.node_ids, rank, np.array(tails, dtype=np.int64), np.array(heads, dtype=np.int64),
+                   np.array(weights, dtype=np.float64), np.array(middle_nodes, dtype=np.int64),
+                   weights_checksum(csr.weights))
+
+    def save(self, file_path: str):
+        """
+        Saves the contraction hierarchy as a .npz file
+        :param file_path: Target file path, conventionally next to the roadGraph.pickle file
+        """
+        np.savez(file_path, **{CH_NODE_IDS: self.node_ids.astype(str), CH_RANK: self.rank, CH_TAILS: self.tails,
+                               CH_HEADS: self.heads, CH_WEIGHTS: self.weights, CH_MIDDLES: self.middles,
+                               CH_CHECKSUM: np.array(self.checksum)})
+
+    @classmethod
+    def load(cls, file_path: str):
+        """
+        Loads a contraction hierarchy previously saved through save
+        :param file_path: Path of the .npz file
+        :return: ContractionHierarchy object
+        """
+        with np.load(file_path) as data:
+            return cls(data[CH_NODE_IDS].astype(object), data[CH_RANK], data[CH_TAILS], data[CH_HEADS],
+                       data[CH_WEIGHTS], data[CH_MIDDLES], str(data[CH_CHECKSUM]))
+
+    def is_valid_for(self, csr: CsrGraph) -> bool:
+        """
+        Checks that the hierarchy was built from the same nodes and the same edge weights as csr
+        :param csr: Compiled graph
+        :return: True if the hierarchy can be used to answer queries on csr
+        """
+        return len(self.node_ids) == csr.n_nodes and np.array_equal(self.node_ids, csr.node_ids) and \
+            self.checksum == weights_checksum(csr.weights)
+
+    def _upward_search(self, source: int, adjacency: list) -> (dict, dict):
+        """
+        Dijkstra's algorithm restricted to the edges leading to higher ranked nodes.
+        :return: distances and predecessors of every reached node
+        """
+        dist = {source: 0.0}
+        pred = {source: -1}
+        settled = set()
+        fringe = [(0.0, source)]
+
+        while fringe:
+            d, v = heappop(fringe)
+            if v in settled:
+                continue
+            settled.add(v)
+            for u, w in adjacency[v]:
+                vu_dist = d + w
+                if u not in dist or vu_dist < dist[u]:
+                    dist[u] = vu_dist
+                    pred[u] = v
+                    heappush(fringe, (vu_dist, u))
+
+        return dist, pred
+
+    def query(self, source: int, target: int) -> (float, list):
+        """
+        Finds the shortest path between source and target
+        :param source: Index of the source node
+        :param target: Index of the target node
+        :return: Distance to the target and the list of node indices (in the original graph) forming the path.
+        """
+        if source == target:
+            return 0.0, [source]
+
+        forward_dist, forward_pred = self._upward_search(source, self._up)
+        backward_dist, backward_pred = self._upward_search(target, self._down)
+
+        best = np.inf
+        meeting_node = None
+        for v, d in forward_dist.items():
+            if v in backward_dist and (meeting_node is None or d + backward_dist[v] < best):
+                best = d + backward_dist[v]
+                meeting_node = v
+
+        if meeting_node is None:
+            raise KeyError(self.node_ids[target])
+
+        up_path = [meeting_node]
+        while up_path[-1] != source:
+            up_path.append(forward_pred[up_path[-1]])
+        up_path = up_path[::-1]
+        down_path = [meeting_node]
+        while down_path[-1] != target:
+            down_path.append(backward_pred[down_path[-1]])
+
+        return best, self.unpack_path(up_path + down_path[1:])
+
+    def many_to_many(self, sources: list, targets: list) -> np.ndarray:
+        """
+        Bucket based many-to-many distances. A single downward search is run from each target, storing its
+        distance in a bucket at every node reached. A single upward search is then run from each source, scanning
+        the buckets of every node it reaches.
+        :param sources: List of source node indices
+        :param targets: List of target node indices
+        :return: Matrix of shortest distances of shape (len(sources), len(targets)), inf where unreachable
+        """
+        buckets = {}
+        for j, target in enumerate(targets):
+            backward_dist, _ = self._upward_search(target, self._down)
+            for v, d in backward_dist.items():
+                buckets.setdefault(v, []).append((j, d))
+
+        matrix = np.full((len(sources), len(targets)), np.inf)
+        for i, source in enumerate(sources):
+            row = matrix[i]
+            forward_dist, _ = self._upward_search(source, self._up)
+            for v, d in forward_dist.items():
+                for j, backward_d in buckets.get(v, ()):
+                    if d + backward_d < row[j]:
+                        row[j] = d + backward_d
+
+        return matrix
+
+    def unpack_path(self, path: list) -> list:
+        """
+        Replaces every shortcut edge within path with the original edges it represents
+        :param path: List of node indices, adjacent nodes may be linked through shortcut edges
+        :return: List of node indices where adjacent nodes are linked by original edges
+        """
+        if len(path) < 2:
+            return list(path)
+
+        unpacked = [path[0]]
+        stack = [(path[i], path[i + 1]) for i in range(len(path) - 2, -1, -1)]
+        while stack:
+            u, v = stack.pop()
+            middle = self._middle[(u, v)]
+            if middle < 0:
+                unpacked.append(v)
+            else:
+                stack.append((middle, v))
+                stack.append((u, middle))
+
+        return unpacked
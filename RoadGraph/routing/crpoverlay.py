@@ -0,0 +1,236 @@
+from collections import OrderedDict
+from heapq import heappush, heappop
+from itertools import count
+import numpy as np
+from RoadGraph.routing.csrgraph import CsrGraph
+from RoadGraph.routing.closuremask import ClosureMask
+
+# Number of closure scenarios whose customized cells are kept
+MAX_CACHED_METRICS = 8
+
+
+class CrpOverlay:
+    """
+    Customizable route planning overlay of a compiled road graph. The nodes are partitioned into cells by recursive
+    bisection of their coordinates, which does not depend on the edge weights. For every cell, the customization
+    step computes the shortest distances between the nodes where the cell is entered and the nodes where it is
+    exited, using only the edges inside the cell. Queries then skip across every cell other than those of the source
+    and target through these precomputed distances.
+
+    Edges between cells are read directly from the compiled graph at query time. Queries under a set of road
+    closures only customize the cells containing closed edges, on top of the base customization. The result is
+    cached per closure scenario, so the base customization itself is never modified by closures.
+    """
+
+    def __init__(self, csr: CsrGraph, cell_size: int = 256):
+        self.csr = csr
+        self.cell_size = cell_size
+        self.cells = self._partition(csr, cell_size)
+        self.n_cells = int(self.cells.max()) + 1 if csr.n_nodes > 0 else 0
+
+        sources = np.repeat(np.arange(csr.n_nodes, dtype=np.int64), np.diff(csr.indptr))
+        self._edge_cells = self.cells[sources]
+        self._is_cut_edge = self._edge_cells != self.cells[csr.indices]
+        self._cell_of = self.cells.tolist()
+
+        cut_sources = sources[self._is_cut_edge]
+        cut_targets = csr.indices[self._is_cut_edge]
+        self.cell_entries = [[] for _ in range(self.n_cells)]
+        self.cell_exits = [[] for _ in range(self.n_cells)]
+        for v in np.unique(cut_targets).tolist():
+            self.cell_entries[self._cell_of[v]].append(v)
+        for v in np.unique(cut_sources).tolist():
+            self.cell_exits[self._cell_of[v]].append(v)
+
+        self._clique = [dict() for _ in range(self.n_cells)]
+        self._clique_pred = [dict() for _ in range(self.n_cells)]
+        self._metrics = OrderedDict()
+        self.customize()
+
+    @staticmethod
+    def _partition(csr: CsrGraph, cell_size: int) -> np.ndarray:
+        """
+        Recursively splits the nodes in half along the axis with the largest spread of coordinates, until every
+        cell holds at most cell_size nodes.
+        :return: Array of the cell number of every node
+        """
+        n = csr.n_nodes
+        cells = np.zeros(n, dtype=np.int64)
+        coordinates = csr.coordinates if csr.coordinates is not None else \
+            np.column_stack([np.arange(n, dtype=np.float64), np.zeros(n)])
+
+        stack = [np.arange(n, dtype=np.int64)]
+        cell = 0
+        while stack:
+            members = stack.pop()
+            if len(members) <= cell_size:
+                cells[members] = cell
+                cell += 1
+                continue
+
+            spread = np.nanmax(coordinates[members], axis=0) - np.nanmin(coordinates[members], axis=0)
+            axis = int(np.argmax(np.nan_to_num(spread)))
+            members = members[np.argsort(coordinates[members, axis], kind='stable')]
+            half = len(members) // 2
+            stack.append(members[half:])
+            stack.append(members[:half])
+
+        return cells
+
+    def _cell_search(self, cell: int, entry: int, closed: bytearray) -> (dict, dict):
+        """
+        Dijkstra's algorithm from entry that only uses the edges inside cell.
+        :return: distances and predecessors of every reached node within the cell
+        """
+        indptr, indices, weights = self.csr._search_adjacency()
+        cell_of = self._cell_of
+
+        dist = {entry: 0.0}
+        pred = {entry: -1}
+        settled = set()
+        c = count()
+        fringe = [(0.0, next(c), entry)]
+
+        while fringe:
+            d, _, v = heappop(fringe)
+            if v in settled:
+                continue
+            settled.add(v)
+            for e in range(indptr[v], indptr[v + 1]):
+                cost = weights[e]
+                u = indices[e]
+                if cost != cost or cell_of[u] != cell or u in settled:
+                    continue
+                if closed[e]:
+                    cost = np.inf
+                vu_dist = d + cost
+                if u not in dist or vu_dist < dist[u]:
+                    dist[u] = vu_dist
+                    pred[u] = v
+                    heappush(fringe, (vu_dist, next(c), u))
+
+        return dist, pred
+
+    def customize(self, cells: list = None):
+        """
+        Computes the entry to exit distances of each cell based on the current edge weights of the compiled graph.
+        :param cells: Optional list of cells to customize, if left as None then every cell is customized
+        """
+        cells = range(self.n_cells) if cells is None else cells
+        no_closures = self.csr._closed_flags(None)
+
+        for cell in cells:
+            self._clique[cell], self._clique_pred[cell] = self._customize_cell(cell, no_closures)
+
+        self._metrics.clear()
+
+    def _customize_cell(self, cell: int, closed: bytearray) -> (dict, dict):
+        """
+        :return: Entry to exit distances of cell, and the predecessors of each entry's search for unpacking paths
+        """
+        clique = {}
+        clique_pred = {}
+        exits = self.cell_exits[cell]
+        for entry in self.cell_entries[cell]:
+            dist, pred = self._cell_search(cell, entry, closed)
+            clique[entry] = [(v, dist[v]) for v in exits if v in dist and v != entry]
+            clique_pred[entry] = pred
+        return clique, clique_pred
+
+    def _metric(self, closures: ClosureMask) -> (list, list, bytearray):
+        """
+        Customization of the overlay under a set of road closures. Only the cells containing closed edges are
+        customized again, all other cells share the base customization.
+        :return: Entry to exit distances and predecessors of every cell, and the closure flags per edge ID
+        """
+        if closures is None or not closures:
+            return self._clique, self._clique_pred, self.csr._closed_flags(None)
+
+        key = closures.key()
+        if key in self._metrics:
+            self._metrics.move_to_end(key)
+            return self._metrics[key]
+
+        closed = bytes(closures.flags)
+        edge_ids = closures.edge_ids()
+        cells = np.unique(self._edge_cells[edge_ids[~self._is_cut_edge[edge_ids]]]).tolist()
+        clique, clique_pred = list(self._clique), list(self._clique_pred)
+        for cell in cells:
+            clique[cell], clique_pred[cell] = self._customize_cell(cell, closed)
+
+        self._metrics[key] = (clique, clique_pred, closed)
+        if len(self._metrics) > MAX_CACHED_METRICS:
+            self._metrics.popitem(last=False)
+        return self._metrics[key]
+
+    def query(self, source: int, target: int, closures: ClosureMask = None) -> (float, list):
+        """
+        Finds the shortest path between source and target through the overlay.
+        :param source: Index of the source node
+        :param target: Index of the target node
+        :param closures: Optional set of closed roads, which are given an infinite weight
+        :return: Distance to the target and the list of node indices forming the path.
+        """
+        if source == target:
+            return 0.0, [source]
+
+        cliques, clique_preds, closed = self._metric(closures)
+        indptr, indices, weights = self.csr._search_adjacency()
+        cell_of = self._cell_of
+        source_cell, target_cell = cell_of[source], cell_of[target]
+
+        dist = {source: 0.0}
+        # Predecessor of each node, and the cell whose precomputed distances were used to reach it (-1 otherwise)
+        pred = {source: (-1, -1)}
+        settled = set()
+        c = count()
+        fringe = [(0.0, next(c), source)]
+
+        while fringe:
+            d, _, v = heappop(fringe)
+            if v in settled:
+                continue
+            settled.add(v)
+            if v == target:
+                break
+
+            cell = cell_of[v]
+            is_local = cell == source_cell or cell == target_cell
+
+            if not is_local:
+                for u, cost in cliques[cell].get(v, ()):
+                    vu_dist = d + cost
+                    if u not in settled and (u not in dist or vu_dist < dist[u]):
+                        dist[u] = vu_dist
+                        pred[u] = (v, cell)
+                        heappush(fringe, (vu_dist, next(c), u))
+
+            for e in range(indptr[v], indptr[v + 1]):
+                cost = weights[e]
+                u = indices[e]
+                if cost != cost or u in settled or (not is_local and cell_of[u] == cell):
+                    continue
+                if closed[e]:
+                    cost = np.inf
+                vu_dist = d + cost
+                if u not in dist or vu_dist < dist[u]:
+                    dist[u] = vu_dist
+                    pred[u] = (v, -1)
+                    heappush(fringe, (vu_dist, next(c), u))
+
+        if target not in settled:
+            raise KeyError(self.csr.node_ids[target])
+
+        path = [target]
+        while path[-1] != source:
+            v, cell = pred[path[-1]]
+            if cell >= 0:
+                # Unpack the path inside the cell from the predecessors of its customization search
+                cell_pred = clique_preds[cell][v]
+                u = cell_pred[path[-1]]
+                while u != v:
+                    path.append(u)
+                    u = cell_pred[u]
+            path.append(v)
+
+        return dist[target], path[::-1]
@@ -0,0 +1,451 @@
+import hashlib
+from heapq import heappush, heappop
+from itertools import count
+from math import hypot
+import numpy as np
+import networkx as nx
+from RoadGraph.constants.StdColNames import *
+
+
+def weights_checksum(weights: np.ndarray) -> str:
+    """
+    Fingerprint of a weights array, used to check whether an index was built with the current edge weights.
+    :param weights: Array of edge weights
+    :return: Hex digest of the weights
+    """
+    return hashlib.blake2b(np.ascontiguousarray(weights, dtype=np.float64).tobytes(), digest_size=16).hexdigest()
+
+
+class CsrGraph:
+    """
+    Compiled representation of a road graph. Node IDs are mapped onto integer indices, and the adjacency of the
+    networkx.DiGraph is flattened into NumPy CSR arrays (indptr/indices/weights), such that the successors of node i
+    are stored in indices[indptr[i]:indptr[i + 1]]. The position of an edge in these arrays is its edge ID.
+
+    Searches normally run over Python list copies of the arrays. Shared graphs, whose arrays are memory mapped or
+    held in shared memory, are searched over the arrays themselves instead, so that every process keeps reading the
+    same physical pages rather than holding a private copy of the graph.
+    """
+
+    def __init__(self, node_ids: np.ndarray, indptr: np.ndarray, indices: np.ndarray, weights: np.ndarray,
+                 coordinates: np.ndarray = None, shared: bool = False):
+        self.node_ids = node_ids
+        self.node_index = {node_id: i for i, node_id in enumerate(node_ids.tolist())}
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.coordinates = coordinates
+        self.shared = shared
+        self._adjacency = None
+        self._reverse_adjacency = None
+        self._coordinate_lists = None
+        self._heuristic_factor = None
+        self._no_closures = None
+        self._weights_key = None
+
+    @classmethod
+    def from_networkx(cls, net: nx.DiGraph, weight: str = STD_Nx_WEIGHT):
+        """
+        Compiles the networkx graph into CSR arrays. The order of the successors of each node is kept the same as
+        within the networkx graph, so that searches over both representations break ties in the same manner.
+        :param net: Networkx DiGraph of the road network
+        :param weight: Name of the edge attribute to be used as the weight. Missing weights are stored as NaN.
+        :return: CsrGraph object of net
+        """
+        node_ids = np.array(list(net.nodes), dtype=object)
+        node_index = {node_id: i for i, node_id in enumerate(node_ids.tolist())}
+
+        coordinates = np.full((len(node_ids), 2), np.nan, dtype=np.float64)
+        for i, node_id in enumerate(node_ids.tolist()):
+            point = net.nodes[node_id].get('coordinates')
+            if point is not None:
+                coordinates[i] = point.coords[0][0:2]
+
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        indices = []
+        weights = []
+        for i, node_id in enumerate(node_ids.tolist()):
+            for neighbour, data in net.succ[node_id].items():
+                indices.append(node_index[neighbour])
+                edge_weight = data.get(weight)
+                weights.append(np.nan if edge_weight is None else edge_weight)
+            indptr[i + 1] = len(indices)
+
+        return cls(node_ids, indptr, np.array(indices, dtype=np.int64), np.array(weights, dtype=np.float64),
+                   coordinates)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+    @property
+    def weights_key(self) -> str:
+        """
+        Checksum of the edge weights, computed once per compiled graph. Identifies the weights that results cached
+        against this graph were computed with.
+        """
+        if self._weights_key is None:
+            self._weights_key = weights_checksum(self.weights)
+        return self._weights_key
+
+    def edge_id(self, from_node: str, to_node: str) -> int:
+        """
+        Returns the position of the edge between from_node and to_node within the CSR arrays
+        :param from_node: Name of the first node
+        :param to_node: Name of the second node
+        :return: Edge ID
+        """
+        u = self.node_index[from_node]
+        v = self.node_index[to_node]
+        start, end = self.indptr[u], self.indptr[u + 1]
+        positions = np.nonzero(self.indices[start:end] == v)[0]
+
+        if len(positions) == 0:
+            raise KeyError(f"No edge exists between {from_node} and {to_node}")
+
+        return int(start + positions[0])
+
+    def _closed_flags(self, closed: bytearray = None) -> bytearray:
+        """
+        :param closed: Closure flags per edge ID, or None if no edges are closed
+        :return: closed, or a shared all-zero set of flags (which must not be modified) if closed is None
+        """
+        if closed is not None:
+            return closed
+        if self._no_closures is None or len(self._no_closures) != self.n_edges:
+            self._no_closures = bytearray(self.n_edges)
+        return self._no_closures
+
+    def _search_adjacency(self) -> tuple:
+        """
+        CSR arrays indexed element by element within the heap loops of the searches. Python list copies are used
+        unless the graph is shared, as indexing into lists is considerably faster than indexing into NumPy arrays.
+        :return: indptr, indices and weights as lists, or as plain ndarray views of the shared arrays
+        """
+        if self._adjacency is None:
+            if self.shared:
+                self._adjacency = (np.asarray(self.indptr), np.asarray(self.indices), np.asarray(self.weights))
+            else:
+                self._adjacency = (self.indptr.tolist(), self.indices.tolist(), self.weights.tolist())
+        return self._adjacency
+
+    def _search_reverse_adjacency(self) -> tuple:
+        """
+        CSR arrays of the reversed graph, as lists unless the graph is shared (see _search_adjacency). Each reversed
+        edge stores the ID of its forward edge rather than a copy of its weight, so that both directions read the
+        same weights.
+        :return: indptr, predecessor indices and forward edge IDs
+        """
+        if self._reverse_adjacency is None:
+            sources = np.repeat(np.arange(self.n_nodes, dtype=np.int64), np.diff(self.indptr))
+            order = np.argsort(self.indices, kind='stable')
+            indptr = np.zeros(self.n_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.indices, minlength=self.n_nodes), out=indptr[1:])
+            self._reverse_adjacency = (indptr, sources[order], order)
+            if not self.shared:
+                self._reverse_adjacency = tuple(array.tolist() for array in self._reverse_adjacency)
+        return self._reverse_adjacency
+
+    def heuristic_factor(self) -> float:
+        """
+        Smallest ratio of edge weight to the straight line distance between its two nodes. Multiplying the
+        straight line distance between any node and the target by this factor never overestimates the remaining
+        weight (for time weights it corresponds to the inverse of the fastest effective speed), so it is an
+        admissible and consistent heuristic. Closures only increase weights, and so do not invalidate it.
+        :return: The factor, or 0.0 if no lower bound can be established.
+        """
+        if self._heuristic_factor is None:
+            if self.coordinates is None or self.n_edges == 0:
+                self._heuristic_factor = 0.0
+                return self._heuristic_factor
+
+            sources = np.repeat(np.arange(self.n_nodes, dtype=np.int64), np.diff(self.indptr))
+            deltas = self.coordinates[sources] - self.coordinates[self.indices]
+            lengths = np.hypot(deltas[:, 0], deltas[:, 1])
+            valid = (lengths > 0) & np.isfinite(self.weights)
+            if np.any(np.isnan(lengths)) or not np.any(valid):
+                self._heuristic_factor = 0.0
+            else:
+                self._heuristic_factor = max(float(np.min(self.weights[valid] / lengths[valid])), 0.0)
+        return self._heuristic_factor
+
+    def _search_coordinates(self) -> tuple:
+        """
+        :return: x and y coordinates of every node, as lists unless the graph is shared (see _search_adjacency)
+        """
+        if self._coordinate_lists is None:
+            coordinates = np.asarray(self.coordinates)
+            if self.shared:
+                self._coordinate_lists = (coordinates[:, 0], coordinates[:, 1])
+            else:
+                self._coordinate_lists = (coordinates[:, 0].tolist(), coordinates[:, 1].tolist())
+        return self._coordinate_lists
+
+    def dijkstra(self, source: int, target: int = None, cutoff: float = None, targets: list = None,
+                 closed: bytearray = None) -> (np.ndarray, np.ndarray):
+        """
+        Dijkstra's algorithm over the CSR arrays. Edges with an infinite weight are still relaxed, such that a
+        target that is only reachable through closed roads is returned with an infinite distance (and a
+        corresponding path), mirroring StdRoadGraph.dijkstra.
+
+        :param source: Index of the source node
+        :param target: Optional index of the target node, the search stops as soon as it is settled
+        :param cutoff: Optional maximum distance to search up to
+        :param targets: Optional list of target node indices, the search stops as soon as all of them are settled
+        :param closed: Optional closure flags per edge ID (see ClosureMask), closed edges are given an infinite weight
+        :return: dist - array of distances of every settled node (inf otherwise)
+                 pred - array of the predecessor index of every reached node (-1 otherwise)
+        """
+        indptr, indices, weights = self._search_adjacency()
+        closed = self._closed_flags(closed)
+        n = len(indptr) - 1
+
+        dist = [np.inf] * n
+        seen = [np.inf] * n
+        pred = [-1] * n
+        reached = bytearray(n)
+        settled = bytearray(n)
+
+        c = count()
+        fringe = []
+        seen[source] = 0
+        reached[source] = 1
+        heappush(fringe, (0, next(c), source))
+        remaining = set(targets) if targets is not None else None
+
+        while fringe:
+            (d, _, v) = heappop(fringe)
+            if settled[v]:
+                continue
+            settled[v] = 1
+            dist[v] = d
+            if v == target:
+                break
+            if remaining is not None:
+                remaining.discard(v)
+                if not remaining:
+                    break
+
+            for e in range(indptr[v], indptr[v + 1]):
+                cost = weights[e]
+                if cost != cost:
+                    continue
+                if closed[e]:
+                    cost = np.inf
+                u = indices[e]
+                vu_dist = d + cost
+                if cutoff is not None and vu_dist > cutoff:
+                    continue
+                if settled[u]:
+                    if vu_dist < dist[u]:
+                        raise ValueError('Contradictory paths found:', 'negative weights?')
+                elif not reached[u] or vu_dist < seen[u]:
+                    reached[u] = 1
+                    seen[u] = vu_dist
+                    pred[u] = v
+                    heappush(fringe, (vu_dist, next(c), u))
+
+        return np.array(dist, dtype=np.float64), np.array(pred, dtype=np.int64)
+
+    def reverse_dijkstra(self, target: int, closed: bytearray = None) -> (np.ndarray, np.ndarray):
+        """
+        Dijkstra's algorithm backwards from target over the reversed edges, giving the shortest path tree of every
+        node towards target. As with dijkstra, edges with an infinite weight are still relaxed.
+        :param target: Index of the target node
+        :param closed: Optional closure flags per edge ID, closed edges are given an infinite weight
+        :return: dist - array of distances from every settled node to the target (inf otherwise)
+                 succ - array of the next node index towards the target of every reached node (-1 otherwise)
+        """
+        indptr, sources, edge_ids = self._search_reverse_adjacency()
+        weights = self._search_adjacency()[2]
+        closed = self._closed_flags(closed)
+        n = self.n_nodes
+
+        dist = [np.inf] * n
+        seen = [np.inf] * n
+        succ = [-1] * n
+        reached = bytearray(n)
+        settled = bytearray(n)
+
+        c = count()
+        fringe = [(0, next(c), target)]
+        seen[target] = 0
+        reached[target] = 1
+
+        while fringe:
+            (d, _, v) = heappop(fringe)
+            if settled[v]:
+                continue
+            settled[v] = 1
+            dist[v] = d
+
+            for r in range(indptr[v], indptr[v + 1]):
+                e = edge_ids[r]
+                cost = weights[e]
+                if cost != cost:
+                    continue
+                if closed[e]:
+                    cost = np.inf
+                u = sources[r]
+                vu_dist = d + cost
+                if not settled[u] and (not reached[u] or vu_dist < seen[u]):
+                    reached[u] = 1
+                    seen[u] = vu_dist
+                    succ[u] = v
+                    heappush(fringe, (vu_dist, next(c), u))
+
+        return np.array(dist, dtype=np.float64), np.array(succ, dtype=np.int64)
+
+    def astar(self, source: int, target: int, closed: bytearray = None) -> (float, list):
+        """
+        A* search from source to target, guided by the straight line distance to the target scaled by
+        heuristic_factor.
+        :param source: Index of the source node
+        :param target: Index of the target node
+        :param closed: Optional closure flags per edge ID, closed edges are given an infinite weight
+        :return: Distance to the target and the list of node indices forming the path. The distance is inf if the
+        target can only be reached through closed roads, in which case the path is arbitrary.
+        """
+        indptr, indices, weights = self._search_adjacency()
+        closed = self._closed_flags(closed)
+        factor = self.heuristic_factor()
+        xs, ys = self._search_coordinates() if factor > 0 else (None, None)
+        x_t, y_t = (xs[target], ys[target]) if factor > 0 else (0.0, 0.0)
+
+        g_score = {source: 0.0}
+        pred = {source: -1}
+        settled = set()
+
+        c = count()
+        fringe = []
+        heappush(fringe, (0.0, next(c), source))
+
+        while fringe:
+            (_, _, v) = heappop(fringe)
+            if v in settled:
+                continue
+            settled.add(v)
+            if v == target:
+                break
+
+            d = g_score[v]
+            for e in range(indptr[v], indptr[v + 1]):
+                cost = weights[e]
+                if cost != cost:
+                    continue
+                if closed[e]:
+                    cost = np.inf
+                u = indices[e]
+                if u in settled:
+                    continue
+                vu_dist = d + cost
+                if u not in g_score or vu_dist < g_score[u]:
+                    g_score[u] = vu_dist
+                    pred[u] = v
+                    h = factor * hypot(xs[u] - x_t, ys[u] - y_t) if factor > 0 else 0.0
+                    heappush(fringe, (vu_dist + h, next(c), u))
+
+        if target not in settled:
+            raise KeyError(self.node_ids[target])
+
+        path = [target]
+        while path[-1] != source:
+            path.append(pred[path[-1]])
+
+        return g_score[target], path[::-1]
+
+    def bidirectional_dijkstra(self, source: int, target: int, closed: bytearray = None) -> (float, list):
+        """
+        Bidirectional Dijkstra's algorithm, growing one search forwards from source and another backwards from
+        target until the sum of the smallest keys of both queues is at least the best path found so far.
+        :param source: Index of the source node
+        :param target: Index of the target node
+        :param closed: Optional closure flags per edge ID, closed edges are given an infinite weight
+        :return: Distance to the target and the list of node indices forming the path. The distance is inf if the
+        target can only be reached through closed roads, in which case the path is arbitrary.
+        """
+        if source == target:
+            return 0.0, [source]
+
+        closed = self._closed_flags(closed)
+        adjacency = self._search_adjacency()
+        weights = adjacency[2]
+        rev_indptr, rev_sources, rev_edges = self._search_reverse_adjacency()
+
+        dists = [{source: 0.0}, {target: 0.0}]
+        preds = [{source: -1}, {target: -1}]
+        settled = [set(), set()]
+        fringes = [[(0.0, 0, source)], [(0.0, 0, target)]]
+        c = count(1)
+        best = np.inf
+        meeting_node = None
+
+        while fringes[0] and fringes[1]:
+            if fringes[0][0][0] + fringes[1][0][0] >= best and meeting_node is not None:
+                break
+
+            direction = 0 if fringes[0][0][0] <= fringes[1][0][0] else 1
+            (d, _, v) = heappop(fringes[direction])
+            if v in settled[direction]:
+                continue
+            settled[direction].add(v)
+
+            dist, other_dist, pred = dists[direction], dists[1 - direction], preds[direction]
+
+            if direction == 0:
+                indptr, neighbours = adjacency[0], adjacency[1]
+                edge_ids = range(len(neighbours))
+            else:
+                indptr, neighbours, edge_ids = rev_indptr, rev_sources, rev_edges
+
+            for i in range(indptr[v], indptr[v + 1]):
+                e = edge_ids[i]
+                cost = weights[e]
+                if cost != cost:
+                    continue
+                if closed[e]:
+                    cost = np.inf
+                u = neighbours[i]
+                vu_dist = d + cost
+                if u in settled[direction]:
+                    continue
+                if u not in dist or vu_dist < dist[u]:
+                    dist[u] = vu_dist
+                    pred[u] = v
+                    heappush(fringes[direction], (vu_dist, next(c), u))
+                if u in other_dist and (meeting_node is None or dist[u] + other_dist[u] < best):
+                    best = dist[u] + other_dist[u]
+                    meeting_node = u
+
+        if meeting_node is None:
+            raise KeyError(self.node_ids[target])
+
+        path = [meeting_node]
+        while path[-1] != source:
+            path.append(preds[0][path[-1]])
+        path = path[::-1]
+        while path[-1] != target:
+            path.append(preds[1][path[-1]])
+
+        return best, path
+
+    def path_from_predecessors(self, pred: np.ndarray, source: int, target: int) -> list:
+        """
+        Rebuilds the path from source to target by walking back through the predecessor array
+        :param pred: Array of predecessors, as returned by dijkstra
+        :param source: Index of the source node
+        :param target: Index of the target node
+        :return: List of node IDs from source to target
+        """
+        if target != source and pred[target] < 0:
+            raise KeyError(self.node_ids[target])
+
+        path = [target]
+        while path[-1] != source:
+            path.append(pred[path[-1]])
+
+        return self.node_ids[path[::-1]].tolist()
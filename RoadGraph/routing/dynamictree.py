@@ -0,0 +1,184 @@
+from heapq import heappush, heappop
+from itertools import count
+import numpy as np
+from RoadGraph.routing.csrgraph import CsrGraph
+from RoadGraph.routing.shortestpathtree import ShortestPathTree
+
+
+class DynamicShortestPathTree:
+    """
+    Full shortest path tree that is repaired for a different set of road closures rather than grown again, in the
+    manner of Ramalingam and Reps.
+
+    Closing an edge can only lengthen the paths through it, so only the subtree hanging below each newly closed tree
+    edge is affected. Those nodes are first reattached to their cheapest unaffected in-neighbour, then settled by a
+    Dijkstra search confined to the affected region. Reopening an edge can only shorten paths, so its head is
+    improved where the reopened edge offers a shorter path, and the improvement is propagated onwards for as long as
+    it lowers distances. Edges that are both newly closed and reopened are handled by applying the closures first.
+
+    Every repair starts from the base tree, so repairs for different closure sets are independent of each other.
+    As in CsrGraph.dijkstra, closed edges are still relaxed with an infinite weight. The distances are exact, though
+    the repaired tree may pick a different path than a fresh search amongst paths of equal distance.
+    """
+
+    def __init__(self, csr: CsrGraph, tree: ShortestPathTree, closed: bytearray = None):
+        """
+        :param csr: Compiled graph
+        :param tree: Full shortest path tree, as grown by CsrGraph.dijkstra without a target
+        :param closed: Closure flags per edge ID the tree was grown under
+        """
+        self.csr = csr
+        self.tree = tree
+        self.closed = bytes(csr._closed_flags(closed))
+
+        # Children of every node in the base tree, as contiguous runs of the nodes sorted by predecessor
+        order = np.argsort(tree.pred, kind='stable')
+        sorted_pred = tree.pred[order]
+        nodes = np.arange(csr.n_nodes)
+        self._children = order.tolist()
+        self._child_start = np.searchsorted(sorted_pred, nodes, side='left').tolist()
+        self._child_end = np.searchsorted(sorted_pred, nodes, side='right').tolist()
+
+        self._last_closed = self.closed
+        self._last_tree = tree
+
+    def _subtree(self, roots: list) -> set:
+        """
+        :return: Set of the nodes within the base tree's subtrees rooted at roots
+        """
+        affected = set(roots)
+        stack = list(roots)
+        while stack:
+            v = stack.pop()
+            for i in range(self._child_start[v], self._child_end[v]):
+                child = self._children[i]
+                if child not in affected:
+                    affected.add(child)
+                    stack.append(child)
+        return affected
+
+    def repair(self, closed: bytearray = None) -> ShortestPathTree:
+        """
+        Repairs the base tree for a different set of closed edges. The last repaired tree is kept, so repeated
+        queries under the same closures are not repaired again.
+        :param closed: Closure flags per edge ID (see ClosureMask.flags)
+        :return: ShortestPathTree under the given closures
+        """
+        closed = self.csr._closed_flags(closed)
+        if closed == self._last_closed:
+            return self._last_tree
+
+        base_closed = np.frombuffer(self.closed, dtype=np.uint8)
+        new_closed = np.frombuffer(closed, dtype=np.uint8)
+        changed = np.flatnonzero(base_closed != new_closed)
+        tails = (np.searchsorted(self.csr.indptr, changed, side='right') - 1).tolist()
+        heads = self.csr.indices[changed].tolist()
+        changed = changed.tolist()
+
+        dist = self.tree.dist.copy()
+        pred = self.tree.pred.copy()
+
+        roots = [v for u, v, e in zip(tails, heads, changed) if closed[e] and pred[v] == u]
+        if roots:
+            # Edges closed in either set, such that the first phase only lengthens distances
+            either_closed = bytearray(np.bitwise_or(base_closed, new_closed).tobytes())
+            self._reattach(self._subtree(roots), dist, pred, either_closed)
+
+        reopened = [(u, v, e) for u, v, e in zip(tails, heads, changed) if not closed[e]]
+        if reopened:
+            self._improve(reopened, dist, pred, closed)
+
+        self._last_closed = bytes(closed)
+        self._last_tree = ShortestPathTree(self.csr, self.tree.source, dist, pred)
+        return self._last_tree
+
+    def _reattach(self, affected: set, dist: np.ndarray, pred: np.ndarray, closed: bytearray):
+        """
+        Settles the affected nodes again, seeding each with its cheapest edge from an unaffected node.
+        """
+        indptr, indices, weights = self.csr._search_adjacency()
+        reverse_indptr, sources, edge_ids = self.csr._search_reverse_adjacency()
+        source = self.tree.source
+
+        for v in affected:
+            dist[v] = np.inf
+            pred[v] = -1
+
+        seen = {}
+        c = count()
+        fringe = []
+        for v in affected:
+            for r in range(reverse_indptr[v], reverse_indptr[v + 1]):
+                u = sources[r]
+                if u in affected or (pred[u] < 0 and u != source):
+                    continue
+                e = edge_ids[r]
+                cost = weights[e]
+                if cost != cost:
+                    continue
+                if closed[e]:
+                    cost = np.inf
+                uv_dist = dist[u] + cost
+                if v not in seen or uv_dist < seen[v]:
+                    seen[v] = uv_dist
+                    pred[v] = u
+            if v in seen:
+                heappush(fringe, (seen[v], next(c), v))
+
+        settled = set()
+        while fringe:
+            d, _, v = heappop(fringe)
+            if v in settled:
+                continue
+            settled.add(v)
+            dist[v] = d
+            for e in range(indptr[v], indptr[v + 1]):
+                u = indices[e]
+                if u not in affected or u in settled:
+                    continue
+                cost = weights[e]
+                if cost != cost:
+                    continue
+                if closed[e]:
+                    cost = np.inf
+                vu_dist = d + cost
+                if u not in seen or vu_dist < seen[u]:
+                    seen[u] = vu_dist
+                    pred[u] = v
+                    heappush(fringe, (vu_dist, next(c), u))
+
+    def _improve(self, reopened: list, dist: np.ndarray, pred: np.ndarray, closed: bytearray):
+        """
+        Propagates the shorter distances offered by the reopened (from node, to node, edge ID) edges.
+        """
+        indptr, indices, weights = self.csr._search_adjacency()
+        source = self.tree.source
+        c = count()
+        fringe = []
+
+        for u, v, e in reopened:
+            cost = weights[e]
+            if cost != cost or (pred[u] < 0 and u != source):
+                continue
+            uv_dist = dist[u] + cost
+            if uv_dist < dist[v] or (pred[v] < 0 and v != source):
+                dist[v] = uv_dist
+                pred[v] = u
+                heappush(fringe, (uv_dist, next(c), v))
+
+        while fringe:
+            d, _, v = heappop(fringe)
+            if d > dist[v]:
+                continue
+            for e in range(indptr[v], indptr[v + 1]):
+                cost = weights[e]
+                if cost != cost:
+                    continue
+                if closed[e]:
+                    cost = np.inf
+                u = indices[e]
+                vu_dist = d + cost
+                if vu_dist < dist[u] or (pred[u] < 0 and u != source):
+                    dist[u] = vu_dist
+                    pred[u] = v
+                    heappush(fringe, (vu_dist, next(c), u))
@@ -0,0 +1,191 @@
+from heapq import heappush, heappop
+from itertools import count
+from RoadGraph.routing.csrgraph import CsrGraph
+
+
+class KShortestPaths:
+    """
+    Yen's k shortest loopless paths towards a fixed target over a compiled graph.
+
+    A single shortest path tree is grown backwards from the target. Its distances are exact lower bounds of the
+    remaining distance in every spur graph (removing nodes and edges can only lengthen paths), so each spur search
+    first checks whether the tree path from the spur node avoids the removed nodes and edges, in which case it is
+    already the shortest spur path. Otherwise an A* search guided by the tree distances is run.
+    """
+
+    def __init__(self, csr: CsrGraph, target: int, closed: bytearray = None):
+        """
+        :param csr: Compiled graph
+        :param target: Index of the target node
+        :param closed: Optional closure flags per edge ID, closed edges are given an infinite weight
+        """
+        self.csr = csr
+        self.target = target
+        self.closed = csr._closed_flags(closed)
+        self.dist_to_target, self.next_hop, self.next_edge = self._reverse_tree()
+
+    def _reverse_tree(self) -> (list, list, list):
+        """
+        Dijkstra's algorithm from the target over the reversed edges.
+        :return: distance to the target, next node and next edge ID towards the target for every node (None
+        for nodes that cannot reach the target)
+        """
+        indptr, sources, edge_ids = self.csr._search_reverse_adjacency()
+        weights = self.csr._search_adjacency()[2]
+        closed = self.closed
+        n = self.csr.n_nodes
+
+        dist = [None] * n
+        seen = [None] * n
+        next_hop = [-1] * n
+        next_edge = [-1] * n
+        settled = bytearray(n)
+
+        c = count()
+        fringe = [(0.0, next(c), self.target)]
+        seen[self.target] = 0.0
+
+        while fringe:
+            d, _, v = heappop(fringe)
+            if settled[v]:
+                continue
+            settled[v] = 1
+            dist[v] = d
+            for r in range(indptr[v], indptr[v + 1]):
+                e = edge_ids[r]
+                cost = weights[e]
+                if cost != cost:
+                    continue
+                if closed[e]:
+                    cost = float('inf')
+                u = sources[r]
+                vu_dist = d + cost
+                if not settled[u] and (seen[u] is None or vu_dist < seen[u]):
+                    seen[u] = vu_dist
+                    next_hop[u] = v
+                    next_edge[u] = e
+                    heappush(fringe, (vu_dist, next(c), u))
+
+        return dist, next_hop, next_edge
+
+    def _tree_path(self, spur: int, blocked_nodes: set, blocked_edges: set) -> list:
+        """
+        Path from spur to the target along the shortest path tree, or None if it crosses a removed node or edge
+        """
+        path = [spur]
+        v = spur
+        while v != self.target:
+            if self.next_edge[v] in blocked_edges:
+                return None
+            v = self.next_hop[v]
+            if v in blocked_nodes:
+                return None
+            path.append(v)
+        return path
+
+    def _spur_search(self, spur: int, blocked_nodes: set, blocked_edges: set) -> (float, list):
+        """
+        A* search from spur to the target avoiding the removed nodes and edges, guided by the tree distances.
+        :return: Distance and path to the target, or (None, None) if the target cannot be reached
+        """
+        indptr, indices, weights = self.csr._search_adjacency()
+        closed = self.closed
+        h = self.dist_to_target
+        target = self.target
+
+        g_score = {spur: 0.0}
+        pred = {spur: -1}
+        settled = set()
+        c = count()
+        fringe = [(h[spur], next(c), spur)]
+
+        while fringe:
+            _, _, v = heappop(fringe)
+            if v in settled:
+                continue
+            settled.add(v)
+            if v == target:
+                break
+
+            d = g_score[v]
+            for e in range(indptr[v], indptr[v + 1]):
+                cost = weights[e]
+                u = indices[e]
+                if cost != cost or u in settled or u in blocked_nodes or e in blocked_edges or h[u] is None:
+                    continue
+                if closed[e]:
+                    cost = float('inf')
+                vu_dist = d + cost
+                if u not in g_score or vu_dist < g_score[u]:
+                    g_score[u] = vu_dist
+                    pred[u] = v
+                    heappush(fringe, (vu_dist + h[u], next(c), u))
+
+        if target not in settled:
+            return None, None
+
+        path = [target]
+        while path[-1] != spur:
+            path.append(pred[path[-1]])
+        return g_score[target], path[::-1]
+
+    def _edge(self, from_index: int, to_index: int) -> int:
+        indptr, indices, _ = self.csr._search_adjacency()
+        for e in range(indptr[from_index], indptr[from_index + 1]):
+            if indices[e] == to_index:
+                return e
+        raise KeyError((self.csr.node_ids[from_index], self.csr.node_ids[to_index]))
+
+    def paths(self, source: int, k: int) -> list:
+        """
+        Finds up to k shortest loopless paths from source to the target, in order of increasing distance.
+        :param source: Index of the source node
+        :param k: Number of paths to find
+        :return: List of (distance, list of node indices) tuples
+        """
+        if k <= 0 or self.dist_to_target[source] is None:
+            return []
+
+        weights = self.csr._search_adjacency()[2]
+        closed = self.closed
+        first = self._tree_path(source, set(), set())
+        found = [(self.dist_to_target[source], first)]
+        found_edges = [[self._edge(first[i], first[i + 1]) for i in range(len(first) - 1)]]
+        candidates = []
+        candidate_paths = {tuple(first)}
+        c = count()
+
+        while len(found) < k:
+            _, previous = found[-1]
+            previous_edges = found_edges[-1]
+            root_cost = 0.0
+
+            for i in range(len(previous) - 1):
+                spur = previous[i]
+                root = previous[:i + 1]
+                blocked_nodes = set(root[:-1])
+                blocked_edges = {edges[i] for (_, path), edges in zip(found, found_edges)
+                                 if len(path) > i + 1 and path[:i + 1] == root}
+
+                spur_path = self._tree_path(spur, blocked_nodes, blocked_edges)
+                if spur_path is not None:
+                    spur_cost = self.dist_to_target[spur]
+                else:
+                    spur_cost, spur_path = self._spur_search(spur, blocked_nodes, blocked_edges)
+
+                if spur_path is not None:
+                    path = root[:-1] + spur_path
+                    if tuple(path) not in candidate_paths:
+                        candidate_paths.add(tuple(path))
+                        heappush(candidates, (root_cost + spur_cost, next(c), path))
+
+                root_cost += float('inf') if closed[previous_edges[i]] else weights[previous_edges[i]]
+
+            if not candidates:
+                break
+
+            cost, _, path = heappop(candidates)
+            found.append((cost, path))
+            found_edges.append([self._edge(path[i], path[i + 1]) for i in range(len(path) - 1)])
+
+        return found
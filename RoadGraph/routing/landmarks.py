@@ -0,0 +1,195 @@
+from heapq import heappush, heappop
+from itertools import count
+import numpy as np
+from RoadGraph.routing.csrgraph import CsrGraph, weights_checksum
+
+LM_NODE_IDS = 'node_ids'
+LM_LANDMARKS = 'landmarks'
+LM_CHECKSUM = 'checksum'
+# Relative rounding error of the float32 distances, subtracted from every bound to keep it admissible
+FLOAT32_SLACK = 2.0 ** -23
+
+
+class Landmarks:
+    """
+    Landmark distances for goal directed (ALT: A*, landmarks and the triangle inequality) queries over a compiled
+    graph. For every landmark L, the distances from L to every node and from every node to L give lower bounds of
+    the distance between any two nodes:
+
+        d(v, t) >= d(L, t) - d(L, v)  and  d(v, t) >= d(v, L) - d(t, L)
+
+    The distances are held as a float32 matrix with one row per node, holding the distances from each landmark
+    followed by the distances to each landmark. Road closures only increase distances, so bounds computed with the
+    distances of the open graph remain admissible whilst roads are closed.
+    """
+
+    def __init__(self, node_ids: np.ndarray, landmarks: np.ndarray, distances: np.ndarray, checksum: str):
+        self.node_ids = node_ids
+        self.landmarks = landmarks
+        self.distances = distances
+        self.checksum = checksum
+
+    @property
+    def n_landmarks(self) -> int:
+        return len(self.landmarks)
+
+    @classmethod
+    def build(cls, csr: CsrGraph, n_landmarks: int = 16, verbose: bool = False):
+        """
+        Selects landmarks through farthest point selection: each landmark is the node farthest from all previously
+        selected landmarks (in either direction), starting from the node farthest from the first node.
+        :param csr: Compiled graph
+        :param n_landmarks: Number of landmarks
+        :param verbose: If set to true, prints out the progress of the selection
+        :return: Landmarks object
+        """
+        n = csr.n_nodes
+        distances = np.empty((n, 2 * n_landmarks), dtype=np.float32)
+        landmarks = []
+
+        closest = csr.dijkstra(0)[0]
+        for i in range(n_landmarks):
+            reachable = np.isfinite(closest)
+            if not reachable.any():
+                break
+            landmark = int(np.argmax(np.where(reachable, closest, -1.0)))
+            if i > 0 and closest[landmark] == 0.0:
+                break
+
+            from_landmark = csr.dijkstra(landmark)[0]
+            to_landmark = csr.reverse_dijkstra(landmark)[0]
+            distances[:, i] = from_landmark
+            distances[:, n_landmarks + i] = to_landmark
+            landmarks.append(landmark)
+
+            distance = np.minimum(from_landmark, to_landmark)
+            closest = distance if i == 0 else np.minimum(closest, distance)
+            if verbose:
+                print(f"Landmark {i + 1}/{n_landmarks}: {csr.node_ids[landmark]}")
+
+        if len(landmarks) < n_landmarks:
+            distances = np.hstack([distances[:, :len(landmarks)],
+                                   distances[:, n_landmarks:n_landmarks + len(landmarks)]])
+
+        return cls(csr.node_ids, np.array(landmarks, dtype=np.int64), distances, weights_checksum(csr.weights))
+
+    @staticmethod
+    def _meta_path(file_path: str) -> str:
+        stem = file_path[:-len('.npy')] if file_path.endswith('.npy') else file_path
+        return stem + '_meta.npz'
+
+    def save(self, file_path: str):
+        """
+        Saves the distance matrix as a .npy file, such that it can be memory mapped by load, and the landmarks
+        alongside it in a _meta.npz file.
+        :param file_path: Path of the .npy file
+        """
+        np.save(file_path, np.ascontiguousarray(self.distances, dtype=np.float32))
+        np.savez(self._meta_path(file_path), **{LM_NODE_IDS: self.node_ids.astype(str), LM_LANDMARKS: self.landmarks,
+                                                LM_CHECKSUM: np.array(self.checksum)})
+
+    @classmethod
+    def load(cls, file_path: str):
+        """
+        Loads landmarks previously saved through save. The distance matrix is memory mapped rather than read.
+        :param file_path: Path of the .npy file
+        :return: Landmarks object
+        """
+        distances = np.load(file_path, mmap_mode='r')
+        with np.load(cls._meta_path(file_path)) as data:
+            return cls(data[LM_NODE_IDS].astype(object), data[LM_LANDMARKS], distances, str(data[LM_CHECKSUM]))
+
+    def is_valid_for(self, csr: CsrGraph) -> bool:
+        """
+        Checks that the landmarks were built from the same nodes and the same edge weights as csr
+        :param csr: Compiled graph
+        :return: True if the landmark bounds are admissible on csr
+        """
+        return len(self.node_ids) == csr.n_nodes and np.array_equal(self.node_ids, csr.node_ids) and \
+            self.checksum == weights_checksum(csr.weights)
+
+    def _bounds(self, target: int):
+        """
+        :param target: Index of the target node
+        :return: function returning the lower bounds of the distances from a list of node indices to target
+        """
+        k = self.n_landmarks
+        distances = self.distances
+        target_row = np.asarray(distances[target], dtype=np.float64)
+
+        # Landmarks that cannot reach (or be reached from) the target give no bound. The remaining bounds are
+        # offset + coefficient * distance of the node, with the float32 rounding slack folded into both terms.
+        forward = np.flatnonzero(np.isfinite(target_row[:k]))
+        backward = np.flatnonzero(np.isfinite(target_row[k:]))
+        columns = np.concatenate([forward, k + backward])
+        offsets = np.concatenate([target_row[forward] * (1.0 - FLOAT32_SLACK),
+                                  -target_row[k + backward] * (1.0 + FLOAT32_SLACK)])
+        coefficients = np.concatenate([np.full(len(forward), -(1.0 + FLOAT32_SLACK)),
+                                       np.full(len(backward), 1.0 - FLOAT32_SLACK)])
+
+        def bounds(nodes: list) -> list:
+            if len(columns) == 0:
+                return [0.0] * len(nodes)
+            rows = np.asarray(distances[nodes], dtype=np.float64)[:, columns]
+            return np.maximum((rows * coefficients + offsets).max(axis=1), 0.0).tolist()
+
+        return bounds
+
+    def query(self, csr: CsrGraph, source: int, target: int, closed: bytearray = None) -> (float, list):
+        """
+        A* search from source to target, guided by the landmark bounds. Nodes are settled again if a shorter path
+        to them is found later on, so that the float32 rounding of the bounds cannot affect the distance found.
+        :param csr: Compiled graph the landmarks were built from
+        :param source: Index of the source node
+        :param target: Index of the target node
+        :param closed: Optional closure flags per edge ID, closed edges are given an infinite weight
+        :return: Distance to the target and the list of node indices forming the path. The distance is inf if the
+        target can only be reached through closed roads, in which case the path is arbitrary.
+        """
+        indptr, indices, weights = csr._search_adjacency()
+        closed = csr._closed_flags(closed)
+        bounds = self._bounds(target)
+        h = {source: 0.0}
+
+        g_score = {source: 0.0}
+        pred = {source: -1}
+        expanded = {}
+
+        c = count()
+        fringe = [(0.0, next(c), source)]
+
+        while fringe:
+            (_, _, v) = heappop(fringe)
+            d = g_score[v]
+            if v in expanded and expanded[v] <= d:
+                continue
+            expanded[v] = d
+            if v == target:
+                break
+
+            # Bounds are computed for all new neighbours at once
+            unbounded = [u for u in indices[indptr[v]:indptr[v + 1]] if u not in h]
+            if unbounded:
+                h.update(zip(unbounded, bounds(unbounded)))
+
+            for e in range(indptr[v], indptr[v + 1]):
+                cost = weights[e]
+                if cost != cost:
+                    continue
+                if closed[e]:
+                    cost = np.inf
+                u = indices[e]
+                vu_dist = d + cost
+                if u not in g_score or vu_dist < g_score[u]:
+                    g_score[u] = vu_dist
+                    pred[u] = v
+                    heappush(fringe, (vu_dist + h[u], next(c), u))
+
+        if target not in expanded:
+            raise KeyError(self.node_ids[target])
+
+        path = [target]
+        while path[-1] != source:
+            path.append(pred[path[-1]])
+
+        return g_score[target], path[::-1]
@@ -0,0 +1,104 @@
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+from RoadGraph.routing.csrgraph import CsrGraph
+from RoadGraph.routing.closuremask import ClosureMask
+
+# Compiled graph attached to the shared memory blocks within each worker process
+_worker_csr = None
+_worker_blocks = None
+
+
+def _attach_worker(n_nodes: int, blocks: list):
+    """
+    Pool initializer, maps the shared CSR arrays into the worker process without copying them. The worker searches
+    over the shared arrays directly (see CsrGraph).
+    :param n_nodes: Number of nodes in the compiled graph
+    :param blocks: List of (shared memory name, shape, dtype) for indptr, indices and weights
+    """
+    global _worker_csr, _worker_blocks
+    _worker_blocks = [SharedMemory(name=name) for name, _, _ in blocks]
+    indptr, indices, weights = [np.ndarray(shape, dtype=dtype, buffer=block.buf)
+                                for block, (_, shape, dtype) in zip(_worker_blocks, blocks)]
+    _worker_csr = CsrGraph(np.arange(n_nodes), indptr, indices, weights, shared=True)
+
+
+def _search(task: tuple) -> (list, dict):
+    """
+    Runs a single source search within a worker.
+    :param task: Tuple of the source index, list of target indices and list of closed edge IDs
+    :return: Distances to the targets, and the predecessors of every node on the paths to the reached targets
+    """
+    source, targets, closed_edges = task
+    closed = None
+    if closed_edges:
+        closed = bytearray(_worker_csr.n_edges)
+        for e in closed_edges:
+            closed[e] = 1
+    dist, pred = _worker_csr.dijkstra(source, targets=targets, closed=closed)
+
+    path_pred = {}
+    for target in targets:
+        v = target
+        while v != source and v not in path_pred and pred[v] >= 0:
+            path_pred[v] = int(pred[v])
+            v = path_pred[v]
+
+    return dist[targets].tolist(), path_pred
+
+
+class ParallelRouter:
+    """
+    Runs batches of single source searches over a compiled graph in a pool of worker processes. The CSR arrays are
+    copied once into shared memory and mapped by every worker, rather than pickling the graph to each of them.
+
+    The edge weights are snapshotted when the router is created. Road closures are instead passed along with each
+    batch as a list of closed edge IDs, so that different closure scenarios can share the same router. Results are
+    returned in the order of the sources and are identical to running the searches serially through
+    CsrGraph.dijkstra.
+    """
+
+    def __init__(self, csr: CsrGraph, processes: int = None):
+        self.csr = csr
+        self._blocks = []
+        descriptors = []
+        for array in (csr.indptr, csr.indices, csr.weights):
+            block = SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            self._blocks.append(block)
+            descriptors.append((block.name, array.shape, array.dtype.str))
+
+        self._pool = Pool(processes, initializer=_attach_worker, initargs=(csr.n_nodes, descriptors))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Shuts down the worker processes and releases the shared memory
+        """
+        self._pool.close()
+        self._pool.join()
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def one_to_many(self, sources: list, targets: list, closures: ClosureMask = None) -> list:
+        """
+        Runs one search per source, each stopping once all of its targets are settled.
+        :param sources: List of source node indices
+        :param targets: List of target node indices, or a list of such lists (one per source)
+        :param closures: Optional set of closed roads, which are given an infinite weight
+        :return: List of (distances to the targets, predecessor dict of the nodes on the paths to the targets) per
+        source, in the order of sources
+        """
+        if len(targets) > 0 and not isinstance(targets[0], (list, tuple, np.ndarray)):
+            targets = [targets] * len(sources)
+
+        closed_edges = closures.edge_ids().tolist() if closures is not None else []
+        tasks = [(source, list(source_targets), closed_edges) for source, source_targets in zip(sources, targets)]
+        return self._pool.map(_search, tasks, chunksize=1)
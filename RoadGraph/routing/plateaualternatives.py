@@ -0,0 +1,91 @@
+import numpy as np
+from RoadGraph.routing.csrgraph import CsrGraph
+
+
+class PlateauAlternatives:
+    """
+    Alternative routes between two nodes through the plateau method. A full shortest path tree is grown forwards
+    from the source and another backwards from the target. Edges that lie on both trees form chains (plateaus), and
+    every plateau gives a via path: the forward tree path up to the start of the plateau, the plateau itself, and the
+    backward tree path from its end. Long plateaus correspond to routes that are locally optimal over a long stretch,
+    which makes them natural alternatives, all found from just the two searches.
+    """
+
+    def __init__(self, csr: CsrGraph, source: int, target: int, closed: bytearray = None):
+        """
+        :param csr: Compiled graph
+        :param source: Index of the source node
+        :param target: Index of the target node
+        :param closed: Optional closure flags per edge ID, closed edges are given an infinite weight
+        """
+        self.csr = csr
+        self.source = source
+        self.target = target
+        self.forward_dist, self.forward_pred = csr.dijkstra(source, closed=closed)
+        self.backward_dist, self.backward_succ = csr.reverse_dijkstra(target, closed=closed)
+
+        if source != target and self.backward_succ[source] < 0:
+            raise KeyError(csr.node_ids[target])
+
+    @property
+    def shortest_distance(self) -> float:
+        return float(self.backward_dist[self.source])
+
+    def _plateaus(self) -> list:
+        """
+        Finds every chain of edges shared by the forward and backward trees.
+        :return: List of (first node, last node) of each plateau
+        """
+        csr = self.csr
+        tails = np.repeat(np.arange(csr.n_nodes, dtype=np.int64), np.diff(csr.indptr))
+        heads = csr.indices
+        on_plateau = (self.forward_pred[heads] == tails) & (self.backward_succ[tails] == heads)
+
+        plateau_tails = tails[on_plateau]
+        plateau_heads = heads[on_plateau]
+        # Each node has at most one plateau edge leaving it (its tree successor) and one entering it (its tree
+        # predecessor), so plateaus start at the tails that are not also heads
+        starts = np.setdiff1d(plateau_tails, plateau_heads)
+        next_on_plateau = dict(zip(plateau_tails.tolist(), plateau_heads.tolist()))
+
+        plateaus = []
+        for start in starts.tolist():
+            end = start
+            while end in next_on_plateau:
+                end = next_on_plateau[end]
+            plateaus.append((start, end))
+        return plateaus
+
+    def via_path(self, start: int, end: int) -> list:
+        """
+        Builds the path from the source to the target through the plateau from start to end.
+        :return: List of node indices
+        """
+        head = [start]
+        while head[-1] != self.source:
+            head.append(self.forward_pred[head[-1]])
+        path = head[::-1]
+        while path[-1] != self.target:
+            path.append(self.backward_succ[path[-1]])
+        return [int(v) for v in path]
+
+    def candidates(self, max_stretch: float):
+        """
+        Via paths whose distance is within (1 + max_stretch) times the shortest distance, ordered from the longest
+        plateau to the shortest. Paths that visit a node more than once are discarded.
+        :param max_stretch: Maximum relative increase in distance over the shortest path
+        :return: a generator of (distance, list of node indices), paths are only built as they are consumed
+        """
+        limit = self.shortest_distance * (1.0 + max_stretch)
+        plateaus = []
+        for start, end in self._plateaus():
+            distance = self.forward_dist[start] + self.backward_dist[start]
+            if distance <= limit:
+                plateau_weight = self.forward_dist[end] - self.forward_dist[start]
+                plateaus.append((-plateau_weight, distance, start, end))
+        plateaus.sort()
+
+        for _, distance, start, end in plateaus:
+            path = self.via_path(start, end)
+            if len(set(path)) == len(path):
+                yield float(distance), path
@@ -0,0 +1,139 @@
+import numpy as np
+from shapely.geometry import LineString
+from RoadGraph.util import extract_list_of_coords_from_geom_object
+from RoadGraph.constants.StdColNames import *
+
+
+class RoutePath:
+    """
+    Lightweight result of a shortest path query on a StdRoadGraph. Only the node ids and the distance found by the
+    search are stored upfront; the road segment indices, the total time and length, and the geometric views of the
+    path (edges and nodes GeoDataFrames, coordinates and LineString) are each built on first access and then cached.
+    """
+
+    def __init__(self, road_graph, node_ids: list, distance: float):
+        """
+        :param road_graph: StdRoadGraph the path was found in
+        :param node_ids: List of node ids forming the path
+        :param distance: Shortest distance returned by the search, in units of the graph's edge weights
+        """
+        self.road_graph = road_graph
+        self.node_ids = np.array(node_ids, dtype=object)
+        self.distance = distance
+        self._segment_indices = None
+        self._time = None
+        self._length = None
+        self._gdfs = None
+        self._coordinates = None
+        self._line_string = None
+
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def _node_pairs(self) -> list:
+        return [(self.node_ids[i], self.node_ids[i + 1]) for i in range(len(self.node_ids) - 1)]
+
+    def _total(self, attribute: str) -> float:
+        """
+        :param attribute: Either STD_Nx_TIME or STD_Nx_LENGTH
+        :return: Sum of the attribute over the edges of the path
+        """
+        return float(sum(self.road_graph._edge_attribute(u, v, attribute) for u, v in self._node_pairs()))
+
+    @property
+    def segment_indices(self) -> np.ndarray:
+        """
+        Indices (STD_INDEX) of the road segments along the path, in order of travel
+        """
+        if self._segment_indices is None:
+            self._segment_indices = np.array(self.road_graph.path_segment_indices(self.node_ids.tolist()))
+        return self._segment_indices
+
+    @property
+    def time(self) -> float:
+        """
+        Total travel time along the path in seconds, regardless of road closures
+        """
+        if self._time is None:
+            self._time = self._total(STD_Nx_TIME)
+        return self._time
+
+    @property
+    def length(self) -> float:
+        """
+        Total length of the path
+        """
+        if self._length is None:
+            self._length = self._total(STD_Nx_LENGTH)
+        return self._length
+
+    @property
+    def edges_gdf(self):
+        """
+        Edges GeoDataFrame of the path, as returned by StdRoadGraph.convert_path_to_gdfs
+        """
+        return self._path_gdfs()[0]
+
+    @property
+    def nodes_gdf(self):
+        """
+        Nodes GeoDataFrame of the path, as returned by StdRoadGraph.convert_path_to_gdfs
+        """
+        return self._path_gdfs()[1]
+
+    def _path_gdfs(self) -> tuple:
+        if self._gdfs is None:
+            self._gdfs = self.road_graph.convert_path_to_gdfs(self.node_ids.tolist())
+        return self._gdfs
+
+    @property
+    def coordinates(self) -> np.ndarray:
+        """
+        Array of x-y coordinates of shape (n, 2) tracing the road segments of the path in order of travel
+        """
+        if self._coordinates is None:
+            self._coordinates = self._trace_coordinates()
+        return self._coordinates
+
+    @property
+    def line_string(self) -> LineString:
+        """
+        Single LineString merging the road segments of the path
+        """
+        if self._line_string is None:
+            self._line_string = LineString(self.coordinates) if len(self.coordinates) > 1 else LineString()
+        return self._line_string
+
+    def _trace_coordinates(self) -> np.ndarray:
+        """
+        Chains the coordinates of every road segment along the path. Segments of an edge are stored in the
+        direction the road was digitised, so both the order of the segments and the coordinates within each segment
+        are reversed where needed to follow the direction of travel.
+        """
+        if len(self.node_ids) == 0:
+            return np.empty((0, 2))
+
+        _, edge_rows, _ = self.road_graph._row_maps()
+        geometries = self.road_graph.edges[STD_GEOMETRY].values
+        coordinates = [self.road_graph._node_xy(self.node_ids[0])]
+
+        for u, v in self._node_pairs():
+            segments = [np.array(extract_list_of_coords_from_geom_object(geometries[edge_rows[index][0]]))[:, :2]
+                        for index in self.road_graph._road_segment_indices(u, v) if index in edge_rows]
+            if not segments:
+                continue
+
+            current = np.array(coordinates[-1])
+            first_end = min(np.hypot(*(segments[0][0] - current)), np.hypot(*(segments[0][-1] - current)))
+            last_end = min(np.hypot(*(segments[-1][0] - current)), np.hypot(*(segments[-1][-1] - current)))
+            if last_end < first_end:
+                segments = segments[::-1]
+
+            for segment in segments:
+                current = np.array(coordinates[-1])
+                if np.hypot(*(segment[-1] - current)) < np.hypot(*(segment[0] - current)):
+                    segment = segment[::-1]
+                start_at = 1 if np.allclose(segment[0], current) else 0
+                coordinates.extend(map(tuple, segment[start_at:]))
+
+        return np.array(coordinates, dtype=np.float64)
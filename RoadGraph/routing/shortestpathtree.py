@@ -0,0 +1,43 @@
+import numpy as np
+from RoadGraph.routing.csrgraph import CsrGraph
+
+
+class ShortestPathTree:
+    """
+    Result of a single source search over a compiled graph. Holds the distance and predecessor arrays, from which
+    the shortest path to any settled node can be rebuilt on demand. Searches run by ParallelRouter only return the
+    distances to their targets and the predecessors along the paths to them, in which case dist and pred are dicts
+    keyed by node index, and any node missing from them is treated as not settled.
+    """
+
+    def __init__(self, csr: CsrGraph, source: int, dist, pred):
+        self.csr = csr
+        self.source = source
+        self.dist = dist
+        self.pred = pred
+
+    @property
+    def source_node(self) -> str:
+        return self.csr.node_ids[self.source]
+
+    def distance_to(self, target_node: str) -> float:
+        """
+        :param target_node: Name of target node
+        :return: Shortest distance from the source to target_node, inf if it was not settled by the search. Trees of
+        ParallelRouter searches also return inf for any node other than the source and the targets.
+        """
+        target = self.csr.node_index[target_node]
+        if isinstance(self.dist, dict):
+            return 0.0 if target == self.source else float(self.dist.get(target, np.inf))
+        return float(self.dist[target])
+
+    def path_to(self, target_node: str) -> list:
+        """
+        :param target_node: Name of target node
+        :return: List of node IDs forming the shortest path from the source to target_node. Raises a KeyError if
+        target_node was not reached, or for trees of ParallelRouter searches, if it is not on the path to a target.
+        """
+        target = self.csr.node_index[target_node]
+        if isinstance(self.pred, dict) and target != self.source and target not in self.pred:
+            raise KeyError(target_node)
+        return self.csr.path_from_predecessors(self.pred, self.source, target)
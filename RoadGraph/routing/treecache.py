@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from RoadGraph.routing.shortestpathtree import ShortestPathTree
+
+DEFAULT_TREE_CACHE_BYTES = 256 * 1024 ** 2
+# Number of tracked sources that have missed the cache, beyond which the oldest are forgotten
+MAX_TRACKED_MISSES = 4096
+
+
+class ShortestPathTreeCache:
+    """
+    Least recently used cache of full (one-to-all) shortest path trees, bounded by the memory taken up by their
+    distance and predecessor arrays. Trees are keyed by (source index, weights key, closure key), so that trees
+    grown under different edge weights or closure scenarios never answer each other's queries.
+
+    Growing a full tree costs more than a single point-to-point query, so a key is only considered hot once it has
+    missed the cache promote_after times. Callers check hot before growing and inserting a tree.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_TREE_CACHE_BYTES, promote_after: int = 2):
+        """
+        :param max_bytes: Memory budget of the cached arrays, least recently used trees are evicted beyond it
+        :param promote_after: Number of misses of a key after which it is worth growing its full tree
+        """
+        self.max_bytes = max_bytes
+        self.promote_after = promote_after
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._trees = OrderedDict()
+        self._missed = OrderedDict()
+
+    @staticmethod
+    def _tree_nbytes(tree: ShortestPathTree) -> int:
+        return tree.dist.nbytes + tree.pred.nbytes
+
+    def get(self, key: tuple) -> ShortestPathTree:
+        """
+        :param key: (source index, weights key, closure key)
+        :return: The cached tree, or None on a miss
+        """
+        tree = self._trees.get(key)
+        if tree is not None:
+            self._trees.move_to_end(key)
+            self.hits += 1
+            return tree
+
+        self.misses += 1
+        self._missed[key] = self._missed.pop(key, 0) + 1
+        if len(self._missed) > MAX_TRACKED_MISSES:
+            self._missed.popitem(last=False)
+        return None
+
+    def hot(self, key: tuple) -> bool:
+        """
+        :return: True if key has missed often enough for its full tree to be grown and cached
+        """
+        return self._missed.get(key, 0) >= self.promote_after
+
+    def put(self, key: tuple, tree: ShortestPathTree):
+        """
+        Caches a full shortest path tree, evicting the least recently used trees until it fits within the budget.
+        Trees larger than the whole budget are not cached.
+        """
+        nbytes = self._tree_nbytes(tree)
+        if nbytes > self.max_bytes:
+            return
+
+        if key in self._trees:
+            self.nbytes -= self._tree_nbytes(self._trees.pop(key))
+        while self._trees and self.nbytes + nbytes > self.max_bytes:
+            _, evicted = self._trees.popitem(last=False)
+            self.nbytes -= self._tree_nbytes(evicted)
+
+        self._trees[key] = tree
+        self.nbytes += nbytes
+        self._missed.pop(key, None)
+
+    def clear(self):
+        self._trees.clear()
+        self._missed.clear()
+        self.nbytes = 0
+
+    def __contains__(self, key: tuple) -> bool:
+        return key in self._trees
+
+    def __len__(self) -> int:
+        return len(self._trees)
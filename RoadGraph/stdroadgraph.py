@@ -1,25 +1,391 @@
 import collections
 from heapq import heappush, heappop
-from itertools import count, islice
+from itertools import count
 import numpy as np
 import geopandas as gpd
 import pandas as pd
-from RoadGraph.util import euclidean_distance, extract_coord_at_index
+from RoadGraph.util import extract_coord_at_index
 from RoadGraph.constants.StdColNames import *
 from RoadGraph.constants.StdKeyWords import *
+from RoadGraph.routing import CsrGraph, ContractionHierarchy, CrpOverlay, ShortestPathTree, \
+    ParallelRouter, ClosureMask, RoutePath, KShortestPaths, PlateauAlternatives, ShortestPathTreeCache, \
+    DynamicShortestPathTree, Landmarks
+from RoadGraph.routing.treecache import DEFAULT_TREE_CACHE_BYTES
+from RoadGraph.storage import CompactGraph
+from RoadGraph.storage.gdfstorage import find_gdf, read_gdf
 import matplotlib.pyplot as plt
 import networkx as nx
+from scipy.spatial import cKDTree
+
+# Shortest path algorithms
+DIJKSTRA = 'dijkstra'
+ASTAR = 'astar'
+BIDIRECTIONAL = 'bidirectional'
+CONTRACTION_HIERARCHY = 'ch'
+CRP = 'crp'
+ALT = 'alt'
 
 
 class StdRoadGraph:
 
-    def __init__(self, netx_graph, nodes_gdf, edges_gdf):
+    def __init__(self, netx_graph, nodes_gdf, edges_gdf, compiled: bool = False, algorithm: str = DIJKSTRA,
+                 compact: CompactGraph = None):
+        """
+        :param netx_graph: Networkx DiGraph of the road network, may be None if compact is given
+        :param nodes_gdf: Nodes GeoDataFrame, may be None if it is to be loaded on first use (see open)
+        :param edges_gdf: Edges GeoDataFrame, may be None if it is to be loaded on first use (see open)
+        :param compiled: If set to true, Dijkstra's algorithm runs over the compiled CSR arrays
+        :param algorithm: Default shortest path algorithm, see shortest_path_between_nodes
+        :param compact: Optional compact form of the graph. Its (memory mapped) arrays are then used as the compiled
+        graph without copying them, and the networkx graph is only rebuilt from them if self.net is accessed.
+        """
+        self._compact = compact
+        self._nodes_path = None
+        self._edges_path = None
         self.net = netx_graph
+        self._node_tree = None
+        self._node_rows = None
+        self._edge_rows = None
+        self._roundabout_rows = None
         self.nodes = nodes_gdf
         self.edges = edges_gdf
+        self.compiled = compiled or netx_graph is None
+        self.algorithm = algorithm
+        self._csr = None
+        self._ch = None
+        self._landmarks = None
+        self._crp = None
+        self._closures = None
+        self.tree_cache = None
+
+    @classmethod
+    def open(cls, directory: str, nodes_path: str = None, edges_path: str = None, algorithm: str = DIJKSTRA):
+        """
+        Opens a prebuilt compact graph (see CompactGraph) read-only. Its arrays are memory mapped, such that any
+        number of processes opening the same graph share the same physical pages. The networkx graph and the nodes
+        and edges GeoDataFrames are only loaded if accessed.
+        :param directory: Directory of the compact graph
+        :param nodes_path: Path of the nodes GeoDataFrame, defaults to the nodes file within directory of any storage
+        backend (see GdfStorage)
+        :param edges_path: Path of the edges GeoDataFrame, defaults to the edges file within directory of any storage
+        backend
+        :param algorithm: Default shortest path algorithm, see shortest_path_between_nodes
+        :return: StdRoadGraph
+        """
+        road_graph = cls(None, None, None, algorithm=algorithm, compact=CompactGraph.load(directory, mmap_mode='r'))
+        road_graph._nodes_path = nodes_path if nodes_path else find_gdf(directory, 'nodes')
+        road_graph._edges_path = edges_path if edges_path else find_gdf(directory, 'edges')
+        return road_graph
+
+    @property
+    def net(self) -> nx.DiGraph:
+        if self._net is None and self._compact is not None:
+            self._net = self._compact.to_networkx()
+        return self._net
+
+    @net.setter
+    def net(self, netx_graph: nx.DiGraph):
+        self._net = netx_graph
+
+    @property
+    def nodes(self) -> gpd.GeoDataFrame:
+        if self._nodes is None and self._nodes_path is not None:
+            self.nodes = read_gdf(self._nodes_path)
+        return self._nodes
+
+    @nodes.setter
+    def nodes(self, nodes_gdf: gpd.GeoDataFrame):
+        self._nodes = nodes_gdf
+        self._node_tree = None
+        self._node_rows = None
+
+    @property
+    def edges(self) -> gpd.GeoDataFrame:
+        if self._edges is None and self._edges_path is not None:
+            self.edges = read_gdf(self._edges_path)
+        return self._edges
+
+    @edges.setter
+    def edges(self, edges_gdf: gpd.GeoDataFrame):
+        self._edges = edges_gdf
+        self._edge_rows = None
+        self._roundabout_rows = None
+
+    def _row_maps(self) -> (dict, dict, dict):
+        """
+        Maps from node ids and road segment indices onto their row positions within self.nodes and self.edges, built
+        on first use and rebuilt whenever self.nodes or self.edges is reassigned.
+        :return: node_id -> node rows, segment INDEX -> edge rows, roundabout node_id -> rows of the roundabout
+        segments starting from it. Row positions are held in arrays in ascending order.
+        """
+        if self._node_rows is None:
+            self._node_rows = self.nodes.groupby(STD_NODE_ID, sort=False).indices
+        if self._edge_rows is None:
+            self._edge_rows = self.edges.groupby(STD_INDEX, sort=False).indices
+        if self._roundabout_rows is None:
+            roundabout_positions = np.flatnonzero((self.edges[STD_ROAD_TYPE] == STD_ROUNDABOUT).values)
+            from_nodes = self.edges[STD_FROM_NODE].values[roundabout_positions]
+            self._roundabout_rows = {node_id: roundabout_positions[positions] for node_id, positions in
+                                     pd.Series(from_nodes).groupby(from_nodes, sort=False).indices.items()}
+
+        return self._node_rows, self._edge_rows, self._roundabout_rows
+
+    def _node_spatial_index(self) -> (cKDTree, np.ndarray):
+        """
+        KD-tree over the node coordinates, built on first use and rebuilt whenever self.nodes is reassigned. Graphs
+        opened from a compact graph use its node coordinates, rather than loading the nodes GeoDataFrame.
+        :return: The KD-tree and the node ids in the order of its points
+        """
+        if self._node_tree is None and self._nodes is None and self._compact is not None:
+            coordinates = np.asarray(self._compact.coordinates)
+            located = ~np.isnan(coordinates).any(axis=1)
+            self._node_tree = (cKDTree(coordinates[located]), self._compact.node_ids[located].astype(object))
+        elif self._node_tree is None:
+            coordinates = np.column_stack([self._nodes[STD_GEOMETRY].x.values, self._nodes[STD_GEOMETRY].y.values])
+            self._node_tree = (cKDTree(coordinates), self._nodes[STD_NODE_ID].values)
+        return self._node_tree
+
+    def nearest_nodes(self, coords, k: int = 1) -> np.ndarray:
+        """
+        Finds the nearest nodes to each of the given coordinates
+        :param coords: Array-like of x-y coordinates, shape (n, 2), or a single x-y tuple
+        :param k: Number of nearest nodes to return per coordinate
+        :return: Array of node ids, of shape (n,) if k is 1, otherwise of shape (n, k) ordered from closest to
+        furthest. A single x-y tuple returns a single node id (k = 1) or array of node ids.
+        """
+        tree, node_ids = self._node_spatial_index()
+        coords = np.asarray(coords, dtype=np.float64)
+        _, positions = tree.query(coords, k=min(k, len(node_ids)))
+        return node_ids[positions]
+
+    @property
+    def csr(self) -> CsrGraph:
+        """
+        Compiled CSR representation of the networkx graph, built on first use.
+        """
+        if self._csr is None:
+            self.compile_graph()
+        return self._csr
+
+    def compile_graph(self) -> CsrGraph:
+        """
+        (Re)builds the CSR arrays from self.net. Should be called again if nodes or edges are added to or removed
+        from self.net after the graph has been compiled. Until self.net is accessed, graphs constructed from a compact
+        graph use its arrays instead.
+        :return: The compiled graph
+        """
+        closed_pairs = self._closures.closed_pairs() if self._closures else set()
+        if self._net is None and self._compact is not None:
+            self._csr = self._compact.to_csr()
+        else:
+            self._csr = CsrGraph.from_networkx(self.net)
+        self._ch = None
+        self._landmarks = None
+        self._crp = None
+        self._closures = None
+        if self.tree_cache is not None:
+            self.tree_cache.clear()
+        if closed_pairs:
+            self._closures = self.new_closure_mask()
+            for from_node, to_node in closed_pairs:
+                try:
+                    self._closures.close(from_node, to_node)
+                except KeyError:
+                    # The edge no longer exists
+                    pass
+        return self._csr
+
+    @property
+    def closures(self) -> ClosureMask:
+        """
+        Road closures applied by default to every query, as set through set_road_closure and remove_road_closure.
+        """
+        if self._closures is None:
+            self._closures = self.new_closure_mask()
+        return self._closures
+
+    def new_closure_mask(self, node_pairs: list = None) -> ClosureMask:
+        """
+        Creates a closure scenario that is independent of the graph's own closures, to be passed to queries through
+        their closures parameter. Any number of scenarios can be evaluated against the same graph.
+        :param node_pairs: Optional list of node pair tuples, the connecting edges of which (in both directions) are
+        closed
+        :return: The closure mask
+        """
+        closures = ClosureMask(self.csr)
+        for from_node, to_node in node_pairs or []:
+            closures.close(from_node, to_node)
+            closures.close(to_node, from_node)
+        return closures
+
+    def _active_closures(self, closures: ClosureMask = None) -> ClosureMask:
+        """
+        :return: closures if given, otherwise the graph's own closures, or None if no roads are closed
+        """
+        closures = self._closures if closures is None else closures
+        return closures if closures else None
+
+    def enable_tree_cache(self, max_bytes: int = DEFAULT_TREE_CACHE_BYTES,
+                          promote_after: int = 2) -> ShortestPathTreeCache:
+        """
+        Caches full shortest path trees of frequently queried source nodes, such that further point-to-point queries
+        from them (under the same edge weights and road closures) are answered by an array lookup.
+        :param max_bytes: Memory budget of the cached trees, least recently used trees are evicted beyond it
+        :param promote_after: Number of queries from a source (under the same closures) after which its full tree is
+        grown and cached
+        :return: The cache
+        """
+        self.tree_cache = ShortestPathTreeCache(max_bytes=max_bytes, promote_after=promote_after)
+        return self.tree_cache
+
+    def shortest_path_tree(self, source_node: str, closures: ClosureMask = None) -> ShortestPathTree:
+        """
+        Grows the full shortest path tree from source_node, or returns it from the tree cache if enabled.
+        :param source_node: Name of source node
+        :param closures: Optional closure scenario, defaults to the graph's own closures
+        :return: ShortestPathTree spanning every node reachable from source_node
+        """
+        closures = self._active_closures(closures)
+        key = self._tree_key(source_node, closures)
+        tree = self.tree_cache.get(key) if self.tree_cache is not None else None
+        if tree is None:
+            tree = self._grow_tree(key, closures)
+        return tree
+
+    def dynamic_shortest_path_tree(self, source_node: str, closures: ClosureMask = None) -> DynamicShortestPathTree:
+        """
+        Full shortest path tree from source_node that can be repaired for other road closures through
+        repair(closures.flags), which only searches the region affected by the closed and reopened roads.
+        :param source_node: Name of source node
+        :param closures: Closures the tree is grown under, defaults to the graph's own closures
+        :return: DynamicShortestPathTree
+        """
+        closures = self._active_closures(closures)
+        tree = self.shortest_path_tree(source_node, closures)
+        return DynamicShortestPathTree(self.csr, tree, closures.flags if closures is not None else None)
+
+    def _tree_key(self, source_node: str, closures: ClosureMask = None) -> tuple:
+        """
+        :return: Tree cache key of (source index, weights key, closure key)
+        """
+        return self.csr.node_index[source_node], self.csr.weights_key, closures.key() if closures is not None else None
+
+    def _grow_tree(self, key: tuple, closures: ClosureMask = None) -> ShortestPathTree:
+        source = key[0]
+        dist, pred = self.csr.dijkstra(source, closed=closures.flags if closures is not None else None)
+        tree = ShortestPathTree(self.csr, source, dist, pred)
+        if self.tree_cache is not None:
+            self.tree_cache.put(key, tree)
+        return tree
+
+    def _cached_tree(self, source_node: str, closures: ClosureMask = None) -> ShortestPathTree:
+        """
+        Looks up the tree of source_node in the tree cache, growing it if the source has become hot.
+        :return: The tree, or None if it is not (yet) worth growing
+        """
+        key = self._tree_key(source_node, closures)
+        tree = self.tree_cache.get(key)
+        if tree is None and self.tree_cache.hot(key):
+            tree = self._grow_tree(key, closures)
+        return tree
+
+    @property
+    def crp(self) -> CrpOverlay:
+        """
+        Customizable route planning overlay used by the 'crp' algorithm, built on first use.
+        """
+        if self._crp is None:
+            self.build_crp_overlay()
+        return self._crp
+
+    def build_crp_overlay(self, cell_size: int = 256) -> CrpOverlay:
+        """
+        Partitions the graph into cells and customizes the overlay with the edge weights. Queries under road closures
+        only require the cells containing the closed roads to be customized again, which is done automatically.
+        :param cell_size: Maximum number of nodes within each cell
+        :return: The overlay
+        """
+        self._crp = CrpOverlay(self.csr, cell_size=cell_size)
+        return self._crp
+
+    def build_contraction_hierarchy(self, file_path: str = None, witness_limit: int = 500,
+                                    verbose: bool = False) -> ContractionHierarchy:
+        """
+        Builds the contraction hierarchy index used by the 'ch' algorithm, based on the current edge weights.
+        :param file_path: Optional .npz file path to save the index to
+        :param witness_limit: Maximum number of nodes settled per witness search during preprocessing
+        :param verbose: If set to true, prints out the progress of the contraction
+        :return: The contraction hierarchy
+        """
+        ch = ContractionHierarchy.build(self.csr, witness_limit=witness_limit, verbose=verbose)
+        if file_path:
+            ch.save(file_path)
+
+        self._ch = ch
+        return ch
+
+    def load_contraction_hierarchy(self, file_path: str) -> ContractionHierarchy:
+        """
+        Loads a previously saved contraction hierarchy index and attaches it to this graph.
+        :param file_path: Path of the .npz file
+        :return: The contraction hierarchy
+        """
+        ch = ContractionHierarchy.load(file_path)
+        if not ch.is_valid_for(self.csr):
+            raise ValueError(f"The contraction hierarchy at {file_path} was not built from this road graph")
+
+        self._ch = ch
+        return ch
+
+    def _require_contraction_hierarchy(self):
+        """
+        Checks that a contraction hierarchy is attached. It is built from or checked against the compiled graph when
+        attached, and dropped whenever the graph is compiled again. The hierarchy cannot account for road closures,
+        so these need to be checked separately.
+        """
+        if self._ch is None:
+            raise ValueError("No contraction hierarchy available, call build_contraction_hierarchy or "
+                             "load_contraction_hierarchy first")
+
+    def build_landmarks(self, n_landmarks: int = 16, file_path: str = None, verbose: bool = False) -> Landmarks:
+        """
+        Selects landmarks and computes the distances from and to each of them, used by the 'alt' algorithm. Unlike
+        the contraction hierarchy, the landmarks remain usable whilst road closures are set.
+        :param n_landmarks: Number of landmarks
+        :param file_path: Optional .npy file path to save the distances to, which are memory mapped when loaded
+        :param verbose: If set to true, prints out the progress of the selection
+        :return: The landmarks
+        """
+        landmarks = Landmarks.build(self.csr, n_landmarks=n_landmarks, verbose=verbose)
+        if file_path:
+            landmarks.save(file_path)
+
+        self._landmarks = landmarks
+        return landmarks
+
+    def load_landmarks(self, file_path: str) -> Landmarks:
+        """
+        Loads previously saved landmarks, memory mapping their distances, and attaches them to this graph.
+        :param file_path: Path of the .npy file
+        :return: The landmarks
+        """
+        landmarks = Landmarks.load(file_path)
+        if not landmarks.is_valid_for(self.csr):
+            raise ValueError(f"The landmarks at {file_path} were not built from this road graph")
+
+        self._landmarks = landmarks
+        return landmarks
+
+    def _require_landmarks(self):
+        """
+        Checks that landmarks are attached. Like the contraction hierarchy, they are built from or checked against
+        the compiled graph when attached, and dropped whenever the graph is compiled again.
+        """
+        if self._landmarks is None:
+            raise ValueError("No landmarks available, call build_landmarks or load_landmarks first")
 
     def shortest_path_between_key_sites(self, source_site: str, target_site: str, key_sites_gdf: gpd.GeoDataFrame,
-                                        key_site_col_name: str, get_gdfs=False) \
+                                        key_site_col_name: str, get_gdfs=False, algorithm: str = None) \
             -> (gpd.GeoDataFrame, gpd.GeoDataFrame, float):
         """
         Decorator function that calls on shortest_path_between_coords based on specified key sites.
@@ -29,13 +395,14 @@ class StdRoadGraph:
         :param key_site_col_name: The name of the column in key_sites_gdf that contains the name of the sites
         :param get_gdfs: If set to true, this will convert the shortest path into its equivalent nodes and edges
         GeoDataFrame
+        :param algorithm: Shortest path algorithm to use, see shortest_path_between_nodes
         :return: Will either return the shortest path (list)  and shortest distance (float), or shortest path (list),
         shortest distance(float), the edges and nodes GeoDataFrames depending on whether get_gdfs is set to True
         or not.
         """
         source_coord, target_coord = self._get_coordinates(key_site_col_name, key_sites_gdf, source_site, target_site)
 
-        return self.shortest_path_between_coords(source_coord, target_coord, get_gdfs)
+        return self.shortest_path_between_coords(source_coord, target_coord, get_gdfs, algorithm)
 
     def _get_coordinates(self, key_site_col_name: str, key_sites_gdf: gpd.GeoDataFrame,
                          source_site: str, target_site: str) -> tuple:
@@ -53,7 +420,8 @@ class StdRoadGraph:
         target_coord = extract_coord_at_index(geom_obj, 0)
         return source_coord, target_coord
 
-    def shortest_path_between_coords(self, source_coord: tuple, target_coord: tuple, get_gdfs=False) \
+    def shortest_path_between_coords(self, source_coord: tuple, target_coord: tuple, get_gdfs=False,
+                                     algorithm: str = None) \
             -> (gpd.GeoDataFrame, gpd.GeoDataFrame, float):
         """
         Decorator function that calls on shortest_path_between_nodes based on specified coordinates.
@@ -61,12 +429,13 @@ class StdRoadGraph:
         :param target_coord: Tuple coordinates of the target coordinates
         :param get_gdfs: If set to true, this will convert the shortest path into its equivalent nodes and edges
         GeoDataFrame
+        :param algorithm: Shortest path algorithm to use, see shortest_path_between_nodes
         :return: Will either return the shortest path (list)  and shortest distance (float), or shortest path (list),
         shortest distance(float), the edges and nodes GeoDataFrames depending on whether get_gdfs is set to True
         or not.
         """
         nearest_source_node, nearest_target_node = self._get_nearest_node(source_coord, target_coord)
-        return self.shortest_path_between_nodes(nearest_source_node, nearest_target_node, get_gdfs)
+        return self.shortest_path_between_nodes(nearest_source_node, nearest_target_node, get_gdfs, algorithm)
 
     def _get_nearest_node(self, source_coord: tuple, target_coord: tuple) -> tuple:
         """
@@ -75,55 +444,57 @@ class StdRoadGraph:
         :param target_coord: x-y coordinates of target
         :return: Tuple of nearest nodes to source and target
         """
-        nodes_gdf = self.nodes
-        COORDINATES = "coordinates"
-        nodes_gdf[COORDINATES] = nodes_gdf[STD_GEOMETRY].apply(lambda x: extract_coord_at_index(x, 0))
-        source_distances = nodes_gdf[COORDINATES].apply(lambda x: euclidean_distance(x, source_coord))
-        min_index = source_distances.index[source_distances == source_distances.min()].values[0]
-        nearest_source_node = nodes_gdf.loc[min_index][STD_NODE_ID]
-        target_distances = nodes_gdf[COORDINATES].apply(lambda x: euclidean_distance(x, target_coord))
-        min_index = source_distances.index[target_distances == target_distances.min()].values[0]
-        nearest_target_node = nodes_gdf.loc[min_index][STD_NODE_ID]
-        nodes_gdf.drop([COORDINATES], axis=1, inplace=True)
+        nearest_source_node, nearest_target_node = self.nearest_nodes([source_coord, target_coord])
 
         return nearest_source_node, nearest_target_node
 
     def set_road_closure(self, from_node: str, to_node: str):
         """
-        Sets weight of edge between nodes as infinite
+        Closes the edges between the nodes (in both directions), such that they are treated as having an infinite
+        weight. The weights stored in self.net are left untouched.
         :param from_node: Name of first node
         :param to_node: Name of second node
         """
-        self.net[from_node][to_node][STD_Nx_WEIGHT] = np.inf
-        self.net[to_node][from_node][STD_Nx_WEIGHT] = np.inf
+        self.closures.close(from_node, to_node)
+        self.closures.close(to_node, from_node)
 
     def remove_road_closure(self, from_node: str, to_node: str):
         """
-        Set weights of edge back to original time
+        Reopens the edges between the nodes (in both directions), restoring their original weights
         :param from_node: Name of first node
         :param to_node: Name of second node
         """
+        self.closures.reopen(from_node, to_node)
+        self.closures.reopen(to_node, from_node)
 
-        self.net[from_node][to_node][STD_Nx_WEIGHT] = self.net[from_node][to_node] \
-            .get(STD_Nx_ATTR).get(STD_Nx_TIME)
-        self.net[to_node][from_node][STD_Nx_WEIGHT] = self.net[from_node][to_node] \
-            .get(STD_Nx_ATTR).get(STD_Nx_TIME)
+    def is_road_closed(self, from_node: str, to_node: str, closures: ClosureMask = None) -> bool:
+        """
+        :param from_node: Name of first node
+        :param to_node: Name of second node
+        :param closures: Optional closure scenario, defaults to the graph's own closures
+        :return: True if the edge from from_node to to_node is closed
+        """
+        closures = self._active_closures(closures)
+        return closures is not None and closures.is_closed(from_node, to_node)
 
-    def shortest_path_between_nodes(self, source_node: str, target_node: str, get_gdfs=False) \
-            -> (list, float, gpd.GeoDataFrame, gpd.GeoDataFrame):
+    def shortest_path_between_nodes(self, source_node: str, target_node: str, get_gdfs=False, algorithm: str = None,
+                                    closures: ClosureMask = None) -> (list, float, gpd.GeoDataFrame, gpd.GeoDataFrame):
         """
         Finds the shortest path between two pair of nodes.
         :param source_node: Name of source node to start the shortest path algorithm from
         :param target_node: Name of Target node
         :param get_gdfs: If set to true, this will convert the shortest path into its equivalent nodes and edges
         GeoDataFrame
+        :param algorithm: Either 'dijkstra', 'astar' (A* guided by the straight line distance to the target node),
+        'bidirectional' (bidirectional Dijkstra), 'ch' (contraction hierarchy, which falls back to 'dijkstra' whilst
+        road closures are set), 'crp' (customizable route planning overlay, which is kept up to date with road
+        closures) or 'alt' (A* guided by landmark distances, see build_landmarks). Defaults to self.algorithm.
+        :param closures: Optional closure scenario (see new_closure_mask), defaults to the graph's own closures
         :return: Will either return the shortest path (list)  and shortest distance (float), or shortest path (list),
         shortest distance(float), the edges and nodes GeoDataFrames depending on whether get_gdfs is set to True
         or not.
         """
-        dist, paths = self.dijkstra(source=source_node, target=target_node)
-        shortest_path = paths[target_node]
-        shortest_dist = dist[target_node]
+        shortest_path, shortest_dist = self._shortest_path(source_node, target_node, algorithm, closures)
 
         if not get_gdfs:
             return shortest_path, shortest_dist
@@ -132,6 +503,168 @@ class StdRoadGraph:
 
         return shortest_path, shortest_dist, shortest_edges_gdf, shortest_nodes_gdf
 
+    def route_between_nodes(self, source_node: str, target_node: str, algorithm: str = None,
+                            closures: ClosureMask = None) -> RoutePath:
+        """
+        Finds the shortest path between two nodes, returning it as a RoutePath whose GeoDataFrames, coordinates and
+        LineString are only built when accessed.
+        :param source_node: Name of source node
+        :param target_node: Name of target node
+        :param algorithm: Shortest path algorithm to use, see shortest_path_between_nodes
+        :param closures: Optional closure scenario, defaults to the graph's own closures
+        :return: RoutePath of the shortest path
+        """
+        shortest_path, shortest_dist = self._shortest_path(source_node, target_node, algorithm, closures)
+        return RoutePath(self, shortest_path, shortest_dist)
+
+    def _shortest_path(self, source_node: str, target_node: str, algorithm: str = None,
+                       closures: ClosureMask = None) -> (list, float):
+        """
+        Dispatches the shortest path query to the selected algorithm.
+        :param source_node: Name of source node
+        :param target_node: Name of target node
+        :param algorithm: Name of the shortest path algorithm, defaults to self.algorithm
+        :param closures: Optional closure scenario, defaults to the graph's own closures
+        :return: shortest path (list) and shortest distance (float)
+        """
+        algorithm = self.algorithm if algorithm is None else algorithm
+        closures = self._active_closures(closures)
+        closed = closures.flags if closures is not None else None
+
+        if self.tree_cache is not None:
+            tree = self._cached_tree(source_node, closures)
+            if tree is not None:
+                return tree.path_to(target_node), tree.dist[self.csr.node_index[target_node]]
+
+        if algorithm == CONTRACTION_HIERARCHY:
+            self._require_contraction_hierarchy()
+            if closures is not None:
+                algorithm = DIJKSTRA
+        if algorithm == ALT:
+            self._require_landmarks()
+
+        if algorithm in (ASTAR, BIDIRECTIONAL, CONTRACTION_HIERARCHY, CRP, ALT):
+            csr = self.csr
+            source = csr.node_index[source_node]
+            target = csr.node_index[target_node]
+            if algorithm == ASTAR:
+                shortest_dist, path = csr.astar(source, target, closed=closed)
+            elif algorithm == BIDIRECTIONAL:
+                shortest_dist, path = csr.bidirectional_dijkstra(source, target, closed=closed)
+            elif algorithm == CRP:
+                shortest_dist, path = self.crp.query(source, target, closures)
+            elif algorithm == ALT:
+                shortest_dist, path = self._landmarks.query(csr, source, target, closed=closed)
+            else:
+                shortest_dist, path = self._ch.query(source, target)
+
+            # Paths through closed roads are only well defined for Dijkstra's algorithm, which is relied upon
+            # to find the closed road that is blocking the journey.
+            if shortest_dist != np.inf:
+                return csr.node_ids[path].tolist(), shortest_dist
+        elif algorithm != DIJKSTRA:
+            raise ValueError(f"Unknown shortest path algorithm: {algorithm}")
+
+        if self.compiled or algorithm != DIJKSTRA:
+            source = self.csr.node_index[source_node]
+            target = self.csr.node_index[target_node]
+            dist, pred = self.csr.dijkstra(source, target=target, closed=closed)
+            shortest_path = self.csr.path_from_predecessors(pred, source, target)
+            shortest_dist = dist[target]
+        else:
+            closed_edges = closures.closed_pairs() if closures is not None else None
+            dist, predecessors = self.dijkstra(source=source_node, target=target_node, store_paths=False,
+                                               closed_edges=closed_edges)
+            shortest_path = self.path_from_predecessor_map(predecessors, source_node, target_node)
+            shortest_dist = dist[target_node]
+
+        return shortest_path, shortest_dist
+
+    def travel_time_matrix(self, sources: list, targets: list, return_paths: bool = False, algorithm: str = None,
+                           processes: int = None, closures: ClosureMask = None) -> (np.ndarray, list):
+        """
+        Computes the shortest distances between every source and every target node. One search is run per source,
+        stopping as soon as all targets are settled. If the 'ch' algorithm is selected, a contraction hierarchy is
+        available and no road closures are set, distances are instead computed through bucket based many-to-many
+        queries over the hierarchy.
+        :param sources: List of source node names
+        :param targets: List of target node names
+        :param return_paths: If set to true, also returns a ShortestPathTree per source, from which the shortest
+        path to each target can be rebuilt through path_to(target_node)
+        :param algorithm: Shortest path algorithm, defaults to self.algorithm. Algorithms other than 'ch' use the
+        one-to-many Dijkstra search.
+        :param processes: If greater than 1, the one-to-many searches are spread over this many worker processes
+        :param closures: Optional closure scenario, defaults to the graph's own closures
+        :return: Matrix of shortest distances of shape (len(sources), len(targets)), with inf for targets that cannot
+        be reached, and, if return_paths is true, the list of shortest path trees (one per source).
+        """
+        csr = self.csr
+        source_indices = [csr.node_index[node] for node in sources]
+        target_indices = [csr.node_index[node] for node in targets]
+        algorithm = self.algorithm if algorithm is None else algorithm
+        closures = self._active_closures(closures)
+        closed = closures.flags if closures is not None else None
+
+        if algorithm == CONTRACTION_HIERARCHY and not return_paths and closures is None:
+            self._require_contraction_hierarchy()
+            return self._ch.many_to_many(source_indices, target_indices)
+
+        matrix = np.full((len(sources), len(targets)), np.inf)
+        trees = []
+        if processes is not None and processes > 1:
+            with ParallelRouter(csr, processes) as router:
+                results = router.one_to_many(source_indices, target_indices, closures)
+            for i, (source, (target_dist, path_pred)) in enumerate(zip(source_indices, results)):
+                matrix[i] = target_dist
+                trees.append(ShortestPathTree(csr, source, dict(zip(target_indices, target_dist)), path_pred))
+        else:
+            for i, source in enumerate(source_indices):
+                dist, pred = csr.dijkstra(source, targets=target_indices, closed=closed)
+                matrix[i] = dist[target_indices]
+                trees.append(ShortestPathTree(csr, source, dist, pred))
+
+        if return_paths:
+            return matrix, trees
+        return matrix
+
+    def path_segment_indices(self, path: list) -> list:
+        """
+        Returns the indices of the road segments (the STD_INDEX column of self.edges) traversed by path.
+        :param path: List of nodes forming a path
+        :return: List of road segment indices, in order of travel
+        """
+        return [index for i in range(len(path) - 1) for index in self._road_segment_indices(path[i], path[i + 1])]
+
+    def _road_segment_indices(self, from_node: str, to_node: str) -> list:
+        """
+        :return: Indices of the road segments forming the edge from from_node to to_node, read from the compact
+        graph whilst the networkx graph has not been loaded
+        """
+        if self._net is None and self._compact is not None:
+            return self._compact.edge_segment_indices(self.csr.edge_id(from_node, to_node)).tolist()
+        return self.net[from_node][to_node][STD_Nx_ATTR][STD_Nx_ROAD_IND]
+
+    def _edge_attribute(self, from_node: str, to_node: str, attribute: str) -> float:
+        """
+        :param attribute: Either STD_Nx_TIME or STD_Nx_LENGTH
+        :return: Time or length of the edge from from_node to to_node, read from the compact graph whilst the
+        networkx graph has not been loaded
+        """
+        if self._net is None and self._compact is not None:
+            values = {STD_Nx_TIME: self._compact.times, STD_Nx_LENGTH: self._compact.lengths}[attribute]
+            return float(values[self.csr.edge_id(from_node, to_node)])
+        return self.net[from_node][to_node][STD_Nx_ATTR][attribute]
+
+    def _node_xy(self, node_id: str) -> (float, float):
+        """
+        :return: x-y coordinates of node_id, read from the compact graph whilst the networkx graph has not been loaded
+        """
+        if self._net is None and self._compact is not None:
+            x, y = self._compact.coordinates[self.csr.node_index[node_id]]
+            return float(x), float(y)
+        point = self.net.nodes[node_id]['coordinates']
+        return point.x, point.y
+
     def convert_path_to_gdfs(self, shortest_path: list) -> tuple:
         """
         Builds the corresponding nodes and edges gdfs based on the list of nodes within the shortest_path list.
@@ -139,20 +672,21 @@ class StdRoadGraph:
         :param shortest_path: List of nodes forming the shortest path
         :return: Tuple of nodes and edges gdf corresponding to the shortest path.
         """
-        n = len(shortest_path) - 1
-        graph = self.net
-        edges_gdf = self.edges
-        nodes_gdf = self.nodes
-        shortest_edges_gdf = gpd.GeoDataFrame()
-        shortest_nodes_gdf = gpd.GeoDataFrame()
-
-        for i in range(n):
-            indices = (graph[shortest_path[i]][shortest_path[i + 1]]).get(STD_Nx_ATTR).get(STD_Nx_ROAD_IND)
-            shortest_edges_gdf = pd.concat([shortest_edges_gdf, edges_gdf.loc[edges_gdf[STD_INDEX].isin(indices), :]])
-            shortest_nodes_gdf = pd.concat(
-                [shortest_nodes_gdf, nodes_gdf.loc[nodes_gdf[STD_NODE_ID] == shortest_path[i]]])
-            shortest_nodes_gdf = pd.concat(
-                [shortest_nodes_gdf, nodes_gdf.loc[nodes_gdf[STD_NODE_ID] == shortest_path[i + 1]]])
+        node_rows, edge_rows, _ = self._row_maps()
+        no_rows = np.empty(0, dtype=np.int64)
+        edge_positions = [no_rows]
+        node_positions = [no_rows]
+
+        for i in range(len(shortest_path) - 1):
+            indices = self._road_segment_indices(shortest_path[i], shortest_path[i + 1])
+            hop_positions = [edge_rows[index] for index in set(indices) if index in edge_rows]
+            if hop_positions:
+                edge_positions.append(np.unique(np.concatenate(hop_positions)))
+            node_positions.append(node_rows.get(shortest_path[i], no_rows))
+            node_positions.append(node_rows.get(shortest_path[i + 1], no_rows))
+
+        shortest_edges_gdf = self.edges.iloc[np.concatenate(edge_positions)]
+        shortest_nodes_gdf = self.nodes.iloc[np.concatenate(node_positions)]
 
         shortest_edges_gdf = self._add_roundabout_line_segments(shortest_nodes_gdf, shortest_edges_gdf)
         return shortest_edges_gdf, shortest_nodes_gdf
@@ -165,44 +699,124 @@ class StdRoadGraph:
         :param shortest_edges_gdf: Geo-Dataframe of edges forming the shortest path.
         :return: Updated shortest path gdf with roundabout line segments included.
         """
-        roundabout_nodes = shortest_nodes_gdf.loc[shortest_nodes_gdf[STD_N_TYPE] == STD_N_ROUNDABOUT]
-        roundabout_edges = self.edges.loc[self.edges[STD_ROAD_TYPE] == STD_ROUNDABOUT]
+        _, _, roundabout_rows = self._row_maps()
+        roundabout_nodes = shortest_nodes_gdf.loc[shortest_nodes_gdf[STD_N_TYPE] == STD_N_ROUNDABOUT, STD_NODE_ID]
+        roundabout_positions = [roundabout_rows[node_id] for node_id in roundabout_nodes if node_id in roundabout_rows]
 
-        for _, roundabout_node in roundabout_nodes.iterrows():
-            node_id = roundabout_node[STD_NODE_ID]
-            sel_roundabout_segments = roundabout_edges.loc[roundabout_edges[STD_FROM_NODE] == node_id]
-            shortest_edges_gdf = pd.concat([shortest_edges_gdf, sel_roundabout_segments])
+        if not roundabout_positions:
+            return shortest_edges_gdf
 
-        return shortest_edges_gdf
+        return pd.concat([shortest_edges_gdf, self.edges.iloc[np.concatenate(roundabout_positions)]])
 
     def k_shortest_paths_from_key_sites(self, key_sites_gdf: gpd.GeoDataFrame, key_site_col_name: str,
                                         source: str, target: str, k: int):
         """
-        Returns k list of nodes that form the shortest path from source to target
+        Returns the k shortest paths, and their times, from source to target
         :param key_sites_gdf: Key sites geo data frame
         :param key_site_col_name: Name of column containing key sites
         :param source: Name of source site
         :param target: Name of target site
         :param k: Number of shortest paths to extract
-        :return: a generator: k list of nodes forming the k shortest paths
+        :return: List of up to k (path, time) tuples, see k_shortest_paths_from_nodes
         """
         source_coord, target_coord = self._get_coordinates(key_site_col_name, key_sites_gdf, source, target)
         source_node, target_node = self._get_nearest_node(source_coord, target_coord)
 
         return self.k_shortest_paths_from_nodes(source_node, target_node, k)
 
-    def k_shortest_paths_from_nodes(self, source_node: str, target_node: str, k: int) -> list:
+    def k_shortest_paths_from_nodes(self, source_node: str, target_node: str, k: int,
+                                    closures: ClosureMask = None) -> list:
         """
-        Generator function that returns the k shortest paths from source to target.
+        Returns the k shortest loopless paths from source to target (Yen's algorithm over the compiled graph).
 
         :param source_node: Name of the source node
         :param target_node: Name of the target node
         :param k: Number of paths to extract
-        :return: List of k-shortest paths.
+        :param closures: Optional closure scenario, defaults to the graph's own closures
+        :return: List of up to k (path, time) tuples in order of increasing time, where path is the list of nodes
+        forming the path.
         """
-        return list(islice(nx.shortest_simple_paths(self.net, source_node, target_node, weight=STD_Nx_WEIGHT), k))
+        csr = self.csr
+        closures = self._active_closures(closures)
+        k_shortest_paths = KShortestPaths(csr, csr.node_index[target_node],
+                                          closures.flags if closures is not None else None)
+        return [(csr.node_ids[path].tolist(), time)
+                for time, path in k_shortest_paths.paths(csr.node_index[source_node], k)]
+
+    def alternative_routes_from_key_sites(self, key_sites_gdf: gpd.GeoDataFrame, key_site_col_name: str,
+                                          source: str, target: str, k: int, max_stretch: float = 0.25,
+                                          max_overlap: float = 0.5) -> list:
+        """
+        Returns up to k diverse routes from source to target, see alternative_routes_from_nodes
+        :param key_sites_gdf: Key sites geo data frame
+        :param key_site_col_name: Name of column containing key sites
+        :param source: Name of source site
+        :param target: Name of target site
+        :param k: Maximum number of routes, including the shortest path
+        :param max_stretch: Maximum relative increase in time of an alternative over the shortest path
+        :param max_overlap: Maximum share of an alternative's length that may overlap any previously chosen route
+        :return: List of up to k (path, time) tuples
+        """
+        source_coord, target_coord = self._get_coordinates(key_site_col_name, key_sites_gdf, source, target)
+        source_node, target_node = self._get_nearest_node(source_coord, target_coord)
+
+        return self.alternative_routes_from_nodes(source_node, target_node, k, max_stretch, max_overlap)
+
+    def alternative_routes_from_nodes(self, source_node: str, target_node: str, k: int, max_stretch: float = 0.25,
+                                      max_overlap: float = 0.5, closures: ClosureMask = None) -> list:
+        """
+        Returns up to k diverse routes from source to target through the plateau method, which needs only one
+        forward and one backward search. The shortest path is always returned first. Alternatives are then accepted
+        in order of plateau length, provided their time is within (1 + max_stretch) times the shortest time, and
+        that the length of road segments they share with each route already accepted is at most max_overlap of
+        their own length. A route is never returned twice, whatever max_overlap is.
 
-    def dijkstra(self, source, pred=None, cutoff=None, target=None):
+        :param source_node: Name of the source node
+        :param target_node: Name of the target node
+        :param k: Maximum number of routes, including the shortest path
+        :param max_stretch: Maximum relative increase in time of an alternative over the shortest path
+        :param max_overlap: Maximum share of an alternative's length that may overlap any previously chosen route
+        :param closures: Optional closure scenario, defaults to the graph's own closures
+        :return: List of up to k (path, time) tuples, where path is the list of nodes forming the route
+        """
+        csr = self.csr
+        source = csr.node_index[source_node]
+        target = csr.node_index[target_node]
+        if k <= 0:
+            return []
+        if source == target:
+            return [([source_node], 0.0)]
+
+        _, edge_rows, _ = self._row_maps()
+        segment_lengths = self.edges[STD_LENGTH].values
+
+        def segment_length_map(path: list) -> dict:
+            segments = set(self.path_segment_indices(path))
+            return {index: segment_lengths[edge_rows[index][0]] for index in segments if index in edge_rows}
+
+        closures = self._active_closures(closures)
+        plateaus = PlateauAlternatives(csr, source, target, closures.flags if closures is not None else None)
+        shortest_path = csr.node_ids[plateaus.via_path(source, source)].tolist()
+        routes = [(shortest_path, plateaus.shortest_distance)]
+        route_segments = [segment_length_map(shortest_path)]
+
+        for time, path in plateaus.candidates(max_stretch):
+            if len(routes) >= k:
+                break
+            path = csr.node_ids[path].tolist()
+            if any(path == route for route, _ in routes):
+                continue
+            segments = segment_length_map(path)
+            length = sum(segments.values())
+            overlaps = [sum(segments[index] for index in segments.keys() & chosen.keys()) for chosen in route_segments]
+            if length <= 0 or max(overlaps) > max_overlap * length:
+                continue
+            routes.append((path, time))
+            route_segments.append(segments)
+
+        return routes
+
+    def dijkstra(self, source, pred=None, cutoff=None, target=None, store_paths=True, closed_edges=None):
         """Implementation of Dijkstra's algorithm
         Original Authors:
        Aric Hagberg <hagberg@lanl.gov>
@@ -231,6 +845,14 @@ class StdRoadGraph:
         cutoff : integer or float, optional
            Depth to stop the search. Only paths of length <= cutoff are returned.
 
+        store_paths : bool, optional (default=True)
+           If True, the full path to every reached node is built during the search. If False, only a single
+           predecessor per node is recorded, and paths are rebuilt on demand through path_from_predecessor_map.
+           The latter avoids copying the path list on every relaxation.
+
+        closed_edges : set, optional (default=None)
+           Set of (from node, to node) tuples of closed edges, which are given an infinite weight.
+
         Returns
         -------
         distance,path : dictionaries
@@ -242,13 +864,19 @@ class StdRoadGraph:
            Returns two dictionaries representing a list of predecessors
            of a node and the distance to each node.
 
-        distance : dictionary
-           Dictionary of shortest lengths keyed by target.
+        distance,predecessors : dictionaries
+           Returned when store_paths is False and pred is None. The first dictionary stores distance from the
+           source. The second stores the node preceding each node on its shortest path.
         """
         G = self.net
         G_succ = G.succ if G.is_directed() else G.adj
-        get_weight = lambda u, v, data: data.get(STD_Nx_WEIGHT)
-        paths = {source: [source]}
+        if closed_edges:
+            get_weight = lambda u, v, data: np.inf if (u, v) in closed_edges and data.get(STD_Nx_WEIGHT) is not None \
+                else data.get(STD_Nx_WEIGHT)
+        else:
+            get_weight = lambda u, v, data: data.get(STD_Nx_WEIGHT)
+        paths = {source: [source]} if store_paths else None
+        predecessors = {}
 
         push = heappush
         pop = heappop
@@ -282,6 +910,8 @@ class StdRoadGraph:
                     push(fringe, (vu_dist, next(c), u))
                     if paths is not None:
                         paths[u] = paths[v] + [u]
+                    else:
+                        predecessors[u] = v
                     if pred is not None:
                         pred[u] = [v]
                 elif vu_dist == seen[u]:
@@ -292,7 +922,51 @@ class StdRoadGraph:
             return (dist, paths)
         if pred is not None:
             return (pred, dist)
-        return dist
+        return (dist, predecessors)
+
+    @staticmethod
+    def path_from_predecessor_map(predecessors: dict, source_node: str, target_node: str) -> list:
+        """
+        Rebuilds the path from source_node to target_node based on the predecessor map returned by dijkstra when
+        store_paths is set to False.
+        :param predecessors: Dictionary of the node preceding each reached node
+        :param source_node: Name of the source node
+        :param target_node: Name of the target node
+        :return: List of nodes forming the path from source_node to target_node
+        """
+        if target_node != source_node and target_node not in predecessors:
+            raise KeyError(target_node)
+
+        path = [target_node]
+        while path[-1] != source_node:
+            path.append(predecessors[path[-1]])
+
+        return path[::-1]
+
+    def compiled_dijkstra(self, source_node: str, target_node: str = None, cutoff: float = None) -> tuple:
+        """
+        Runs Dijkstra's algorithm over the compiled CSR arrays rather than the networkx graph. Paths are not built
+        during the search; use path_from_predecessors to rebuild the path to any node that is needed.
+        :param source_node: Name of the source node
+        :param target_node: Optional name of the target node, the search stops once it is settled
+        :param cutoff: Optional maximum distance to search up to
+        :return: Arrays of distances and predecessors, indexed by the integer node indices of self.csr
+        """
+        csr = self.csr
+        target = None if target_node is None else csr.node_index[target_node]
+        return csr.dijkstra(csr.node_index[source_node], target=target, cutoff=cutoff)
+
+    def path_from_predecessors(self, pred: np.ndarray, source_node: str, target_node: str) -> list:
+        """
+        Rebuilds the list of nodes from source_node to target_node based on the predecessor array returned by
+        compiled_dijkstra.
+        :param pred: Predecessor array
+        :param source_node: Name of the source node
+        :param target_node: Name of the target node
+        :return: List of nodes forming the path
+        """
+        csr = self.csr
+        return csr.path_from_predecessors(pred, csr.node_index[source_node], csr.node_index[target_node])
 
     def average_degree(self, type: str = 'out') -> float:
         """
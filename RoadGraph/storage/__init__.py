@@ -0,0 +1,2 @@
+from RoadGraph.storage.compactgraph import CompactGraph
+from RoadGraph.storage.gdfstorage import GdfStorage, ShapefileStorage, GeoParquetStorage, FeatherStorage
@@ -0,0 +1,234 @@
+import json
+import os
+import pickle
+import numpy as np
+import networkx as nx
+from shapely.geometry import Point
+from RoadGraph.constants.StdColNames import *
+from RoadGraph.routing.csrgraph import CsrGraph
+
+COMPACT_FORMAT = 'roadgraph-compact'
+COMPACT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+
+CG_NODE_IDS = 'node_ids'
+CG_COORDINATES = 'coordinates'
+CG_INDPTR = 'indptr'
+CG_INDICES = 'indices'
+CG_WEIGHTS = 'weights'
+CG_LENGTHS = 'lengths'
+CG_TIMES = 'times'
+CG_IS_SRN = 'is_srn'
+CG_ROAD_IDS = 'road_ids'
+CG_SEGMENT_OFFSETS = 'segment_offsets'
+CG_SEGMENT_INDICES = 'segment_indices'
+CG_ARRAYS = (CG_NODE_IDS, CG_COORDINATES, CG_INDPTR, CG_INDICES, CG_WEIGHTS, CG_LENGTHS, CG_TIMES, CG_IS_SRN,
+             CG_ROAD_IDS, CG_SEGMENT_OFFSETS, CG_SEGMENT_INDICES)
+
+
+class CompactGraph:
+    """
+    Array backed form of the road graph, saved as a versioned directory of .npy files (one per array) described by
+    a manifest.json. Unlike the pickled networkx.DiGraph, the arrays can be memory mapped, so that loading a graph
+    only reads the pages that are actually used.
+
+    Nodes are stored in the order of the networkx graph, with their coordinates. Edges are stored in CSR order
+    (see CsrGraph), each with its weight, length, time, SRN flag and road ID. The road segment indices of all edges
+    are flattened into a single array, those of edge e being segment_indices[segment_offsets[e]:
+    segment_offsets[e + 1]].
+    """
+
+    def __init__(self, node_ids: np.ndarray, coordinates: np.ndarray, indptr: np.ndarray, indices: np.ndarray,
+                 weights: np.ndarray, lengths: np.ndarray, times: np.ndarray, is_srn: np.ndarray, road_ids: np.ndarray,
+                 segment_offsets: np.ndarray, segment_indices: np.ndarray, weight_type: str = None):
+        self.node_ids = node_ids
+        self.coordinates = coordinates
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.lengths = lengths
+        self.times = times
+        self.is_srn = is_srn
+        self.road_ids = road_ids
+        self.segment_offsets = segment_offsets
+        self.segment_indices = segment_indices
+        self.weight_type = weight_type
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.indices)
+
+    @classmethod
+    def from_networkx(cls, net: nx.DiGraph, weight_type: str = None):
+        """
+        Flattens a road graph as built by StdRoadGraphBuilder.create_graph. Edges without an attr dictionary are
+        stored with NaN length and time, no road segments and an empty road ID.
+        :param net: Networkx DiGraph of the road network
+        :param weight_type: Type of weight of the edges, either 'Time' or 'Length'. Inferred from the weights if not
+        given.
+        :return: CompactGraph of net
+        """
+        node_list = list(net.nodes)
+        node_index = {node_id: i for i, node_id in enumerate(node_list)}
+
+        coordinates = np.full((len(node_list), 2), np.nan, dtype=np.float64)
+        for i, node_id in enumerate(node_list):
+            point = net.nodes[node_id].get('coordinates')
+            if point is not None:
+                coordinates[i] = point.coords[0][0:2]
+
+        indptr = np.zeros(len(node_list) + 1, dtype=np.int64)
+        indices, weights, lengths, times, is_srn, road_ids = [], [], [], [], [], []
+        segment_counts, segment_indices = [], []
+        for i, node_id in enumerate(node_list):
+            for neighbour, data in net.succ[node_id].items():
+                indices.append(node_index[neighbour])
+                weight = data.get(STD_Nx_WEIGHT)
+                weights.append(np.nan if weight is None else weight)
+
+                attr = data.get(STD_Nx_ATTR, {})
+                lengths.append(attr.get(STD_Nx_LENGTH, np.nan))
+                times.append(attr.get(STD_Nx_TIME, np.nan))
+                is_srn.append(bool(attr.get(STD_Nx_IS_SRN, False)))
+                road_ids.append(attr.get(STD_Nx_ROAD_ID, ''))
+                segments = attr.get(STD_Nx_ROAD_IND, [])
+                segment_counts.append(len(segments))
+                segment_indices.extend(segments)
+            indptr[i + 1] = len(indices)
+
+        segment_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(segment_counts, out=segment_offsets[1:])
+
+        compact = cls(np.array(node_list, dtype=str), coordinates, indptr, np.array(indices, dtype=np.int64),
+                      np.array(weights, dtype=np.float64), np.array(lengths, dtype=np.float64),
+                      np.array(times, dtype=np.float64), np.array(is_srn, dtype=bool), np.array(road_ids, dtype=str),
+                      segment_offsets, np.array(segment_indices, dtype=np.int64), weight_type)
+        if compact.weight_type is None:
+            compact.weight_type = compact._infer_weight_type()
+        return compact
+
+    def _infer_weight_type(self) -> str:
+        if np.array_equal(self.weights, self.times, equal_nan=True):
+            return 'Time'
+        if np.array_equal(self.weights, self.lengths, equal_nan=True):
+            return 'Length'
+        return None
+
+    @classmethod
+    def convert_pickle(cls, pickle_path: str, directory: str = None):
+        """
+        Converts a pickled networkx graph (such as roadGraph.pickle) into the compact format
+        :param pickle_path: Path of the pickled graph
+        :param directory: Optional directory to save the compact graph to
+        :return: CompactGraph of the pickled graph
+        """
+        with open(pickle_path, 'rb') as target:
+            net = pickle.load(target)
+
+        compact = cls.from_networkx(net)
+        if directory:
+            compact.save(directory)
+        return compact
+
+    def save(self, directory: str):
+        """
+        Saves every array as a .npy file within directory, along with the manifest.json describing them
+        :param directory: Target directory, created if it does not exist
+        """
+        os.makedirs(directory, exist_ok=True)
+        arrays = {}
+        for name in CG_ARRAYS:
+            array = np.ascontiguousarray(getattr(self, name))
+            np.save(os.path.join(directory, name + '.npy'), array)
+            arrays[name] = {'dtype': array.dtype.str, 'shape': list(array.shape)}
+
+        manifest = {'format': COMPACT_FORMAT, 'version': COMPACT_VERSION, 'n_nodes': self.n_nodes,
+                    'n_edges': self.n_edges, 'weight_type': self.weight_type, 'arrays': arrays}
+        with open(os.path.join(directory, MANIFEST_FILE), 'w') as target:
+            json.dump(manifest, target, indent=2)
+
+    @staticmethod
+    def read_manifest(directory: str) -> dict:
+        """
+        :param directory: Directory of a compact graph
+        :return: The manifest, after checking that it describes a supported version of the format
+        """
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        if not os.path.isfile(manifest_path):
+            raise FileNotFoundError(f"No compact graph found in {directory}, {MANIFEST_FILE} is missing")
+
+        with open(manifest_path) as source:
+            manifest = json.load(source)
+
+        if manifest.get('format') != COMPACT_FORMAT:
+            raise ValueError(f"{manifest_path} does not describe a compact road graph")
+        if manifest.get('version') != COMPACT_VERSION:
+            raise ValueError(f"Compact graph version {manifest.get('version')} is not supported, expected "
+                             f"version {COMPACT_VERSION}")
+        return manifest
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: str = 'r'):
+        """
+        Loads a compact graph previously saved through save
+        :param directory: Directory of the compact graph
+        :param mmap_mode: Memory map mode passed to np.load, None reads the arrays into memory instead
+        :return: CompactGraph object
+        """
+        manifest = cls.read_manifest(directory)
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode) for name in CG_ARRAYS}
+        for name, array in arrays.items():
+            if list(array.shape) != manifest['arrays'][name]['shape']:
+                raise ValueError(f"Array {name} of the compact graph in {directory} does not match its manifest")
+
+        return cls(**arrays, weight_type=manifest.get('weight_type'))
+
+    def edge_segment_indices(self, edge: int) -> np.ndarray:
+        """
+        :param edge: Edge ID
+        :return: Indices of the road segments forming the edge
+        """
+        return self.segment_indices[self.segment_offsets[edge]:self.segment_offsets[edge + 1]]
+
+    def to_csr(self) -> CsrGraph:
+        """
+        :return: CsrGraph sharing the topology, weight and coordinate arrays of this graph. If they are memory
+        mapped, the graph is searched over them directly (see CsrGraph)
+        """
+        return CsrGraph(self.node_ids, self.indptr, self.indices, self.weights, self.coordinates,
+                        shared=isinstance(self.indptr, np.memmap))
+
+    def to_networkx(self) -> nx.DiGraph:
+        """
+        Rebuilds the networkx graph, keeping the order of the nodes and of the successors of every node
+        :return: Networkx DiGraph of the road network
+        """
+        node_ids = self.node_ids.tolist()
+        coordinates = np.asarray(self.coordinates)
+        has_coordinates = ~np.isnan(coordinates).any(axis=1)
+
+        net = nx.DiGraph()
+        net.add_nodes_from((node_id, {'coordinates': Point(x, y)} if valid else {})
+                           for node_id, (x, y), valid in zip(node_ids, coordinates.tolist(), has_coordinates.tolist()))
+
+        tails = np.repeat(np.arange(self.n_nodes, dtype=np.int64), np.diff(self.indptr)).tolist()
+        offsets = np.asarray(self.segment_offsets).tolist()
+        segment_indices = np.asarray(self.segment_indices).tolist()
+        edges = []
+        for e, (u, v, weight, length, time, is_srn, road_id) in enumerate(zip(
+                tails, np.asarray(self.indices).tolist(), np.asarray(self.weights).tolist(),
+                np.asarray(self.lengths).tolist(), np.asarray(self.times).tolist(), np.asarray(self.is_srn).tolist(),
+                self.road_ids.tolist())):
+            attr = {STD_Nx_ROAD_ID: road_id, STD_Nx_LENGTH: length, STD_Nx_TIME: time,
+                    STD_Nx_ROAD_IND: segment_indices[offsets[e]:offsets[e + 1]], STD_Nx_IS_SRN: is_srn}
+            data = {STD_Nx_ATTR: attr}
+            if weight == weight:
+                data[STD_Nx_WEIGHT] = weight
+            edges.append((node_ids[u], node_ids[v], data))
+        net.add_edges_from(edges)
+
+        return net
@@ -0,0 +1,149 @@
+import os
+from abc import ABC, abstractmethod
+import geopandas as gpd
+from RoadGraph.constants.StdColNames import *
+
+SHAPEFILE = 'shp'
+GEOPARQUET = 'parquet'
+FEATHER = 'feather'
+
+
+class GdfStorage(ABC):
+    """
+    Backend through which the pipeline stages save and read the edges and nodes GeoDataFrames. Files are named
+    <name><extension> within a directory, so that each stage can find the outputs of the previous one regardless of
+    the backend used.
+
+    Reads may be pruned to the columns a stage needs. The geometry column is always read.
+    """
+    extension = None
+
+    def file_path(self, directory: str, name: str) -> str:
+        """
+        :param directory: Directory of the file
+        :param name: Name of the file without extension, e.g. 'edges'
+        :return: Path of the file within directory
+        """
+        return f"{directory}/{name}{self.extension}"
+
+    def list_files(self, directory: str) -> list:
+        """
+        :param directory: Directory to search
+        :return: Sorted names of the files of this backend within directory
+        """
+        return sorted(x for x in os.listdir(directory) if x.endswith(self.extension))
+
+    def exists(self, directory: str, name: str) -> bool:
+        return os.path.isfile(self.file_path(directory, name))
+
+    def read(self, file_path: str, columns: list = None) -> gpd.GeoDataFrame:
+        """
+        :param file_path: Path of the file
+        :param columns: Optional list of the columns to read, all columns are read if not given
+        :return: GeoDataFrame saved at file_path
+        """
+        if columns is not None:
+            columns = [column for column in columns if column != STD_GEOMETRY]
+        return self._read(file_path, columns)
+
+    @abstractmethod
+    def _read(self, file_path: str, columns: list = None) -> gpd.GeoDataFrame:
+        """
+        :param columns: Columns to read other than the geometry, or None for all columns
+        """
+        pass
+
+    @abstractmethod
+    def write(self, gdf: gpd.GeoDataFrame, file_path: str):
+        """
+        :param gdf: GeoDataFrame to save
+        :param file_path: Path of the file
+        """
+        pass
+
+
+class ShapefileStorage(GdfStorage):
+    """
+    ESRI shapefiles. Column names are truncated to 10 characters and list columns cannot be saved.
+    """
+    extension = '.shp'
+
+    def _read(self, file_path: str, columns: list = None) -> gpd.GeoDataFrame:
+        if columns is None:
+            return gpd.read_file(file_path)
+        return gpd.read_file(file_path, include_fields=columns)
+
+    def write(self, gdf: gpd.GeoDataFrame, file_path: str):
+        gdf.to_file(file_path)
+
+
+class GeoParquetStorage(GdfStorage):
+    """
+    GeoParquet files, with the geometries encoded as WKB. Requires pyarrow.
+    """
+    extension = '.parquet'
+
+    def _read(self, file_path: str, columns: list = None) -> gpd.GeoDataFrame:
+        if columns is None:
+            return gpd.read_parquet(file_path)
+        return gpd.read_parquet(file_path, columns=columns + [STD_GEOMETRY])
+
+    def write(self, gdf: gpd.GeoDataFrame, file_path: str):
+        gdf.to_parquet(file_path, index=False)
+
+
+class FeatherStorage(GdfStorage):
+    """
+    Feather (Arrow IPC) files, with the geometries encoded as WKB. Faster to read and write than GeoParquet, but
+    larger on disk. Requires pyarrow.
+    """
+    extension = '.feather'
+
+    def _read(self, file_path: str, columns: list = None) -> gpd.GeoDataFrame:
+        if columns is None:
+            return gpd.read_feather(file_path)
+        return gpd.read_feather(file_path, columns=columns + [STD_GEOMETRY])
+
+    def write(self, gdf: gpd.GeoDataFrame, file_path: str):
+        gdf.to_feather(file_path, index=False)
+
+
+STORAGE_BACKENDS = {SHAPEFILE: ShapefileStorage, GEOPARQUET: GeoParquetStorage, FEATHER: FeatherStorage}
+
+
+def get_storage(storage=SHAPEFILE) -> GdfStorage:
+    """
+    :param storage: Either a GdfStorage object or the name of a backend: 'shp', 'parquet' or 'feather'
+    :return: GdfStorage object
+    """
+    if isinstance(storage, GdfStorage):
+        return storage
+    if storage not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend {storage}, expected one of {list(STORAGE_BACKENDS)}")
+    return STORAGE_BACKENDS[storage]()
+
+
+def read_gdf(file_path: str, columns: list = None) -> gpd.GeoDataFrame:
+    """
+    Reads a GeoDataFrame through the backend matching the extension of file_path. Files of any other extension are
+    read through geopandas.read_file.
+    :param file_path: Path of the file
+    :param columns: Optional list of the columns to read
+    :return: GeoDataFrame saved at file_path
+    """
+    for backend in STORAGE_BACKENDS.values():
+        if file_path.endswith(backend.extension):
+            return backend().read(file_path, columns)
+    return ShapefileStorage().read(file_path, columns)
+
+
+def find_gdf(directory: str, name: str) -> str:
+    """
+    :param directory: Directory to search
+    :param name: Name of the file without extension, e.g. 'edges'
+    :return: Path of the file saved within directory by any backend, or the path of its shapefile if none exists
+    """
+    for backend in (FeatherStorage, GeoParquetStorage, ShapefileStorage):
+        if backend().exists(directory, name):
+            return backend().file_path(directory, name)
+    return ShapefileStorage().file_path(directory, name)
@@ -5,6 +5,7 @@ from RoadGraph.constants import *
 import geopandas as gpd
 from scipy.spatial import cKDTree
 from RoadGraph.util import extract_list_of_coords_from_geom_object
+from RoadGraph.storage.gdfstorage import read_gdf
 from pylab import *
 import datetime
 from src.utilities.aux_func import loadNetworkResults
@@ -262,8 +263,8 @@ def evaluate_shortest_path_grouped(directories: fd.ParentDirectories, criteria=3
         main_out_path = directories.out_path_criteria3
 
     net = loadNetworkResults(netx_path)
-    edges = gpd.read_file(directories.edges_path)
-    nodes = gpd.read_file(directories.nodes_path)
+    edges = read_gdf(directories.edges_path)
+    nodes = read_gdf(directories.nodes_path)
     key_sites = gpd.read_file(directories.key_sites_path)
     roadGraph = RoadGraph.StdRoadGraph(net, nodes, edges)
 
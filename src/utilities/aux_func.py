@@ -18,11 +18,16 @@ def parent_directory_at_level(current_path: str, level: int):
 
 def loadNetworkResults(file_name: str):
     """
-    Loads the binary pickle data from file_name
+    Loads the binary pickle data from file_name. If file_name is the directory of a compact graph (see
+    RoadGraph.storage.CompactGraph), the networkx graph is rebuilt from it instead.
 
-    :param file_name: Full path of pickle binary path
+    :param file_name: Full path of pickle binary path, or of a compact graph directory
     :return: object loaded from pickle binary file.
     """
+    if isdir(file_name):
+        from RoadGraph.storage import CompactGraph
+        return CompactGraph.load(file_name).to_networkx()
+
     with open(file_name, 'rb') as target:
         network_results = pickle.load(target)
     return network_results
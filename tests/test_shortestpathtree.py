@@ -0,0 +1,48 @@
+import math
+import networkx as nx
+import pytest
+from shapely.geometry import Point
+from RoadGraph import StdRoadGraph
+from RoadGraph.constants.StdColNames import STD_Nx_WEIGHT
+
+
+def grid_road_graph(n: int = 5) -> StdRoadGraph:
+    """
+    n by n grid of two way roads of weight 1, nodes named 'x_y'
+    """
+    net = nx.DiGraph()
+    for x in range(n):
+        for y in range(n):
+            net.add_node(f"{x}_{y}", coordinates=Point(x, y))
+    for x in range(n):
+        for y in range(n):
+            for dx, dy in ((1, 0), (0, 1)):
+                if x + dx < n and y + dy < n:
+                    net.add_edge(f"{x}_{y}", f"{x + dx}_{y + dy}", **{STD_Nx_WEIGHT: 1.0})
+                    net.add_edge(f"{x + dx}_{y + dy}", f"{x}_{y}", **{STD_Nx_WEIGHT: 1.0})
+    return StdRoadGraph(net, None, None, compiled=True)
+
+
+def test_parallel_trees_match_serial_trees_for_targets():
+    road_graph = grid_road_graph()
+    sources, targets = ['0_0', '4_4'], ['2_2', '4_0']
+
+    serial, serial_trees = road_graph.travel_time_matrix(sources, targets, return_paths=True)
+    parallel, parallel_trees = road_graph.travel_time_matrix(sources, targets, return_paths=True, processes=2)
+
+    assert (serial == parallel).all()
+    for serial_tree, parallel_tree in zip(serial_trees, parallel_trees):
+        for target in targets:
+            assert parallel_tree.distance_to(target) == serial_tree.distance_to(target)
+            assert parallel_tree.path_to(target) == serial_tree.path_to(target)
+
+
+def test_parallel_trees_treat_other_nodes_as_not_settled():
+    road_graph = grid_road_graph()
+    _, trees = road_graph.travel_time_matrix(['0_0'], ['1_0'], return_paths=True, processes=2)
+
+    assert trees[0].distance_to('0_0') == 0.0
+    assert trees[0].path_to('0_0') == ['0_0']
+    assert math.isinf(trees[0].distance_to('4_4'))
+    with pytest.raises(KeyError):
+        trees[0].path_to('4_4')